@@ -53,6 +53,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "sales_data.middleware.PrimaryPinningMiddleware",
 ]
 
 ROOT_URLCONF = "ecommerce_dashboard.urls"
@@ -79,23 +80,60 @@ WSGI_APPLICATION = "ecommerce_dashboard.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-# DATABASES = {
-#     "default": {
-#         "ENGINE": "django.db.backends.sqlite3",
-#         "NAME": BASE_DIR / "db.sqlite3",
-#     }
-# }
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'ecommerce_db',
-        'USER': 'postgres',
-        'PASSWORD': 'postgres',
-        'HOST': 'fihub.cnc88m2e2gfl.eu-north-1.rds.amazonaws.com',
-        'PORT': '5432',
+# Set DB_ENGINE=sqlite to run locally against SQLite files; DB_REPLICA=1 adds a second
+# file as the read replica so routing can be exercised with two databases.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'postgresql')
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
-}
+    if os.environ.get('DB_REPLICA'):
+        DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db_replica.sqlite3',
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'ecommerce_db'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', 'postgres'),
+            'HOST': os.environ.get('DB_HOST', 'fihub.cnc88m2e2gfl.eu-north-1.rds.amazonaws.com'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # Keep connections open between requests and check them before reuse
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if os.environ.get('DB_POOL'):
+        # psycopg 3 connection pool; Django requires CONN_MAX_AGE = 0 when pooling
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 20)),
+                'timeout': 10,
+            },
+        }
+    if os.environ.get('DB_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.environ['DB_REPLICA_HOST'],
+            'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+
+# Dashboard and list reads go to the replica when one is configured
+DATABASE_ROUTERS = ['sales_data.routers.PrimaryReplicaRouter']
+SALES_DATA_READ_DATABASE = 'replica'
+# Seconds a client keeps reading from the primary after a write
+SALES_DATA_PRIMARY_STICKY_SECONDS = 5
 
 
 # Password validation
@@ -170,4 +208,72 @@ LOGGING = {
     },
 }
 
+# Ingestion
+# Route sales_data log records through a QueueHandler/QueueListener pair
+SALES_DATA_QUEUE_LOGGING = True
+# Directory for reject files of rows that failed during CSV uploads
+SALES_DATA_REJECTS_DIR = os.path.join(BASE_DIR, 'rejects')
+
+# API rendering
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'sales_data.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+# Dashboard JSON bodies at least this large are gzipped
+SALES_DATA_GZIP_MIN_BYTES = 16 * 1024
+
+# Query budgets
+# statement_timeout (ms) per dashboard endpoint on PostgreSQL; over budget, endpoints degrade
+# to approximate, estimated or stale answers
+SALES_DATA_QUERY_BUDGETS_MS = {
+    'summary_metrics': 3000,
+    'monthly_sales_volume': 3000,
+    'monthly_revenue': 3000,
+    'filterable_data_table': 2000,
+    'table_count': 1000,
+}
+# Heavy dashboard queries allowed to run at once per process, and how long a request waits for a slot
+SALES_DATA_MAX_HEAVY_QUERIES = 4
+SALES_DATA_ADMISSION_WAIT_SECONDS = 0.5
+# How long the last good answer of a request is kept for stale fallbacks
+SALES_DATA_STALE_TIMEOUT = 24 * 60 * 60
+
+# Cache
+# Set CACHE_URL (e.g. redis://localhost:6379/0) so web workers and management commands share
+# one cache; warmed entries in the default per-process memory cache only help that process.
+if os.environ.get('CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_URL'],
+        }
+    }
 
+# Responses cached under a data version token stay until the data changes; this only bounds
+# how long entries nobody asks for again are kept
+SALES_DATA_VERSIONED_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+# Cache warm-up
+# Recompute popular dashboard requests at the end of an import that changed data
+SALES_DATA_WARMUP_AFTER_IMPORT = True
+# Popular ranges: days ending today, or 'ytd' for the current year
+SALES_DATA_WARMUP_RANGES = (7, 30, 90, 365, 'ytd')
+# Warm-up requests run at once, so warming does not saturate the database
+SALES_DATA_WARMUP_WORKERS = 2
+# Data table views warmed (first page, all platforms and each platform), as the UI requests them:
+# dates are 'YYYY-MM-DD', 'today', 'month_start' or 'month_end' of the current month
+SALES_DATA_WARMUP_TABLE_VIEWS = (
+    {'start_date': '2023-06-01', 'end_date': 'month_end', 'limit': 10},
+)
+
+# Admin
+# Changelists estimate their row count from planner statistics unless the estimate is below this
+SALES_DATA_ADMIN_EXACT_COUNT_BELOW = 10000
+
+# Archive
+# Directory of the compressed monthly order files written by archive_orders
+SALES_DATA_ARCHIVE_DIR = os.path.join(BASE_DIR, 'archive')
+# Orders deleted from the hot tables per transaction while archiving
+SALES_DATA_ARCHIVE_BATCH_SIZE = 5000
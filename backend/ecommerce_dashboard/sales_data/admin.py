@@ -1,30 +1,173 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import Order, Customer, Delivery, Platform, Product
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from .budgets import estimated_count
+from .caching import bump_data_version, data_version_token, versioned_cache_timeout
+from .cohorts import refresh_customer_activity
+from .models import Order, Customer, Delivery, Platform, Product, State
+from .money import to_decimal
+from .rollups import refresh_rollups
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that counts large tables from planner statistics (PostgreSQL) instead of
+    an exact COUNT(*). Results estimated below SALES_DATA_ADMIN_EXACT_COUNT_BELOW rows
+    are still counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        estimate = None
+        if connections[queryset.db].vendor == 'postgresql':
+            if queryset.query.where:
+                estimate = estimated_count(queryset)
+            else:
+                with connections[queryset.db].cursor() as cursor:
+                    cursor.execute(
+                        "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                        [queryset.model._meta.db_table],
+                    )
+                    estimate = cursor.fetchone()[0]
+
+        # reltuples is -1 for a table that was never analyzed
+        if estimate is None or estimate < getattr(settings, 'SALES_DATA_ADMIN_EXACT_COUNT_BELOW', 10000):
+            return super().count
+        return estimate
+
+
+class DerivedDataAdmin(admin.ModelAdmin):
+    """
+    Admin writes refresh rollups, customer activity and cache stamps like API writes do.
+    Subclasses name the lookups from their model to the affected sale dates and customers.
+    """
+    sale_date_path = None
+    customer_path = None
+    # Customers, products and states can show up in any month, so edits bump the dimensions stamp
+    dimension = False
+
+    def _affected(self, queryset):
+        dates = set(queryset.values_list(self.sale_date_path, flat=True)) if self.sale_date_path else set()
+        customers = set(queryset.values_list(self.customer_path, flat=True)) if self.customer_path else set()
+        return dates - {None}, customers - {None}
+
+    def _sync_derived_data(self, *affected):
+        dates = set().union(*(dates for dates, _ in affected))
+        refresh_rollups(dates)
+        refresh_customer_activity(set().union(*(customers for _, customers in affected)))
+        bump_data_version(dates, dimensions=self.dimension)
+
+    def save_model(self, request, obj, form, change):
+        # Editing a dimension changes no sale date or customer, only how they are shown
+        if self.dimension:
+            super().save_model(request, obj, form, change)
+            self._sync_derived_data((set(), set()))
+            return
+        rows = self.model._default_manager.filter(pk=obj.pk)
+        before = self._affected(rows) if change else (set(), set())
+        super().save_model(request, obj, form, change)
+        self._sync_derived_data(before, self._affected(rows))
+
+    def delete_model(self, request, obj):
+        affected = self._affected(self.model._default_manager.filter(pk=obj.pk))
+        super().delete_model(request, obj)
+        self._sync_derived_data(affected)
+
+    def delete_queryset(self, request, queryset):
+        affected = self._affected(queryset)
+        super().delete_queryset(request, queryset)
+        self._sync_derived_data(affected)
+
+
+class ScalableAdmin(DerivedDataAdmin):
+    """Changelists that never run an exact COUNT(*) over large tables."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class StateListFilter(admin.SimpleListFilter):
+    """State filter whose choices are cached per data version instead of a DISTINCT scan per page."""
+    title = 'state'
+    parameter_name = 'state'
+
+    def lookups(self, request, model_admin):
+        cache_key = f"admin_state_choices_{data_version_token(None, None)}"
+        states = cache.get(cache_key)
+        if states is None:
+            states = [
+                state for state in
+                Delivery.objects.order_by().values_list('state', flat=True).distinct()
+                if state
+            ]
+            states.sort(key=lambda state: (not state.isdigit(), int(state) if state.isdigit() else 0, state))
+            cache.set(cache_key, states, timeout=versioned_cache_timeout())
+        return [(state, state) for state in states]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(state=self.value())
+        return queryset
+
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ScalableAdmin):
     list_display = ('product_id', 'product_name', 'category', 'price')
-    search_fields = ('product_id', 'product_name', 'category')
+    search_fields = ('=product_id', '^product_name', '=category')
+    sale_date_path = 'orders__date_of_sale'
+    customer_path = 'orders__customer_id'
+    dimension = True
+
+    @admin.display(ordering='price_cents')
+    def price(self, obj):
+        return to_decimal(obj.price_cents)
 
 @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(ScalableAdmin):
     list_display = ('customer_id', 'customer_name', 'contact_email', 'phone_number')
-    search_fields = ('customer_id', 'customer_name', 'contact_email')
+    search_fields = ('=customer_id', '^customer_name', '^contact_email')
+    sale_date_path = 'orders__date_of_sale'
+    dimension = True
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(ScalableAdmin):
     list_display = ('order_id', 'customer', 'product', 'quantity_sold', 'total_sale_value', 'date_of_sale')
-    search_fields = ('order_id', 'customer__customer_name', 'product__product_name')
+    list_select_related = ('customer', 'product')
+    search_fields = ('=order_id', '^customer__customer_name', '^product__product_name')
     list_filter = ('date_of_sale',)
+    autocomplete_fields = ('customer', 'product')
+    sale_date_path = 'date_of_sale'
+    customer_path = 'customer_id'
+
+    @admin.display(ordering='total_sale_value_cents')
+    def total_sale_value(self, obj):
+        return to_decimal(obj.total_sale_value_cents)
 
 @admin.register(Delivery)
-class DeliveryAdmin(admin.ModelAdmin):
+class DeliveryAdmin(ScalableAdmin):
     list_display = ('order', 'delivery_date', 'delivery_status','state')
-    search_fields = ('order__order_id','state')
-    list_filter = ('delivery_status', 'delivery_date','state')
+    list_select_related = ('order__customer',)
+    search_fields = ('=order__order_id', '=state')
+    list_filter = ('delivery_status', 'delivery_date', StateListFilter)
+    raw_id_fields = ('order',)
+    sale_date_path = 'order__date_of_sale'
 
 @admin.register(Platform)
-class PlatformAdmin(admin.ModelAdmin):
+class PlatformAdmin(ScalableAdmin):
     list_display = ('order', 'platform_name')
-    search_fields = ('order__order_id', 'platform_name')
+    list_select_related = ('order__customer',)
+    search_fields = ('=order__order_id',)
     list_filter = ('platform_name',)
+    raw_id_fields = ('order',)
+    sale_date_path = 'order__date_of_sale'
+    customer_path = 'order__customer_id'
+
+@admin.register(State)
+class StateAdmin(DerivedDataAdmin):
+    list_display = ('code', 'name')
+    search_fields = ('=code', '^name')
+    sale_date_path = 'deliveries__order__date_of_sale'
+    dimension = True
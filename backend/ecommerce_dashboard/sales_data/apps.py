@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_migrate
 
 
 class SalesDataConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "sales_data"
+
+    def ready(self):
+        # Hand log I/O to a background listener so ingestion never blocks on handlers
+        if getattr(settings, 'SALES_DATA_QUEUE_LOGGING', True):
+            from .telemetry import configure_queue_logging
+            configure_queue_logging()
+
+        # Trigram search indexes are PostgreSQL-only, so they are created outside the model state
+        from .indexes import create_trigram_indexes
+        post_migrate.connect(create_trigram_indexes, sender=self)
@@ -0,0 +1,362 @@
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from .caching import bump_data_version
+from .comparison import shift_month
+from .models import Delivery, Order, Platform
+from .routers import use_primary
+
+try:
+    import numpy as np
+except ImportError:  # archiving needs numpy; without it nothing can be archived or read back
+    np = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Columns of an archive file: one row per order with the totals of its deliveries, its first
+# state and platform, and the days until its first delivered delivery. customer_id/product_id
+# are the Customer/Product pks, which stay in the hot tables.
+COLUMNS = (
+    'order_id', 'customer_id', 'product_id', 'quantity_sold', 'total_sale_value_cents', 'date_of_sale',
+    'delivery_count', 'delivered_count', 'cancelled_count', 'state_code', 'platform_name', 'delivery_days',
+)
+
+# Columns with min/max statistics in the manifest
+STATS_COLUMNS = ('date_of_sale', 'quantity_sold', 'total_sale_value_cents')
+
+# state_code of orders without a delivery state
+NO_STATE = -1
+
+# delivery_days of orders that were not delivered
+NO_DELIVERY = -1
+
+MANIFEST = 'manifest.json'
+
+
+def archive_dir():
+    return Path(getattr(settings, 'SALES_DATA_ARCHIVE_DIR', 'archive'))
+
+
+def read_manifest():
+    """
+    {'months': {'YYYY-MM': {'file', 'rows', 'stats'}}, 'pending': {...}} of the archive directory,
+    re-read when it changes. Readers only use the published 'months'.
+    """
+    path = archive_dir() / MANIFEST
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return {'months': {}}
+    # Each write replaces the file, so the inode changes even when the mtime does not
+    return _read_manifest(str(path), stat.st_mtime_ns, stat.st_ino)
+
+
+@lru_cache(maxsize=4)
+def _read_manifest(path, mtime, inode):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(manifest):
+    path = archive_dir() / MANIFEST
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# Columns of recently read month files kept in memory; files are immutable between archive runs
+@lru_cache(maxsize=256)
+def _load_column(path, mtime, column):
+    with np.load(path) as data:
+        return data[column]
+
+
+def _month_columns(entry, columns):
+    path = archive_dir() / entry['file']
+    mtime = path.stat().st_mtime_ns
+    return {column: _load_column(str(path), mtime, column) for column in columns}
+
+
+def _overlaps(stats, start_date, end_date):
+    low, high = stats
+    return (end_date is None or low <= end_date.isoformat()) and (start_date is None or high >= start_date.isoformat())
+
+
+def archived_facts(start_date=None, end_date=None, columns=COLUMNS, dates=None):
+    """
+    Columns of the archived orders sold between the dates (or on `dates`), concatenated
+    across the month files whose date_of_sale statistics overlap the range. Other files
+    are not opened.
+
+    Returns:
+        dict: Column name to numpy array, or None when no archived month overlaps.
+    """
+    if dates is not None:
+        dates = sorted(set(dates))
+        if not dates:
+            return None
+        start_date, end_date = dates[0], dates[-1]
+
+    entries = [
+        entry for _, entry in sorted(read_manifest()['months'].items())
+        if _overlaps(entry['stats']['date_of_sale'], start_date, end_date)
+    ]
+    if not entries:
+        return None
+    if np is None:
+        raise ImproperlyConfigured("numpy is required to read archived orders.")
+
+    columns = tuple(dict.fromkeys(('date_of_sale',) + tuple(columns)))
+    parts = [_month_columns(entry, columns) for entry in entries]
+    facts = {column: np.concatenate([part[column] for part in parts]) for column in columns}
+
+    sale_dates = facts['date_of_sale']
+    if dates is not None:
+        mask = np.isin(sale_dates, np.array(dates, dtype='datetime64[D]'))
+    else:
+        mask = np.ones(len(sale_dates), dtype=bool)
+        if start_date:
+            mask &= sale_dates >= np.datetime64(start_date, 'D')
+        if end_date:
+            mask &= sale_dates <= np.datetime64(end_date, 'D')
+    if not mask.all():
+        facts = {column: values[mask] for column, values in facts.items()}
+    return facts
+
+
+def group_totals(keys, values=()):
+    """
+    Row count and sums of the `values` arrays per distinct combination of the `keys` arrays.
+
+    Returns:
+        dict: Key tuple (as Python values) to a tuple (count, *sums).
+    """
+    if not len(keys[0]):
+        return {}
+    # Encode each combination as one integer so a single np.unique finds the groups
+    combined = np.zeros(len(keys[0]), dtype=np.int64)
+    levels = []
+    for key in keys:
+        level, codes = np.unique(key, return_inverse=True)
+        combined = combined * len(level) + codes.reshape(-1)
+        levels.append(level)
+    groups, inverse = np.unique(combined, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    totals = [np.bincount(inverse, minlength=len(groups))]
+    for value in values:
+        total = np.zeros(len(groups), dtype=np.int64)
+        np.add.at(total, inverse, value)
+        totals.append(total)
+
+    result = {}
+    for i, group in enumerate(groups.tolist()):
+        key = []
+        for level in reversed(levels):
+            group, code = divmod(group, len(level))
+            key.append(level[code].item())
+        result[tuple(reversed(key))] = tuple(int(total[i]) for total in totals)
+    return result
+
+
+def merge_totals(totals, archived):
+    """Adds archived totals into the `totals` dict, key by key."""
+    for key, value in archived.items():
+        totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def archived_monthly_totals(start_date, end_date, column):
+    """{first day of month: sum of `column`} of the archived orders sold between the dates."""
+    facts = archived_facts(start_date, end_date, columns=(column,))
+    if facts is None:
+        return {}
+    months = facts['date_of_sale'].astype('datetime64[M]')
+    return {month: totals[1] for (month,), totals in group_totals([months], [facts[column]]).items()}
+
+
+def archived_months():
+    """'YYYY-MM' of every archived month, including months an interrupted run left pending."""
+    manifest = read_manifest()
+    return set(manifest['months']) | set(manifest.get('pending', {}))
+
+
+def archive_orders(before, batch_size=None):
+    """
+    Moves orders sold before the month of `before` out of the hot tables: each month is
+    written to one compressed columnar file (merged with the month's existing file), its
+    orders are deleted in batches of SALES_DATA_ARCHIVE_BATCH_SIZE, and only then is the file
+    published in the manifest with its statistics. Rollups keep counting archived orders.
+
+    A run interrupted between the deletes and the publication leaves the month pending;
+    the next run finishes it from the pending file.
+
+    Returns:
+        dict: Number of months and orders archived.
+    """
+    if np is None:
+        raise ImproperlyConfigured("numpy is required to archive orders.")
+    before = shift_month(before, 0)
+    batch_size = batch_size or getattr(settings, 'SALES_DATA_ARCHIVE_BATCH_SIZE', 5000)
+    archive_dir().mkdir(parents=True, exist_ok=True)
+
+    months = {shift_month(datetime.strptime(key, '%Y-%m').date(), 0) for key in read_manifest().get('pending', {})}
+    with use_primary():
+        first = Order.objects.filter(date_of_sale__lt=before).aggregate(first=Min('date_of_sale'))['first']
+        month = shift_month(first, 0) if first else before
+        while month < before:
+            months.add(month)
+            month = shift_month(month, 1)
+
+        summary = {'months': 0, 'orders': 0}
+        for month in sorted(months):
+            archived = _archive_month(month, batch_size)
+            if archived is not None:
+                summary['months'] += 1
+                summary['orders'] += archived
+                # Tables and search results change; the merged aggregates do not
+                bump_data_version([month])
+    logger.info("Archived orders before %s: %s", before, summary)
+    return summary
+
+
+def _archive_month(month, batch_size):
+    key = month.strftime('%Y-%m')
+    in_month = Q(date_of_sale__gte=month, date_of_sale__lt=shift_month(month, 1))
+    pks, facts = _month_facts(in_month)
+    manifest = read_manifest()
+    pending = manifest.get('pending', {}).get(key)
+    if not pks and not pending:
+        return None
+
+    if pks:
+        # Rows of the month archived before (or of an interrupted run) are kept unless exported again here
+        base = pending or manifest['months'].get(key)
+        if base:
+            previous = _month_columns(base, COLUMNS)
+            kept = ~np.isin(previous['order_id'], facts['order_id'])
+            facts = {column: np.concatenate([previous[column][kept], facts[column]]) for column in COLUMNS}
+        entry = _write_month_file(key, facts)
+        _write_manifest({**manifest, 'pending': {**manifest.get('pending', {}), key: entry}})
+        if pending:
+            _remove_file(pending)
+
+        # Customer activity keeps the month without reading the file back (imported lazily:
+        # cohorts imports this module); recorded before the deletes, so a resumed run has it
+        from .cohorts import record_archived_activity
+        record_archived_activity(facts)
+
+        # Deliveries and platforms go with their orders
+        for i in range(0, len(pks), batch_size):
+            with transaction.atomic():
+                Order.objects.filter(pk__in=pks[i:i + batch_size]).delete()
+    else:
+        entry = pending
+
+    # The deletes are committed; from here on the file replaces the tables' rows
+    manifest = read_manifest()
+    published = manifest['months'].get(key)
+    pending_months = {name: value for name, value in manifest.get('pending', {}).items() if name != key}
+    _write_manifest({'months': {**manifest['months'], key: entry}, 'pending': pending_months})
+    if published and published['file'] != entry['file']:
+        _remove_file(published)
+
+    # Imported lazily: rollups imports this module. Every day of the month is recounted, so
+    # rollups match the published file whichever run deleted the rows.
+    from .rollups import refresh_rollups
+    refresh_rollups([month + timedelta(days=day) for day in range((shift_month(month, 1) - month).days)])
+    logger.info("Archived %s orders of %s to %s", len(pks), key, entry['file'])
+    return len(pks)
+
+
+def _month_facts(in_month):
+    """(order pks, archive columns) of the orders matching `in_month`."""
+    rows = list(
+        Order.objects.filter(in_month).order_by('pk').values_list(
+            'pk', 'order_id', 'customer_id', 'product_id', 'quantity_sold', 'total_sale_value_cents', 'date_of_sale',
+        )
+    )
+    if not rows:
+        return [], None
+
+    deliveries = {
+        row['order_id']: row
+        for row in Delivery.objects.filter(order__in=Order.objects.filter(in_month))
+        .values('order_id')
+        .annotate(
+            delivery_count=Count('id'),
+            delivered_count=Count('id', filter=Q(delivery_status='Delivered')),
+            cancelled_count=Count('id', filter=Q(delivery_status='Cancelled')),
+            state_code=Min('state_code'),
+            delivered_on=Min('delivery_date', filter=Q(delivery_status='Delivered')),
+        )
+        .order_by()
+    }
+    platforms = dict(
+        Platform.objects.filter(order__in=Order.objects.filter(in_month))
+        .values('order_id')
+        .annotate(platform_name=Min('platform_name'))
+        .values_list('order_id', 'platform_name')
+        .order_by()
+    )
+
+    pks = [row[0] for row in rows]
+    no_delivery = {
+        'delivery_count': 0, 'delivered_count': 0, 'cancelled_count': 0, 'state_code': None, 'delivered_on': None,
+    }
+    facts = {
+        'order_id': np.array([row[1] for row in rows], dtype=str),
+        'customer_id': np.array([row[2] for row in rows], dtype=np.int64),
+        'product_id': np.array([row[3] for row in rows], dtype=np.int64),
+        'quantity_sold': np.array([row[4] for row in rows], dtype=np.int64),
+        'total_sale_value_cents': np.array([row[5] for row in rows], dtype=np.int64),
+        'date_of_sale': np.array([row[6] for row in rows], dtype='datetime64[D]'),
+    }
+    for column in ('delivery_count', 'delivered_count', 'cancelled_count'):
+        facts[column] = np.array([deliveries.get(pk, no_delivery)[column] for pk in pks], dtype=np.int64)
+    state_codes = [deliveries.get(pk, no_delivery)['state_code'] for pk in pks]
+    facts['state_code'] = np.array([NO_STATE if code is None else code for code in state_codes], dtype=np.int64)
+    facts['platform_name'] = np.array([platforms.get(pk, '') for pk in pks], dtype=str)
+    # Deliveries dated before the sale count as delivered the same day, as in the latency rollup
+    facts['delivery_days'] = np.array([
+        NO_DELIVERY if deliveries.get(pk, no_delivery)['delivered_on'] is None
+        else max((deliveries[pk]['delivered_on'] - row[6]).days, 0)
+        for pk, row in zip(pks, rows)
+    ], dtype=np.int64)
+    return pks, facts
+
+
+def _write_month_file(key, facts):
+    """Writes the month's columns to a new file and returns its manifest entry."""
+    # A new name per run, so the published file is never overwritten while it is still in use
+    file_name = f"orders-{key}-{datetime.now():%Y%m%d%H%M%S%f}.npz"
+    path = archive_dir() / file_name
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, **facts)
+    os.replace(tmp, path)
+    return {
+        'file': file_name,
+        'rows': len(facts['order_id']),
+        'stats': {
+            column: [_stat(facts[column].min()), _stat(facts[column].max())] for column in STATS_COLUMNS
+        },
+    }
+
+
+def _remove_file(entry):
+    (archive_dir() / entry['file']).unlink(missing_ok=True)
+
+
+def _stat(value):
+    value = value.item()
+    return value.isoformat() if hasattr(value, 'isoformat') else value
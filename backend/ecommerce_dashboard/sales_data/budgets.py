@@ -0,0 +1,111 @@
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, OperationalError, connections, router, transaction
+from .models import Order
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# SQLSTATE of a statement cancelled by statement_timeout
+QUERY_CANCELED = '57014'
+
+_heavy_query_slots = None
+_slots_lock = threading.Lock()
+
+
+class BudgetExceeded(Exception):
+    """Raised when a query runs past its time budget or no heavy-query slot is free."""
+
+
+def _slots():
+    global _heavy_query_slots
+    with _slots_lock:
+        if _heavy_query_slots is None:
+            _heavy_query_slots = threading.BoundedSemaphore(getattr(settings, 'SALES_DATA_MAX_HEAVY_QUERIES', 4))
+    return _heavy_query_slots
+
+
+def _is_query_canceled(error):
+    cause = error.__cause__
+    return QUERY_CANCELED in (getattr(cause, 'sqlstate', None), getattr(cause, 'pgcode', None))
+
+
+@contextmanager
+def query_budget(name):
+    """
+    Run the block as a heavy query of endpoint `name`.
+
+    The block needs one of SALES_DATA_MAX_HEAVY_QUERIES slots in this process and
+    waits at most SALES_DATA_ADMISSION_WAIT_SECONDS for it. On PostgreSQL the block
+    runs in a transaction on the read database with `statement_timeout` set locally
+    to SALES_DATA_QUERY_BUDGETS_MS[name]. Raises BudgetExceeded in either case.
+    """
+    wait = getattr(settings, 'SALES_DATA_ADMISSION_WAIT_SECONDS', 0.5)
+    if not _slots().acquire(timeout=wait):
+        raise BudgetExceeded(f"no heavy query slot free for {name}")
+
+    budget_ms = getattr(settings, 'SALES_DATA_QUERY_BUDGETS_MS', {}).get(name)
+    try:
+        alias = router.db_for_read(Order)
+        connection = connections[alias]
+        with transaction.atomic(using=alias):
+            if budget_ms and connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT set_config('statement_timeout', %s, true)", [str(int(budget_ms))])
+            yield
+    except OperationalError as e:
+        if _is_query_canceled(e):
+            raise BudgetExceeded(f"{name} exceeded its {budget_ms} ms budget") from e
+        raise
+    finally:
+        _slots().release()
+
+
+def within_budget(name, compute, *fallbacks):
+    """
+    Return compute() run under query_budget(name). When the budget is exceeded, try
+    each fallback in turn and return the first result that is not None; re-raise
+    BudgetExceeded when none of them can answer.
+    """
+    try:
+        with query_budget(name):
+            return compute()
+    except BudgetExceeded as e:
+        logger.warning("Degrading %s: %s", name, e)
+        for fallback in fallbacks:
+            try:
+                result = fallback()
+            except DatabaseError:
+                logger.exception("Fallback for %s failed", name)
+                continue
+            if result is not None:
+                return result
+        raise
+
+
+def remember(key, payload):
+    """Keep the last good answer of a request so it can be served stale under load."""
+    cache.set(f"last_good_{key}", payload, timeout=getattr(settings, 'SALES_DATA_STALE_TIMEOUT', 24 * 60 * 60))
+
+
+def stale(key):
+    """Fallback returning the last good answer flagged as stale, or None."""
+    payload = cache.get(f"last_good_{key}")
+    if payload is None:
+        return None
+    return {**payload, 'stale': True}
+
+
+def estimated_count(queryset):
+    """
+    Planner row estimate for `queryset` (PostgreSQL), or None when unavailable.
+    Costs a planning step instead of a full count.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
@@ -0,0 +1,313 @@
+import logging
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from .caching import bump_data_version
+from .cohorts import refresh_customer_activity
+from .models import Order
+from .rollups import refresh_rollups
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class BulkWriteMixin:
+    """
+    Adds a `bulk/` list route to a ModelViewSet:
+
+    - POST  creates every item
+    - PUT   upserts items on `bulk_lookup_field`
+    - PATCH partially updates existing items found by `bulk_lookup_field`
+
+    Each batch is validated item by item, matched against existing rows with one
+    query and written with bulk_create and a single UPDATE in one transaction.
+    Invalid items are reported by index and do not block the rest. A PATCH whose
+    items only carry the lookup and `bulk_status_field` skips the serializer: the
+    statuses are checked against the field's choices once and written with a single
+    UPDATE ... FROM on PostgreSQL.
+
+    Every write, bulk or not, refreshes the rollups and data version stamps
+    of the sale dates it touched, once per request.
+    """
+
+    # Field identifying existing rows in upserts and partial updates
+    bulk_lookup_field = 'id'
+    # Attribute holding the related order's pk, used to refresh rollups
+    # (None for dimension tables such as customers)
+    bulk_order_attname = None
+    # Fields feeding customer activity; writes changing none of them leave it alone
+    bulk_activity_fields = ()
+    # Choice field that status-only partial updates set without the serializer (None to disable)
+    bulk_status_field = None
+    bulk_batch_size = 1000
+
+    BULK_MODES = {'POST': 'create', 'PUT': 'upsert', 'PATCH': 'update'}
+
+    @action(detail=False, methods=['post', 'put', 'patch'], url_path='bulk')
+    def bulk(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({"error": "Expected a list of items."}, status=status.HTTP_400_BAD_REQUEST)
+
+        mode = self.BULK_MODES[request.method]
+        result = {'created': 0, 'updated': 0, 'errors': []}
+        changes = {'order_ids': set(), 'old_dates': set(), 'activity_order_ids': set(), 'old_customers': set()}
+        if mode == 'update' and self._is_status_only(items):
+            self._bulk_set_status(items, result, changes)
+        else:
+            for offset in range(0, len(items), self.bulk_batch_size):
+                self._bulk_write_batch(items[offset:offset + self.bulk_batch_size], offset, mode, result, changes)
+
+        # Derived data is refreshed once for the whole request, not per batch
+        if result['created'] or result['updated']:
+            self._sync_derived_data(**changes)
+
+        if not result['errors']:
+            response_status = status.HTTP_201_CREATED if mode == 'create' else status.HTTP_200_OK
+        elif result['created'] or result['updated']:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(result, status=response_status)
+
+    def _bulk_write_batch(self, items, offset, mode, result, changes):
+        model = self.get_queryset().model
+        lookup_attname = model._meta.get_field(self.bulk_lookup_field).attname
+        serializer = self.get_serializer(data=items, many=True, partial=(mode == 'update'))
+        valid, errors = serializer.validate_items()
+
+        # Key every valid item by its lookup value, rejecting duplicates within the batch
+        keyed, seen = [], set()
+        for index, data in valid:
+            key = items[index].get(self.bulk_lookup_field) if isinstance(items[index], dict) else None
+            if key is None and mode != 'create':
+                errors.append({'index': index, 'errors': {self.bulk_lookup_field: ["This field is required."]}})
+                continue
+            if key is not None:
+                key = str(key)
+                if key in seen:
+                    errors.append({'index': index, 'errors': {self.bulk_lookup_field: ["Duplicate item in payload."]}})
+                    continue
+                seen.add(key)
+            keyed.append((index, key, data))
+
+        # One lookup query for the rows that already exist
+        existing = {
+            str(getattr(obj, lookup_attname)): obj
+            for obj in model._default_manager.filter(**{f"{lookup_attname}__in": seen})
+        } if seen else {}
+
+        to_create, to_update, update_fields, activity_updates = [], [], set(), []
+        for index, key, data in keyed:
+            obj = existing.get(key)
+            if obj is not None and mode == 'create':
+                errors.append({'index': index, 'errors': {self.bulk_lookup_field: ["Already exists."]}})
+            elif obj is None and mode == 'update':
+                errors.append({'index': index, 'errors': {self.bulk_lookup_field: ["Not found."]}})
+            elif obj is None:
+                to_create.append(model(**data))
+            else:
+                activity = self._activity_values(obj)
+                for field, value in data.items():
+                    setattr(obj, field, value)
+                if self._activity_values(obj) != activity:
+                    activity_updates.append(obj)
+                update_fields.update(data)
+                to_update.append(obj)
+        # Rows are matched on the lookup field, so it never changes
+        update_fields.discard(self.bulk_lookup_field)
+
+        affected_orders = self._bulk_order_ids(to_update)
+        activity_orders = self._bulk_order_ids(activity_updates)
+        changes['old_dates'] |= self._bulk_sale_dates(affected_orders - changes['order_ids'])
+        changes['old_customers'] |= self._bulk_customer_ids(activity_orders - changes['activity_order_ids'])
+        with transaction.atomic():
+            model._default_manager.bulk_create(to_create)
+            if to_update and update_fields:
+                _update_rows(model, to_update, update_fields)
+
+        created_orders = self._bulk_order_ids(to_create)
+        changes['order_ids'] |= affected_orders | created_orders
+        changes['activity_order_ids'] |= activity_orders | (created_orders if self.bulk_activity_fields else set())
+
+        result['created'] += len(to_create)
+        result['updated'] += len(to_update)
+        result['errors'] += sorted(
+            ({'index': offset + e['index'], 'errors': e['errors']} for e in errors), key=lambda e: e['index']
+        )
+
+    def _is_status_only(self, items):
+        fields = {self.bulk_lookup_field, self.bulk_status_field}
+        return self.bulk_status_field is not None and all(
+            isinstance(item, dict) and item.keys() == fields for item in items
+        )
+
+    def _bulk_set_status(self, items, result, changes):
+        """Status-only partial update of `items`, without per-item serializer validation."""
+        model = self.get_queryset().model
+        lookup_field = model._meta.get_field(self.bulk_lookup_field)
+        status_field = model._meta.get_field(self.bulk_status_field)
+
+        # The distinct statuses are checked against the choices once, not item by item
+        statuses = {item[self.bulk_status_field] for item in items if isinstance(item[self.bulk_status_field], str)}
+        allowed = statuses & {value for value, _ in status_field.choices}
+
+        errors, rows = [], {}
+        for index, item in enumerate(items):
+            key, value = item[self.bulk_lookup_field], item[self.bulk_status_field]
+            if not isinstance(value, str) or value not in allowed:
+                message = f'"{value}" is not a valid choice.'
+                errors.append({'index': index, 'errors': {self.bulk_status_field: [message]}})
+                continue
+            try:
+                key = lookup_field.to_python(key)
+            except ValidationError:
+                key = None
+            if key is None:
+                errors.append({'index': index, 'errors': {self.bulk_lookup_field: ["A valid value is required."]}})
+            elif key in rows:
+                errors.append({'index': index, 'errors': {self.bulk_lookup_field: ["Duplicate item in payload."]}})
+            else:
+                rows[key] = (index, value)
+
+        with transaction.atomic():
+            found = _set_column(
+                model, lookup_field, status_field, [(key, value) for key, (_, value) in rows.items()],
+                self.bulk_order_attname,
+            )
+        errors.extend(
+            {'index': index, 'errors': {self.bulk_lookup_field: ["Not found."]}}
+            for key, (index, _) in rows.items() if key not in found
+        )
+
+        if self.bulk_order_attname is not None:
+            changes['order_ids'] |= set(found.values()) - {None}
+        result['updated'] += len(found)
+        result['errors'] += sorted(errors, key=lambda e: e['index'])
+
+    # Single-object writes keep rollups and cache stamps in step too
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        order_ids = self._bulk_order_ids([serializer.instance])
+        self._sync_derived_data(order_ids, activity_order_ids=order_ids if self.bulk_activity_fields else set())
+
+    def perform_update(self, serializer):
+        order_ids = self._bulk_order_ids([serializer.instance])
+        old_dates = self._bulk_sale_dates(order_ids)
+        activity = self._activity_values(serializer.instance)
+        old_customers = self._bulk_customer_ids(order_ids) if self.bulk_activity_fields else set()
+        super().perform_update(serializer)
+        order_ids |= self._bulk_order_ids([serializer.instance])
+        if self._activity_values(serializer.instance) != activity:
+            self._sync_derived_data(order_ids, old_dates, order_ids, old_customers)
+        else:
+            self._sync_derived_data(order_ids, old_dates)
+
+    def perform_destroy(self, instance):
+        order_ids = self._bulk_order_ids([instance])
+        old_dates = self._bulk_sale_dates(order_ids)
+        old_customers = self._bulk_customer_ids(order_ids) if self.bulk_activity_fields else set()
+        super().perform_destroy(instance)
+        self._sync_derived_data(set(), old_dates, set(), old_customers)
+
+    def _sync_derived_data(
+        self, order_ids, old_dates=frozenset(), activity_order_ids=frozenset(), old_customers=frozenset()
+    ):
+        """
+        Refresh rollups and cache stamps for the orders of the written rows, and customer
+        activity for the orders whose activity fields changed (`old_customers` held them before).
+        """
+        changed_dates = set(old_dates) | self._bulk_sale_dates(order_ids)
+        refresh_rollups(changed_dates)
+        refresh_customer_activity(set(old_customers) | self._bulk_customer_ids(activity_order_ids))
+        bump_data_version(changed_dates, dimensions=self.bulk_order_attname is None)
+
+    def _activity_values(self, obj):
+        return tuple(getattr(obj, obj._meta.get_field(name).attname) for name in self.bulk_activity_fields)
+
+    def _bulk_order_ids(self, objs):
+        if self.bulk_order_attname is None:
+            return set()
+        return {getattr(obj, self.bulk_order_attname) for obj in objs} - {None}
+
+    @staticmethod
+    def _bulk_sale_dates(order_ids):
+        if not order_ids:
+            return set()
+        return set(Order.objects.filter(pk__in=order_ids).values_list('date_of_sale', flat=True))
+
+    @staticmethod
+    def _bulk_customer_ids(order_ids):
+        if not order_ids:
+            return set()
+        return set(Order.objects.filter(pk__in=order_ids).values_list('customer_id', flat=True))
+
+
+def _update_rows(model, objs, fields):
+    """
+    Write `fields` of `objs` back. PostgreSQL gets one UPDATE ... FROM (VALUES ...) joined
+    on the primary key per batch; other databases fall back to bulk_update's CASE statements.
+    """
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor != 'postgresql':
+        model._default_manager.bulk_update(objs, fields)
+        return
+
+    pk = model._meta.pk
+    columns = [pk] + [model._meta.get_field(name) for name in sorted(fields)]
+    quote = connection.ops.quote_name
+    # Parameters in VALUES are untyped, so each one is cast to its column's type
+    row = '(' + ', '.join(f'%s::{field.cast_db_type(connection)}' for field in columns) + ')'
+    assignments = ', '.join(f'{quote(field.column)} = v.{quote(field.column)}' for field in columns[1:])
+    names = ', '.join(quote(field.column) for field in columns)
+    # Stays below PostgreSQL's 65535 bind parameters per statement
+    batch_size = max(1, 65535 // len(columns))
+    with connection.cursor() as cursor:
+        for i in range(0, len(objs), batch_size):
+            batch = objs[i:i + batch_size]
+            cursor.execute(
+                f"UPDATE {quote(model._meta.db_table)} AS t SET {assignments} "
+                f"FROM (VALUES {', '.join([row] * len(batch))}) AS v ({names}) "
+                f"WHERE t.{quote(pk.column)} = v.{quote(pk.column)}",
+                [field.get_db_prep_save(getattr(obj, field.attname), connection) for obj in batch for field in columns],
+            )
+
+
+def _set_column(model, lookup_field, field, rows, order_attname=None):
+    """
+    Set `field` to the value of each (lookup value, value) pair in `rows`. PostgreSQL gets a
+    single UPDATE ... FROM unnest(keys, values); other databases one UPDATE per distinct value.
+
+    Returns:
+        dict: {lookup value: order pk (None without `order_attname`)} of the rows found.
+    """
+    connection = connections[router.db_for_write(model)]
+    order_column = model._meta.get_field(order_attname).column if order_attname else None
+    if connection.vendor != 'postgresql':
+        found = dict(
+            model._default_manager.filter(**{f"{lookup_field.attname}__in": [key for key, _ in rows]})
+            .values_list(lookup_field.attname, order_attname or lookup_field.attname)
+        )
+        by_value = {}
+        for key, value in rows:
+            if key in found:
+                by_value.setdefault(value, []).append(key)
+        for value, keys in by_value.items():
+            model._default_manager.filter(**{f"{lookup_field.attname}__in": keys}).update(**{field.attname: value})
+        return found if order_attname else dict.fromkeys(found)
+
+    quote = connection.ops.quote_name
+    key, column = quote(lookup_field.column), quote(field.column)
+    returning = f"t.{key}, t.{quote(order_column)}" if order_column else f"t.{key}, NULL"
+    # The rows travel as two array parameters, so the statement text stays the same size for any payload
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {quote(model._meta.db_table)} AS t SET {column} = v.value "
+            f"FROM unnest(%s::{lookup_field.cast_db_type(connection)}[], %s::{field.cast_db_type(connection)}[]) "
+            f"AS v (key, value) WHERE t.{key} = v.key RETURNING {returning}",
+            [[key for key, _ in rows], [value for _, value in rows]],
+        )
+        return dict(cursor.fetchall())
@@ -0,0 +1,107 @@
+import hashlib
+from datetime import date, datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import DataVersion
+
+# Scope of the stamp bumped by every data change
+GLOBAL_SCOPE = 'all'
+# Scope bumped when customers or products change, which can affect any month
+DIMENSIONS_SCOPE = 'dims'
+
+# Seconds a process trusts its cached copy of a version stamp before re-reading the database
+VERSION_CACHE_TIMEOUT = 10
+
+
+def versioned_cache_timeout():
+    """
+    Seconds responses cached under a data version token are kept. A data change moves
+    requests to new keys, so the timeout only bounds how long unused entries linger.
+    """
+    return getattr(settings, 'SALES_DATA_VERSIONED_CACHE_TIMEOUT', 7 * 24 * 60 * 60)
+
+
+def _as_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def month_scope(day):
+    return day.strftime('%Y-%m')
+
+
+def _month_scopes(start_date, end_date):
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        yield f"{year:04d}-{month:02d}"
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def get_data_versions(scopes):
+    """Return {scope: version} for the given scopes, reading the database only on cache misses."""
+    keys = {f"data_version_{scope}": scope for scope in scopes}
+    cached = cache.get_many(keys)
+    versions = {keys[key]: value for key, value in cached.items()}
+
+    missing = [scope for scope in scopes if scope not in versions]
+    if missing:
+        stored = dict(DataVersion.objects.filter(scope__in=missing).values_list('scope', 'version'))
+        fetched = {scope: stored.get(scope, 0) for scope in missing}
+        cache.set_many({f"data_version_{scope}": v for scope, v in fetched.items()}, timeout=VERSION_CACHE_TIMEOUT)
+        versions.update(fetched)
+    return versions
+
+
+def data_version_token(start_date=None, end_date=None):
+    """
+    Short token identifying the state of the data in a sale-date range.
+    Bounded ranges only depend on the months they cover; anything else uses the global stamp.
+    """
+    start_date, end_date = _as_date(start_date), _as_date(end_date)
+    if start_date and end_date and start_date <= end_date:
+        scopes = [*_month_scopes(start_date, end_date), DIMENSIONS_SCOPE]
+    else:
+        scopes = [GLOBAL_SCOPE]
+
+    versions = get_data_versions(scopes)
+    signature = ','.join(f"{scope}:{versions[scope]}" for scope in scopes)
+    return hashlib.md5(signature.encode()).hexdigest()[:12]
+
+
+def data_last_modified():
+    """When any sales data last changed, or None before the first import."""
+    stamp = cache.get('data_version_last_modified')
+    if stamp is None:
+        stamp = DataVersion.objects.filter(scope=GLOBAL_SCOPE).values_list('updated_at', flat=True).first() or ''
+        cache.set('data_version_last_modified', stamp, timeout=VERSION_CACHE_TIMEOUT)
+    return stamp or None
+
+
+def bump_data_version(dates=(), dimensions=False):
+    """
+    Bump the global stamp and the stamps of every month in `dates`, plus the
+    dimensions stamp when customers or products changed.
+    Cache entries keyed on other months stay valid.
+    """
+    dates = {_as_date(d) for d in dates} - {None}
+    if not dates and not dimensions:
+        return
+    scopes = {month_scope(d) for d in dates} | {GLOBAL_SCOPE}
+    if dimensions:
+        scopes.add(DIMENSIONS_SCOPE)
+
+    with transaction.atomic():
+        existing = set(DataVersion.objects.filter(scope__in=scopes).values_list('scope', flat=True))
+        DataVersion.objects.bulk_create(
+            [DataVersion(scope=scope) for scope in scopes - existing], ignore_conflicts=True
+        )
+        DataVersion.objects.filter(scope__in=scopes).update(version=F('version') + 1, updated_at=timezone.now())
+
+    cache.delete_many([f"data_version_{scope}" for scope in scopes] + ['data_version_last_modified'])
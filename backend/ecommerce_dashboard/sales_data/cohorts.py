@@ -0,0 +1,219 @@
+import logging
+from collections import defaultdict
+from django.db import transaction
+from django.db.models.functions import TruncMonth
+from .archive import archived_facts
+from .comparison import as_month, month_index, shift_month
+from .models import ArchivedCustomerActivity, Customer, CustomerActivity, Order
+from .routers import use_primary
+
+try:
+    import numpy as np
+except ImportError:  # build the matrix with integer bit operations instead
+    np = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# platform_name of the activity rows covering every platform
+ALL_PLATFORMS = ''
+
+# Customers whose activity is recomputed per transaction
+CUSTOMER_CHUNK_SIZE = 1000
+
+
+def activity_bitmap(first_month, months):
+    """
+    Little-endian bitmap of the months a customer bought in: bit k is set when the
+    customer bought in the k-th month after `first_month` (bit 0 is `first_month` itself).
+    """
+    first = month_index(first_month)
+    bits = 0
+    for month in months:
+        bits |= 1 << (month_index(month) - first)
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def bitmap_months(first_month, bitmap):
+    """The months set in an activity_bitmap() starting at `first_month`."""
+    bits = int.from_bytes(bitmap, 'little')
+    return [shift_month(first_month, k) for k in range(bits.bit_length()) if bits >> k & 1]
+
+
+def refresh_customer_activity(customer_ids=None):
+    """
+    Recompute the CustomerActivity rows of the given customers from their orders.
+
+    Args:
+        customer_ids: Iterable of Customer pks. Rebuilds every customer when None.
+    """
+    if customer_ids is not None and not customer_ids:
+        return 0
+    if customer_ids is None:
+        customer_ids = Customer.objects.order_by('pk').values_list('pk', flat=True)
+
+    created = 0
+    with use_primary():
+        customer_ids = sorted(set(customer_ids))
+        for i in range(0, len(customer_ids), CUSTOMER_CHUNK_SIZE):
+            chunk = customer_ids[i:i + CUSTOMER_CHUNK_SIZE]
+            with transaction.atomic():
+                CustomerActivity.objects.filter(customer_id__in=chunk).delete()
+                created += _build_customer_activity(chunk)
+    logger.info("Refreshed %s customer activity rows", created)
+    return created
+
+
+def _build_customer_activity(customer_ids):
+    rows = (
+        Order.objects.filter(customer_id__in=customer_ids)
+        .annotate(month=TruncMonth('date_of_sale'))
+        .values_list('customer_id', 'platforms__platform_name', 'month')
+        .distinct()
+        .order_by()
+    )
+    rows = [(customer_id, platform_name, as_month(month)) for customer_id, platform_name, month in rows]
+
+    # Months of archived orders still count, read from the summary kept when they were archived
+    for customer_id, platform_name, first_month, bitmap in ArchivedCustomerActivity.objects.filter(
+        customer_id__in=customer_ids
+    ).values_list('customer_id', 'platform_name', 'first_month', 'months'):
+        rows.extend((customer_id, platform_name, month) for month in bitmap_months(first_month, bytes(bitmap)))
+
+    objs = _activity_rows(CustomerActivity, _active_months(rows))
+    CustomerActivity.objects.bulk_create(objs, batch_size=1000)
+    return len(objs)
+
+
+def _active_months(rows):
+    """{(customer_id, platform_name): months} of (customer_id, platform_name, month) rows."""
+    months = defaultdict(set)
+    for customer_id, platform_name, month in rows:
+        months[(customer_id, ALL_PLATFORMS)].add(month)
+        if platform_name:
+            months[(customer_id, platform_name)].add(month)
+    return months
+
+
+def _activity_rows(model, months):
+    objs = []
+    for (customer_id, platform_name), active in months.items():
+        first_month = min(active)
+        objs.append(model(
+            customer_id=customer_id,
+            platform_name=platform_name,
+            first_month=first_month,
+            months=activity_bitmap(first_month, active),
+        ))
+    return objs
+
+
+def record_archived_activity(facts):
+    """
+    Adds the purchase months of archived orders (archive columns with customer_id, platform_name
+    and date_of_sale) to the ArchivedCustomerActivity rows of their customers. Months already
+    recorded are kept, so recording a month file again changes nothing.
+    """
+    rows = set(zip(
+        facts['customer_id'].tolist(),
+        facts['platform_name'].tolist(),
+        facts['date_of_sale'].astype('datetime64[M]').tolist(),
+    ))
+    customer_ids = sorted({customer_id for customer_id, _, _ in rows})
+    for i in range(0, len(customer_ids), CUSTOMER_CHUNK_SIZE):
+        chunk = set(customer_ids[i:i + CUSTOMER_CHUNK_SIZE])
+        months = _active_months(row for row in rows if row[0] in chunk)
+        with transaction.atomic():
+            existing = ArchivedCustomerActivity.objects.filter(customer_id__in=chunk)
+            for customer_id, platform_name, first_month, bitmap in existing.values_list(
+                'customer_id', 'platform_name', 'first_month', 'months'
+            ):
+                months[(customer_id, platform_name)].update(bitmap_months(first_month, bytes(bitmap)))
+            existing.delete()
+            objs = _activity_rows(ArchivedCustomerActivity, months)
+            ArchivedCustomerActivity.objects.bulk_create(objs, batch_size=1000)
+
+
+def refresh_archived_activity():
+    """Rebuilds ArchivedCustomerActivity from every archive file."""
+    with use_primary(), transaction.atomic():
+        ArchivedCustomerActivity.objects.all().delete()
+        facts = archived_facts(columns=('customer_id', 'platform_name'))
+        if facts is not None:
+            record_archived_activity(facts)
+
+
+def retention_matrix(start_month, end_month, platform=None):
+    """
+    Monthly acquisition cohorts from `start_month` to `end_month` and how many of
+    each cohort bought again in every following month up to `end_month`.
+
+    Returns:
+        list: One dict per cohort month with its size and the retention by month offset.
+    """
+    span = month_index(end_month) - month_index(start_month) + 1
+    rows = list(
+        CustomerActivity.objects.filter(
+            platform_name=platform or ALL_PLATFORMS, first_month__range=(start_month, end_month)
+        )
+        .order_by('first_month')
+        .values_list('first_month', 'months')
+    )
+    cohorts = [month_index(first_month) - month_index(start_month) for first_month, _ in rows]
+    bitmaps = [bytes(months) for _, months in rows]
+
+    if np is not None:
+        sizes, active = _count_active(np.array(cohorts, dtype=np.int64), bitmaps, span)
+    else:
+        sizes, active = _count_active_python(cohorts, bitmaps, span)
+
+    data = []
+    for cohort in range(span):
+        if not sizes[cohort]:
+            continue
+        size = int(sizes[cohort])
+        data.append({
+            'cohort': shift_month(start_month, cohort).strftime('%Y-%m'),
+            'customers': size,
+            'retention': [
+                {
+                    'month_offset': offset,
+                    'customers': int(active[cohort][offset]),
+                    'percentage': round(int(active[cohort][offset]) / size * 100, 2),
+                }
+                # Months after end_month are not reported
+                for offset in range(span - cohort)
+            ],
+        })
+    return data
+
+
+def _count_active(cohorts, bitmaps, span):
+    """(customers per cohort, active customers per cohort and month offset) over packed bitmaps."""
+    sizes = np.bincount(cohorts, minlength=span)
+    active = np.zeros((span, span), dtype=np.int64)
+    if not bitmaps:
+        return sizes, active
+
+    # Cut or pad every bitmap to the bytes covering `span` months and unpack all of them at once
+    width = (span + 7) // 8
+    packed = np.frombuffer(b''.join(bitmap[:width].ljust(width, b'\0') for bitmap in bitmaps), dtype=np.uint8)
+    bits = np.unpackbits(packed.reshape(len(bitmaps), width), axis=1, bitorder='little')[:, :span]
+
+    # Rows are sorted by cohort, so each cohort is one contiguous block to sum
+    present = np.flatnonzero(sizes)
+    starts = np.searchsorted(cohorts, present)
+    active[present] = np.add.reduceat(bits.astype(np.int64), starts, axis=0)
+    return sizes, active
+
+
+def _count_active_python(cohorts, bitmaps, span):
+    sizes = [0] * span
+    active = [[0] * span for _ in range(span)]
+    for cohort, bitmap in zip(cohorts, bitmaps):
+        sizes[cohort] += 1
+        bits = int.from_bytes(bitmap, 'little')
+        for offset in range(span):
+            if bits >> offset & 1:
+                active[cohort][offset] += 1
+    return sizes, active
@@ -0,0 +1,84 @@
+from datetime import date, datetime, timedelta
+
+# Accepted values of the `compare` query parameter
+COMPARE_OPTIONS = ('previous_period', 'previous_year')
+
+
+def _minus_year(day):
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:  # 29 February
+        return day.replace(year=day.year - 1, day=28)
+
+
+def comparison_range(start_date, end_date, compare, by_month=False):
+    """
+    Date range to compare [start_date, end_date] with.
+
+    - previous_period: the range of the same length ending the day before start_date; ranges of
+      whole calendar months, and every range when `by_month` (month buckets), are shifted back
+      by their number of calendar months instead, so each month is paired with a whole month
+    - previous_year: the same dates one year earlier
+    """
+    if compare == 'previous_period':
+        if by_month or _whole_months(start_date, end_date):
+            months = month_index(end_date) - month_index(start_date) + 1
+            return _shift_months(start_date, -months), _shift_months(end_date, -months)
+        previous_end = start_date - timedelta(days=1)
+        return previous_end - (end_date - start_date), previous_end
+    if compare == 'previous_year':
+        return _minus_year(start_date), _minus_year(end_date)
+    raise ValueError(f"compare must be one of: {', '.join(COMPARE_OPTIONS)}.")
+
+
+def _last_day(day):
+    return shift_month(day, 1) - timedelta(days=1)
+
+
+def _whole_months(start_date, end_date):
+    return start_date.day == 1 and end_date == _last_day(end_date)
+
+
+def _shift_months(day, months):
+    """The same day `months` months away; month ends stay month ends, other days are clamped."""
+    target = shift_month(day, months)
+    last = _last_day(target)
+    if day == _last_day(day) or day.day > last.day:
+        return last
+    return target.replace(day=day.day)
+
+
+def month_index(day):
+    return day.year * 12 + day.month - 1
+
+
+def shift_month(day, months):
+    """First day of the month `months` away from the month of `day`."""
+    index = month_index(day) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def as_month(value):
+    """Normalise a month bucket (date or datetime, depending on the backend) to a date."""
+    return value.date() if isinstance(value, datetime) else value
+
+
+def growth_percentage(current, previous):
+    if not previous:
+        return None
+    return round(float((current - previous) / previous) * 100, 2)
+
+
+def _delta(current, previous):
+    delta = current - previous
+    return round(delta, 2) if isinstance(delta, float) else delta
+
+
+def compare_values(current, previous):
+    """Delta and growth percentage of every metric present in both dicts."""
+    return {
+        'delta': {key: _delta(current[key], previous[key]) for key in current if key in previous},
+        'growth_percentage': {
+            key: growth_percentage(current[key], previous[key]) for key in current if key in previous
+        },
+    }
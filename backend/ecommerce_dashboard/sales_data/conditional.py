@@ -0,0 +1,49 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+from django.views.decorators.http import condition
+from .caching import data_version_token, data_last_modified
+from .comparison import comparison_range
+
+
+def _parse(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _etag(request, *args, **kwargs):
+    # The URL (with its filters) plus the data version of the requested range,
+    # extended back to the comparison range when one is requested
+    start_date, end_date = request.GET.get('start_date'), request.GET.get('end_date')
+    try:
+        if request.GET.get('compare') and start_date and end_date:
+            start_date, end_date = _parse(start_date), _parse(end_date)
+            # Month-bucketed endpoints may shift by calendar months; cover both ranges
+            start_date = min(
+                comparison_range(start_date, end_date, request.GET['compare'], by_month=by_month)[0]
+                for by_month in (False, True)
+            )
+    except ValueError:
+        pass
+    token = data_version_token(start_date, end_date)
+    encoding = 'gzip' if 'gzip' in request.headers.get('Accept-Encoding', '') else 'identity'
+    return hashlib.md5(f"{request.get_full_path()}|{encoding}|{token}".encode()).hexdigest()
+
+
+def _last_modified(request, *args, **kwargs):
+    return data_last_modified()
+
+
+def conditional_on_data_version(view):
+    """
+    Answers If-None-Match / If-Modified-Since with 304 Not Modified before the view runs
+    any query. Only reads are conditional: the data version is not a per-object version,
+    so writes never check If-Match / If-Unmodified-Since against it.
+    """
+    conditional_view = condition(etag_func=_etag, last_modified_func=_last_modified)(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            return conditional_view(request, *args, **kwargs)
+        return view(request, *args, **kwargs)
+    return wrapper
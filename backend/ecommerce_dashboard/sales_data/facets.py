@@ -0,0 +1,103 @@
+from django.db import connections, router
+from django.db.models import Count
+from .models import Order, Product, Delivery, Platform
+
+# Facet name -> (ORM lookup from Order, SQL column in the GROUPING SETS query)
+FACETS = {
+    'category': ('product__category', 'p.category'),
+    'delivery_status': ('deliveries__delivery_status', 'd.delivery_status'),
+    'platform': ('platforms__platform_name', 'pl.platform_name'),
+    'state': ('deliveries__state', 'd.state'),
+}
+
+
+def facet_counts(filters):
+    """
+    Count distinct orders per value of every facet under the table `filters` (Order
+    lookups as built by Dashboard.table_filters). Each facet is counted under every
+    filter but its own, so picking a platform still shows the other platforms' counts.
+
+    Returns:
+        dict: {facet: [{'value': ..., 'count': ...}, ...]} sorted by count.
+    """
+    alias = router.db_for_read(Order)
+    if connections[alias].vendor == 'postgresql':
+        counts = _grouping_sets_counts(filters, alias)
+    else:
+        counts = _per_facet_counts(filters)
+
+    return {
+        facet: sorted(
+            ({'value': value, 'count': count} for value, count in counts.get(facet, {}).items()),
+            key=lambda entry: (-entry['count'], str(entry['value'])),
+        )
+        for facet in FACETS
+    }
+
+
+def _filters_without(filters, lookups):
+    """`filters` minus the ones on any of `lookups` (e.g. 'platforms__platform_name__iexact')."""
+    return {
+        key: value for key, value in filters.items()
+        if not any(key == lookup or key.startswith(f"{lookup}__") for lookup in lookups)
+    }
+
+
+def _grouping_sets_counts(filters, alias):
+    """
+    All facets in one scan with GROUP BY GROUPING SETS. Rows are restricted by the filters
+    outside the facets; each facet's count is a FILTER over the other facets' filters.
+    """
+    def order_ids(lookups):
+        return Order.objects.filter(**lookups).values('pk').query.get_compiler(using=alias).as_sql()
+
+    facet_lookups = [lookup for lookup, _ in FACETS.values()]
+    common = _filters_without(filters, facet_lookups)
+    counts_sql, params = [], []
+    for lookup, _ in FACETS.values():
+        others = {key: value for key, value in _filters_without(filters, [lookup]).items() if key not in common}
+        if others:
+            subquery, subquery_params = order_ids(others)
+            counts_sql.append(f"COUNT(DISTINCT o.id) FILTER (WHERE o.id IN ({subquery}))")
+            params.extend(subquery_params)
+        else:
+            counts_sql.append("COUNT(DISTINCT o.id)")
+    subquery, subquery_params = order_ids(common)
+    params.extend(subquery_params)
+
+    columns = [column for _, column in FACETS.values()]
+    sql = f"""
+        SELECT {', '.join(columns)},
+               {', '.join(f'GROUPING({column})' for column in columns)},
+               {', '.join(counts_sql)}
+        FROM {Order._meta.db_table} o
+        JOIN {Product._meta.db_table} p ON p.id = o.product_id
+        LEFT JOIN {Delivery._meta.db_table} d ON d.order_id = o.id
+        LEFT JOIN {Platform._meta.db_table} pl ON pl.order_id = o.id
+        WHERE o.id IN ({subquery})
+        GROUP BY GROUPING SETS ({', '.join(f'({column})' for column in columns)})
+    """
+
+    counts = {facet: {} for facet in FACETS}
+    names = list(FACETS)
+    with connections[alias].cursor() as cursor:
+        cursor.execute(sql, params)
+        for row in cursor.fetchall():
+            values, grouping, totals = row[:len(names)], row[len(names):2 * len(names)], row[2 * len(names):]
+            # GROUPING(col) is 0 for the column the row is grouped by
+            index = list(grouping).index(0)
+            if totals[index]:
+                counts[names[index]][values[index]] = totals[index]
+    return counts
+
+
+def _per_facet_counts(filters):
+    """Portable fallback: one GROUP BY query per facet."""
+    counts = {}
+    for facet, (lookup, _) in FACETS.items():
+        rows = (
+            Order.objects.filter(**_filters_without(filters, [lookup])).order_by()
+            .values(lookup).annotate(count=Count('id', distinct=True))
+        )
+        counts[facet] = {row[lookup]: row['count'] for row in rows}
+    return counts
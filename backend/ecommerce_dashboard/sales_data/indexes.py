@@ -0,0 +1,38 @@
+import logging
+from django.db import DatabaseError, connections, transaction
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# (index name, table, column) of the trigram indexes behind admin and order search.
+# They index UPPER(column::text), the expression Django's case-insensitive lookups compare.
+TRIGRAM_INDEXES = (
+    ('customer_name_trgm_idx', 'sales_data_customer', 'customer_name'),
+    ('customer_email_trgm_idx', 'sales_data_customer', 'contact_email'),
+    ('product_name_trgm_idx', 'sales_data_product', 'product_name'),
+    ('order_id_trgm_idx', 'sales_data_order', 'order_id'),
+)
+
+
+def create_trigram_indexes(using='default', **kwargs):
+    """
+    post_migrate handler creating the pg_trgm GIN indexes on PostgreSQL. Other backends
+    are skipped, and so are databases where the pg_trgm extension cannot be installed.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+
+    try:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except DatabaseError as e:
+        logger.warning("Skipping trigram indexes on %s: pg_trgm is unavailable (%s)", using, e)
+        return
+
+    with connection.cursor() as cursor:
+        for name, table, column in TRIGRAM_INDEXES:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" '
+                f'USING gin (UPPER("{column}"::text) gin_trgm_ops)'
+            )
@@ -0,0 +1,101 @@
+import struct
+from itertools import accumulate
+from bisect import bisect_left
+from math import ceil
+from .models import DailyDeliveryLatency
+
+try:
+    import numpy as np
+except ImportError:  # merge histograms with plain integer sums instead
+    np = None
+
+# Buckets of a latency histogram: 0..89 days one per day, the last one for 90 days or more
+LATENCY_BUCKETS = 91
+
+PERCENTILES = (50, 90, 99)
+
+# Dimensions a latency report can be grouped by
+GROUP_BY = ('platform', 'state', 'month')
+
+_HISTOGRAM = struct.Struct(f'<{LATENCY_BUCKETS}I')
+
+
+def latency_bucket(days):
+    """Histogram bucket of a delivery `days` after the sale; deliveries dated before the sale count as 0."""
+    return min(max(days, 0), LATENCY_BUCKETS - 1)
+
+
+def encode_histogram(counts):
+    return _HISTOGRAM.pack(*counts)
+
+
+def decode_histogram(data):
+    return list(_HISTOGRAM.unpack(bytes(data)))
+
+
+def percentile(counts, q):
+    """Nearest-rank q-th percentile, in days, of a histogram with `sum(counts)` deliveries."""
+    cumulative = list(accumulate(counts))
+    if not cumulative[-1]:
+        return None
+    return bisect_left(cumulative, ceil(q / 100 * cumulative[-1]))
+
+
+def latency_report(start_date=None, end_date=None, group_by=GROUP_BY, platform=None, state=None):
+    """
+    Delivery latency percentiles of delivered orders sold between the dates, one entry per
+    combination of the `group_by` dimensions, merged from the daily histograms.
+
+    Returns:
+        list: Dicts with the group's dimensions, its delivery count and p50/p90/p99 in days.
+    """
+    rows = DailyDeliveryLatency.objects.all()
+    if start_date:
+        rows = rows.filter(date__gte=start_date)
+    if end_date:
+        rows = rows.filter(date__lte=end_date)
+    if platform:
+        rows = rows.filter(platform_name__iexact=platform)
+    if state:
+        rows = rows.filter(state_id=state)
+    if 'state' in group_by:
+        rows = rows.exclude(state__isnull=True)
+
+    groups, names, keys, histograms = {}, {}, [], []
+    for sale_date, platform_name, state_code, state_name, histogram in rows.values_list(
+        'date', 'platform_name', 'state_id', 'state__name', 'histogram'
+    ).order_by():
+        key = (
+            platform_name if 'platform' in group_by else None,
+            state_code if 'state' in group_by else None,
+            sale_date.strftime('%Y-%m') if 'month' in group_by else None,
+        )
+        keys.append(groups.setdefault(key, len(groups)))
+        names[state_code] = state_name
+        histograms.append(bytes(histogram))
+
+    if np is not None and histograms:
+        merged = np.zeros((len(groups), LATENCY_BUCKETS), dtype=np.int64)
+        matrix = np.frombuffer(b''.join(histograms), dtype='<u4').reshape(len(histograms), LATENCY_BUCKETS)
+        np.add.at(merged, np.array(keys), matrix)
+        merged = merged.tolist()
+    else:
+        merged = [[0] * LATENCY_BUCKETS for _ in groups]
+        for group, histogram in zip(keys, histograms):
+            merged[group] = [a + b for a, b in zip(merged[group], decode_histogram(histogram))]
+
+    data = []
+    for (platform_name, state_code, month), group in sorted(groups.items(), key=lambda item: tuple(
+        '' if part is None else part for part in item[0]
+    )):
+        entry = {}
+        if 'platform' in group_by:
+            entry['platform'] = platform_name or None
+        if 'state' in group_by:
+            entry.update({'state_code': state_code, 'state': names[state_code]})
+        if 'month' in group_by:
+            entry['month'] = month
+        entry['deliveries'] = sum(merged[group])
+        entry.update({f'p{q}_days': percentile(merged[group], q) for q in PERCENTILES})
+        data.append(entry)
+    return data
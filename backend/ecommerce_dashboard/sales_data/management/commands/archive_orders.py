@@ -0,0 +1,25 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from sales_data.archive import archive_orders
+
+class Command(BaseCommand):
+    help = 'Moves orders sold before a month to compressed monthly archive files and deletes them from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', required=True, help='First month kept in the database (YYYY-MM)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Orders deleted per transaction (default: SALES_DATA_ARCHIVE_BATCH_SIZE)')
+
+    def handle(self, *args, **kwargs):
+        try:
+            before = datetime.strptime(kwargs['before'], '%Y-%m').date()
+        except ValueError:
+            raise CommandError(f"Invalid month: {kwargs['before']}. Use YYYY-MM.")
+        if before > timezone.localdate():
+            raise CommandError("Cannot archive the current or future months.")
+
+        summary = archive_orders(before, batch_size=kwargs['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {summary['orders']} orders from {summary['months']} months before {before:%Y-%m}"
+        ))
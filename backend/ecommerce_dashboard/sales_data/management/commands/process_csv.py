@@ -8,6 +8,7 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         # Argument to accept the file name (e.g., 'amazon.csv')
         parser.add_argument('csv_filename', type=str, help='Name of the CSV file to process')
+        parser.add_argument('--max-rows', type=int, default=500, help='Stop after this many rows (0 for no limit)')
 
     def handle(self, *args, **kwargs):
         csv_filename = kwargs['csv_filename']
@@ -18,8 +19,19 @@ class Command(BaseCommand):
         if os.path.exists(file_path):
             try:
                 with open(file_path, 'rb') as f:
-                    process_csv_file(f)  # Pass the file to the processing function
+                    # Pass the file to the processing function; failed rows go next to the source file
+                    summary = process_csv_file(
+                        f,
+                        reject_path=f"{file_path}.rejects.csv",
+                        max_rows=kwargs['max_rows'] or None,
+                    )
                 self.stdout.write(self.style.SUCCESS(f'Successfully processed {csv_filename}'))
+                self.stdout.write(
+                    f"{summary['rows_ok']} rows imported, {summary['rows_rejected']} rejected "
+                    f"in {summary['elapsed_seconds']}s ({summary['rows_per_second']} rows/s)"
+                )
+                if summary['reject_file']:
+                    self.stdout.write(self.style.WARNING(f"Rejected rows written to {summary['reject_file']}"))
             except Exception as e:
                 self.stdout.write(self.style.ERROR(f"Error processing file: {e}"))
         else:
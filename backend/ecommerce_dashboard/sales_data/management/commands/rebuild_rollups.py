@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from sales_data.caching import bump_data_version
+from sales_data.cohorts import refresh_archived_activity, refresh_customer_activity
+from sales_data.models import DailyPlatformSales, Order
+from sales_data.rollups import refresh_rollups
+
+class Command(BaseCommand):
+    help = 'Rebuilds the pre-aggregated rollup tables and customer activity from the orders table and archive'
+
+    def handle(self, *args, **kwargs):
+        # Months the rebuild can change: those with orders and those the rollups held before
+        months = set(Order.objects.dates('date_of_sale', 'month'))
+        months |= set(DailyPlatformSales.objects.dates('date', 'month'))
+
+        refresh_rollups()
+        refresh_archived_activity()
+        refresh_customer_activity()
+        bump_data_version(months)
+        self.stdout.write(self.style.SUCCESS("Successfully rebuilt rollup tables"))
@@ -1,10 +1,10 @@
 
 from django.core.management.base import BaseCommand
-from sales_data.utils import update_city_state
+from sales_data.utils import update_states
 
 class Command(BaseCommand):
-    help = 'Updates city and state for all deliveries based on delivery address'
+    help = 'Fills state codes of deliveries imported before states were normalised, based on delivery address'
 
     def handle(self, *args, **kwargs):
-        updated_count = update_city_state()
+        updated_count = update_states()
         self.stdout.write(self.style.SUCCESS(f"Successfully updated {updated_count} deliveries"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from sales_data.warmup import warm_dashboard_cache
+
+class Command(BaseCommand):
+    help = 'Computes and caches the popular dashboard requests (recent ranges, first table page per platform)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Requests run at once (default: SALES_DATA_WARMUP_WORKERS)')
+
+    def handle(self, *args, **kwargs):
+        summary = warm_dashboard_cache(workers=kwargs['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {summary['warmed']}/{summary['requests']} dashboard requests in {summary['elapsed_seconds']}s"
+        ))
+        if summary['failed']:
+            self.stdout.write(self.style.WARNING(f"{summary['failed']} requests failed, see the log"))
@@ -0,0 +1,34 @@
+from django.conf import settings
+from .routers import use_primary
+
+# Cookie marking a client that wrote recently and must read from the primary
+PRIMARY_COOKIE = 'sales_data_primary'
+
+
+class PrimaryPinningMiddleware:
+    """
+    Pins writes, and reads from clients that wrote in the last
+    SALES_DATA_PRIMARY_STICKY_SECONDS, to the primary database so they
+    never observe replica lag.
+    """
+
+    UNSAFE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        is_write = request.method in self.UNSAFE_METHODS
+        if not is_write and PRIMARY_COOKIE not in request.COOKIES:
+            return self.get_response(request)
+
+        with use_primary():
+            response = self.get_response(request)
+
+        if is_write and response.status_code < 400:
+            response.set_cookie(
+                PRIMARY_COOKIE, '1',
+                max_age=getattr(settings, 'SALES_DATA_PRIMARY_STICKY_SECONDS', 5),
+                httponly=True, samesite='Lax',
+            )
+        return response
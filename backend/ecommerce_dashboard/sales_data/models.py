@@ -1,16 +1,18 @@
 from django.db import models
+from django.db.models.functions import Upper
 
 # Product Details Model
 class Product(models.Model):
     product_id = models.CharField(max_length=100, unique=True)
     product_name = models.CharField(max_length=255)
     category = models.CharField(max_length=100)
-    price = models.DecimalField(max_digits=10, decimal_places=2)
+    price_cents = models.BigIntegerField()  # money is stored in integer cents
     
     class Meta:
         indexes = [
             models.Index(fields=['product_id']),  # Adds an index to product_id
             models.Index(fields=['category']),  # Adds an index to category
+            models.Index(Upper('product_id'), name='product_product_id_upper_idx'),  # case-insensitive exact search
         ]
 
     def __str__(self):
@@ -26,6 +28,7 @@ class Customer(models.Model):
         indexes = [
             models.Index(fields=['customer_id']),  # Adds an index to customer_id
             models.Index(fields=['contact_email']),  # Adds an index to contact_email
+            models.Index(Upper('customer_id'), name='customer_customer_id_upper_idx'),  # case-insensitive exact search
         ]
 
     def __str__(self):
@@ -41,14 +44,16 @@ class Order(models.Model):
         'Product', related_name='orders', on_delete=models.CASCADE
     )
     quantity_sold = models.IntegerField()
-    total_sale_value = models.DecimalField(max_digits=12, decimal_places=2)
+    total_sale_value_cents = models.BigIntegerField()  # price_cents * quantity_sold
     date_of_sale = models.DateField()
+    row_hash = models.CharField(max_length=64, blank=True, default='')  # content hash of the source CSV row
     
     
     class Meta:
         indexes = [
             models.Index(fields=['date_of_sale']),  # Adds an index to date_of_sale
             models.Index(fields=['date_of_sale', 'quantity_sold']), #Composite index for filtering + aggregation
+            models.Index(Upper('order_id'), name='order_order_id_upper_idx'),  # case-insensitive exact search
         ]
 
 
@@ -62,9 +67,28 @@ class Delivery(models.Model):
     delivery_date = models.DateField()
     delivery_status = models.CharField(max_length=50, choices=[('Delivered', 'Delivered'), ('In Transit', 'In Transit'), ('Cancelled', 'Cancelled')])
     state = models.CharField(max_length=100, blank=True, null=True)
+    state_code = models.ForeignKey(
+        'State', related_name='deliveries', null=True, blank=True, on_delete=models.SET_NULL, db_column='state_code'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['delivery_date']),  # date filters in the admin
+            models.Index(fields=['state']),
+        ]
+
     def __str__(self):
         return f"Delivery for Order {self.order.order_id}"
 
+# State Lookup Model
+# one row per state code parsed from delivery addresses ('State-24' -> 24)
+class State(models.Model):
+    code = models.PositiveIntegerField(primary_key=True)
+    name = models.CharField(max_length=100)
+
+    def __str__(self):
+        return self.name
+
 # Platform Details Model
 #seperated  platform as this table can contain other data related to platform, like mobiletype,version, etc
 class Platform(models.Model):
@@ -73,3 +97,127 @@ class Platform(models.Model):
 
     def __str__(self):
         return self.platform_name
+
+# Daily Platform Sales Rollup
+# one row per sale date and platform, refreshed at ingest so trend charts never scan the orders table
+class DailyPlatformSales(models.Model):
+    date = models.DateField()
+    platform_name = models.CharField(max_length=100)
+    order_count = models.IntegerField(default=0)
+    quantity_sold = models.IntegerField(default=0)
+    total_sales_cents = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'platform_name'], name='unique_daily_platform_sales'),
+        ]
+
+    def __str__(self):
+        return f"{self.platform_name} sales on {self.date}"
+
+# Daily State Sales Rollup
+# one row per sale date and delivery state, refreshed at ingest for the regional breakdown
+class DailyStateSales(models.Model):
+    date = models.DateField()
+    state = models.ForeignKey(State, related_name='daily_sales', on_delete=models.CASCADE)
+    order_count = models.IntegerField(default=0)
+    total_sales_cents = models.BigIntegerField(default=0)
+    delivery_count = models.IntegerField(default=0)
+    delivered_count = models.IntegerField(default=0)
+    cancelled_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'state'], name='unique_daily_state_sales'),
+        ]
+
+    def __str__(self):
+        return f"{self.state} sales on {self.date}"
+
+# Daily Delivery Latency
+# histogram of days from sale to delivery of delivered orders, per sale date, platform ('' for none)
+# and state, refreshed at ingest so latency percentiles merge a few small rows instead of joining deliveries
+class DailyDeliveryLatency(models.Model):
+    date = models.DateField()
+    platform_name = models.CharField(max_length=100, blank=True, default='')
+    state = models.ForeignKey(State, related_name='daily_latency', null=True, blank=True, on_delete=models.CASCADE)
+    delivery_count = models.IntegerField(default=0)
+    histogram = models.BinaryField()  # little-endian uint32 count per day of latency, the last bucket open-ended
+
+    class Meta:
+        # One row per date, platform and state; rows without a state get their own constraint
+        # because NULLs never conflict in a plain unique index
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'platform_name', 'state'], condition=models.Q(state__isnull=False),
+                name='unique_daily_delivery_latency',
+            ),
+            models.UniqueConstraint(
+                fields=['date', 'platform_name'], condition=models.Q(state__isnull=True),
+                name='unique_daily_delivery_latency_no_state',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+
+    def __str__(self):
+        return f"{self.platform_name or 'No platform'} delivery latency on {self.date}"
+
+# Customer Activity
+# first purchase month and a bitmap of the following months with purchases, per customer and
+# platform ('' for all platforms); maintained at ingest for the customers an import touched
+class CustomerActivity(models.Model):
+    customer = models.ForeignKey(Customer, related_name='activity', on_delete=models.CASCADE)
+    platform_name = models.CharField(max_length=100, blank=True, default='')
+    first_month = models.DateField()
+    months = models.BinaryField()  # bit k set: bought in the k-th month after first_month
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'platform_name'], name='unique_customer_activity'),
+        ]
+        indexes = [
+            models.Index(fields=['platform_name', 'first_month']),
+        ]
+
+    def __str__(self):
+        return f"{self.customer_id} since {self.first_month:%Y-%m}"
+
+# Archived Customer Activity
+# the same bitmaps for the months of a customer's archived orders, recorded when they are
+# archived so activity refreshes do not have to read the archive files
+class ArchivedCustomerActivity(models.Model):
+    customer = models.ForeignKey(Customer, related_name='archived_activity', on_delete=models.CASCADE)
+    platform_name = models.CharField(max_length=100, blank=True, default='')
+    first_month = models.DateField()
+    months = models.BinaryField()  # bit k set: bought in the k-th month after first_month
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'platform_name'], name='unique_archived_customer_activity'),
+        ]
+
+    def __str__(self):
+        return f"{self.customer_id} archived since {self.first_month:%Y-%m}"
+
+# Imported File Registry
+# checksum of every fully imported CSV so identical re-sends are skipped outright
+class ImportedFile(models.Model):
+    checksum = models.CharField(max_length=64, unique=True)
+    file_name = models.CharField(max_length=255, blank=True)
+    row_count = models.IntegerField(default=0)
+    imported_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.file_name or self.checksum} ({self.row_count} rows)"
+
+# Data Version Stamps
+# scope is 'all' or a sale month ('YYYY-MM'); bumped by ingestion so caches only expire for changed months
+class DataVersion(models.Model):
+    scope = models.CharField(max_length=7, unique=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.scope} v{self.version}"
@@ -0,0 +1,25 @@
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+# Money is stored and aggregated in integer cents and only turned into amounts at the API edge
+CENT = Decimal('0.01')
+
+
+def to_cents(value):
+    """Exact integer cents of an amount given as a string, int or Decimal, rounded half up to the cent."""
+    try:
+        amount = Decimal(str(value).strip())
+    except InvalidOperation as e:
+        raise ValueError(f"Invalid amount: {value!r}") from e
+    if not amount.is_finite():
+        raise ValueError(f"Invalid amount: {value!r}")
+    return int(amount.quantize(CENT, rounding=ROUND_HALF_UP).scaleb(2))
+
+
+def to_decimal(cents):
+    """Exact Decimal amount of `cents`."""
+    return Decimal(cents).scaleb(-2)
+
+
+def to_amount(cents):
+    """Amount of `cents` as a JSON number; None (an empty sum) is 0."""
+    return cents / 100 if cents else 0.0
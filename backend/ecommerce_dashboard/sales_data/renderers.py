@@ -0,0 +1,67 @@
+import json
+from decimal import Decimal
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.utils.text import compress_string
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, QuerySet):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class _FallbackEncoder(DjangoJSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, (Decimal, QuerySet)):
+            return _default(obj)
+        return super().default(obj)
+
+
+def dumps(data):
+    """
+    Serialize `data` to JSON bytes. Decimals become numbers, dates ISO strings and
+    querysets lists, with orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, cls=_FallbackEncoder, separators=(',', ':')).encode()
+
+
+def fast_json_response(data, status=200, request=None):
+    """
+    JsonResponse replacement for the dashboard views. Bodies larger than
+    SALES_DATA_GZIP_MIN_BYTES are gzipped for clients that accept it.
+    """
+    body = dumps(data)
+    response = HttpResponse(body, status=status, content_type='application/json')
+
+    min_bytes = getattr(settings, 'SALES_DATA_GZIP_MIN_BYTES', 16 * 1024)
+    if request is not None and len(body) >= min_bytes and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response.content = compress_string(body)
+        response['Content-Encoding'] = 'gzip'
+        response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+class FastJSONRenderer(BaseRenderer):
+    """DRF renderer backed by dumps()."""
+
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data)
@@ -0,0 +1,226 @@
+import logging
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from .archive import NO_DELIVERY, NO_STATE, archived_facts, group_totals
+from .latency import LATENCY_BUCKETS, encode_histogram, latency_bucket
+from .models import Delivery, Order, DailyDeliveryLatency, DailyPlatformSales, DailyStateSales
+from .routers import use_primary
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Chunk size for `date__in` filters so large refreshes stay within driver limits
+DATE_CHUNK_SIZE = 500
+
+
+def _archived_totals(dates, keys, values):
+    """group_totals of the archived orders sold on `dates` (on any date when None)."""
+    facts = archived_facts(columns=keys + values, dates=dates)
+    if facts is None:
+        return {}
+    return group_totals([facts[key] for key in keys], [facts[value] for value in values])
+
+
+def _date_chunks(dates):
+    dates = sorted(set(dates))
+    for i in range(0, len(dates), DATE_CHUNK_SIZE):
+        yield dates[i:i + DATE_CHUNK_SIZE]
+
+
+def refresh_platform_sales(dates=None):
+    """
+    Recompute DailyPlatformSales rows for the given sale dates.
+
+    Args:
+        dates: Iterable of dates to refresh. Rebuilds the whole rollup when None.
+    """
+    if dates is None:
+        with transaction.atomic():
+            DailyPlatformSales.objects.all().delete()
+            return _build_platform_sales(Order.objects.all(), None)
+
+    created = 0
+    for chunk in _date_chunks(dates):
+        with transaction.atomic():
+            DailyPlatformSales.objects.filter(date__in=chunk).delete()
+            created += _build_platform_sales(Order.objects.filter(date_of_sale__in=chunk), chunk)
+    return created
+
+
+def _build_platform_sales(orders, dates):
+    rows = (
+        orders.filter(platforms__isnull=False)
+        .values('date_of_sale', 'platforms__platform_name')
+        .annotate(
+            order_count=Count('id'),
+            quantity_sold=Sum('quantity_sold'),
+            total_sales_cents=Sum('total_sale_value_cents'),
+        )
+    )
+    totals = {
+        (row['date_of_sale'], row['platforms__platform_name']):
+            (row['order_count'], row['quantity_sold'] or 0, row['total_sales_cents'] or 0)
+        for row in rows
+    }
+    # Archived orders of these dates still count
+    archived = _archived_totals(dates, ('date_of_sale', 'platform_name'), ('quantity_sold', 'total_sale_value_cents'))
+    for key, archived_row in archived.items():
+        if key[1]:
+            totals[key] = tuple(a + b for a, b in zip(totals.get(key, (0, 0, 0)), archived_row))
+
+    objs = [
+        DailyPlatformSales(
+            date=sale_date,
+            platform_name=platform_name,
+            order_count=order_count,
+            quantity_sold=quantity_sold,
+            total_sales_cents=total_sales_cents,
+        )
+        for (sale_date, platform_name), (order_count, quantity_sold, total_sales_cents) in totals.items()
+    ]
+    DailyPlatformSales.objects.bulk_create(objs, batch_size=1000)
+    return len(objs)
+
+
+def refresh_state_sales(dates=None):
+    """
+    Recompute DailyStateSales rows for the given sale dates.
+
+    Args:
+        dates: Iterable of dates to refresh. Rebuilds the whole rollup when None.
+    """
+    if dates is None:
+        with transaction.atomic():
+            DailyStateSales.objects.all().delete()
+            return _build_state_sales(Delivery.objects.all(), None)
+
+    created = 0
+    for chunk in _date_chunks(dates):
+        with transaction.atomic():
+            DailyStateSales.objects.filter(date__in=chunk).delete()
+            created += _build_state_sales(Delivery.objects.filter(order__date_of_sale__in=chunk), chunk)
+    return created
+
+
+def _build_state_sales(deliveries, dates):
+    rows = (
+        deliveries.filter(state_code__isnull=False)
+        .values('order__date_of_sale', 'state_code')
+        .annotate(
+            order_count=Count('order', distinct=True),
+            total_sales_cents=Sum('order__total_sale_value_cents'),
+            delivery_count=Count('id'),
+            delivered_count=Count('id', filter=Q(delivery_status='Delivered')),
+            cancelled_count=Count('id', filter=Q(delivery_status='Cancelled')),
+        )
+        .order_by()
+    )
+    totals = {
+        (row['order__date_of_sale'], row['state_code']): (
+            row['order_count'], row['total_sales_cents'] or 0,
+            row['delivery_count'], row['delivered_count'], row['cancelled_count'],
+        )
+        for row in rows
+    }
+    # Archived orders of these dates still count
+    archived = _archived_totals(
+        dates, ('date_of_sale', 'state_code'),
+        ('total_sale_value_cents', 'delivery_count', 'delivered_count', 'cancelled_count'),
+    )
+    for key, archived_row in archived.items():
+        if key[1] != NO_STATE:
+            totals[key] = tuple(a + b for a, b in zip(totals.get(key, (0, 0, 0, 0, 0)), archived_row))
+
+    objs = [
+        DailyStateSales(
+            date=sale_date,
+            state_id=state_code,
+            order_count=order_count,
+            total_sales_cents=total_sales_cents,
+            delivery_count=delivery_count,
+            delivered_count=delivered_count,
+            cancelled_count=cancelled_count,
+        )
+        for (sale_date, state_code), (order_count, total_sales_cents, delivery_count, delivered_count, cancelled_count)
+        in totals.items()
+    ]
+    DailyStateSales.objects.bulk_create(objs, batch_size=1000)
+    return len(objs)
+
+
+def refresh_delivery_latency(dates=None):
+    """
+    Recompute DailyDeliveryLatency rows for the given sale dates.
+
+    Args:
+        dates: Iterable of dates to refresh. Rebuilds the whole rollup when None.
+    """
+    if dates is None:
+        with transaction.atomic():
+            DailyDeliveryLatency.objects.all().delete()
+            return _build_delivery_latency(Delivery.objects.all(), None)
+
+    created = 0
+    for chunk in _date_chunks(dates):
+        with transaction.atomic():
+            DailyDeliveryLatency.objects.filter(date__in=chunk).delete()
+            created += _build_delivery_latency(Delivery.objects.filter(order__date_of_sale__in=chunk), chunk)
+    return created
+
+
+def _build_delivery_latency(deliveries, dates):
+    # Deliveries per latency in days, so the histograms are filled from a few rows per day
+    rows = (
+        deliveries.filter(delivery_status='Delivered')
+        .annotate(latency=ExpressionWrapper(F('delivery_date') - F('order__date_of_sale'), output_field=DurationField()))
+        .values('order__date_of_sale', 'order__platforms__platform_name', 'state_code', 'latency')
+        .annotate(delivery_count=Count('id'))
+        .order_by()
+    )
+    counts = [
+        (row['order__date_of_sale'], row['order__platforms__platform_name'] or '', row['state_code'],
+         row['latency'].days, row['delivery_count'])
+        for row in rows
+    ]
+    # Archived orders of these dates still count
+    archived = _archived_totals(dates, ('date_of_sale', 'platform_name', 'state_code', 'delivery_days'), ())
+    counts.extend(
+        (sale_date, platform_name, None if state_code == NO_STATE else state_code, days, count)
+        for (sale_date, platform_name, state_code, days), (count,) in archived.items()
+        if days != NO_DELIVERY
+    )
+
+    histograms = {}
+    for sale_date, platform_name, state_code, days, count in counts:
+        histogram = histograms.setdefault((sale_date, platform_name, state_code), [0] * LATENCY_BUCKETS)
+        histogram[latency_bucket(days)] += count
+
+    objs = [
+        DailyDeliveryLatency(
+            date=sale_date,
+            platform_name=platform_name,
+            state_id=state_code,
+            delivery_count=sum(histogram),
+            histogram=encode_histogram(histogram),
+        )
+        for (sale_date, platform_name, state_code), histogram in histograms.items()
+    ]
+    DailyDeliveryLatency.objects.bulk_create(objs, batch_size=1000)
+    return len(objs)
+
+
+def refresh_rollups(dates=None):
+    """
+    Refresh every pre-aggregated table for the given sale dates.
+    Ingestion calls this once per run with the dates it touched.
+    """
+    if dates is not None and not dates:
+        return
+    with use_primary():
+        rows = refresh_platform_sales(dates)
+        state_rows = refresh_state_sales(dates)
+        latency_rows = refresh_delivery_latency(dates)
+    logger.info(
+        "Refreshed %s daily platform sales rows, %s daily state sales rows and %s daily delivery latency rows",
+        rows, state_rows, latency_rows,
+    )
@@ -0,0 +1,52 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Set while the current request or task must read its own writes from the primary
+_pinned_to_primary = ContextVar('sales_data_pinned_to_primary', default=False)
+
+
+@contextmanager
+def use_primary():
+    """Route every sales_data read inside the block to the primary database."""
+    token = _pinned_to_primary.set(True)
+    try:
+        yield
+    finally:
+        _pinned_to_primary.reset(token)
+
+
+def read_database():
+    """Alias of the configured read replica, or None when there is none."""
+    alias = getattr(settings, 'SALES_DATA_READ_DATABASE', None)
+    return alias if alias and alias in settings.DATABASES else None
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends sales_data reads to the replica named by SALES_DATA_READ_DATABASE and
+    everything else to the primary. Reads stay on the primary inside use_primary()
+    and inside transactions on the primary, so read-after-write paths see their data.
+    """
+
+    app_label = 'sales_data'
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != self.app_label:
+            return None
+        replica = read_database()
+        if replica is None or _pinned_to_primary.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != self.app_label:
+            return None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, read_database()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
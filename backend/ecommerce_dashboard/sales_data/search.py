@@ -0,0 +1,172 @@
+import base64
+import json
+import logging
+import re
+import threading
+from collections import defaultdict
+from django.db import connections, router
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast, Greatest
+from django.contrib.postgres.search import TrigramSimilarity
+from .caching import data_version_token
+from .models import Customer, Order, Product
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Order fields searched by partial match, all covered by trigram indexes (see indexes.py)
+SEARCH_FIELDS = ('order_id', 'customer__customer_name', 'customer__contact_email', 'product__product_name')
+
+# Whether pg_trgm is installed, per database alias
+_pg_trgm_installed = {}
+
+# In-process fallback index and the data version it was built for
+_ngram_index = None
+_ngram_lock = threading.Lock()
+
+
+def encode_cursor(score, pk):
+    return base64.urlsafe_b64encode(json.dumps([score, pk]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(score, pk) of a cursor returned with a previous page; raises ValueError when malformed."""
+    try:
+        score, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(score), int(pk)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError('Invalid cursor.') from e
+
+
+def search_orders(q, limit=20, cursor=None):
+    """
+    Orders whose ID, customer name, customer email or product name contains `q`
+    (case-insensitive), best trigram similarity first.
+
+    Args:
+        q: Search text.
+        limit: Maximum number of results.
+        cursor: Optional (score, pk) of the last result of the previous page.
+
+    Returns:
+        tuple: ([(score, Order)], next_cursor or None).
+    """
+    alias = router.db_for_read(Order)
+    if _trigram_available(alias):
+        hits = _trigram_search(alias, q, limit + 1, cursor)
+    else:
+        hits = _ngram_search(q, limit + 1, cursor)
+
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        score, pk = hits[-1]
+        next_cursor = encode_cursor(score, pk)
+
+    orders = Order.objects.select_related('customer', 'product').in_bulk([pk for _, pk in hits])
+    return [(score, orders[pk]) for score, pk in hits if pk in orders], next_cursor
+
+
+def _trigram_available(alias):
+    if alias not in _pg_trgm_installed:
+        connection = connections[alias]
+        installed = False
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                installed = cursor.fetchone() is not None
+        _pg_trgm_installed[alias] = installed
+    return _pg_trgm_installed[alias]
+
+
+def _trigram_search(alias, q, limit, cursor):
+    # icontains compiles to UPPER(column::text) LIKE ..., which the GIN indexes serve. An OR
+    # across the joined tables cannot combine them, so every table is searched on its own
+    # indexes and only the union of the matching order ids is joined back for ranking.
+    customers = Customer.objects.using(alias).filter(
+        Q(customer_name__icontains=q) | Q(contact_email__icontains=q)
+    ).values('pk')
+    products = Product.objects.using(alias).filter(product_name__icontains=q).values('pk')
+    candidates = Order.objects.using(alias).filter(order_id__icontains=q).values('pk').union(
+        Order.objects.using(alias).filter(customer__in=customers).values('pk'),
+        Order.objects.using(alias).filter(product__in=products).values('pk'),
+    )
+
+    queryset = Order.objects.using(alias).filter(pk__in=candidates).annotate(
+        score=Cast(Greatest(*(TrigramSimilarity(field, q) for field in SEARCH_FIELDS)), FloatField())
+    )
+    if cursor:
+        score, pk = cursor
+        queryset = queryset.filter(Q(score__lt=score) | Q(score=score, pk__gt=pk))
+    return list(queryset.order_by(F('score').desc(), 'pk').values_list('score', 'pk')[:limit])
+
+
+# In-process fallback
+
+def trigrams(text):
+    """The trigram set pg_trgm compares: lowercased words padded with two leading and one trailing space."""
+    grams = set()
+    for word in re.findall(r'[^\W_]+', text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a, b):
+    """pg_trgm similarity(): shared trigrams over all trigrams of both strings."""
+    a, b = trigrams(a), trigrams(b)
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+class NgramIndex:
+    """
+    Posting lists from every 3-character substring of the searched fields to order ids.
+    Narrows a search to orders containing all of the query's substrings before the
+    substring check and the similarity ranking.
+    """
+
+    def __init__(self, rows):
+        self.documents = {}
+        self.postings = defaultdict(set)
+        for pk, *values in rows:
+            values = [value.lower() for value in values if value]
+            self.documents[pk] = values
+            for value in values:
+                for i in range(len(value) - 2):
+                    self.postings[value[i:i + 3]].add(pk)
+
+    def search(self, q):
+        """[(score, pk)] of the documents containing `q`, best first."""
+        q = q.lower()
+        grams = {q[i:i + 3] for i in range(len(q) - 2)}
+        if grams:
+            candidates = set.intersection(*(self.postings.get(gram, set()) for gram in grams))
+        else:
+            candidates = self.documents.keys()
+
+        hits = []
+        for pk in candidates:
+            values = self.documents[pk]
+            if any(q in value for value in values):
+                hits.append((max(similarity(q, value) for value in values), pk))
+        hits.sort(key=lambda hit: (-hit[0], hit[1]))
+        return hits
+
+
+def get_ngram_index():
+    """The fallback index, rebuilt whenever the data version changes."""
+    global _ngram_index
+    token = data_version_token(None, None)
+    with _ngram_lock:
+        if _ngram_index is None or _ngram_index[0] != token:
+            rows = Order.objects.values_list('pk', *SEARCH_FIELDS).iterator(chunk_size=5000)
+            _ngram_index = (token, NgramIndex(rows))
+            logger.info("Built order search index over %s orders", len(_ngram_index[1].documents))
+        return _ngram_index[1]
+
+
+def _ngram_search(q, limit, cursor):
+    hits = get_ngram_index().search(q)
+    if cursor:
+        hits = [hit for hit in hits if (-hit[0], hit[1]) > (-cursor[0], cursor[1])]
+    return hits[:limit]
@@ -1,23 +1,155 @@
+import re
 from rest_framework import serializers
-from .models import Order, Customer, Delivery, Platform
+from rest_framework.validators import UniqueValidator
+from .models import Order, Customer, Delivery, Platform, State
+from .archive import archived_months
+from .money import to_cents, to_decimal
+from .validation import STATE_PATTERN
+
+
+class MoneyField(serializers.DecimalField):
+    """Decimal amount in the API for a model field holding integer cents."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('max_digits', 14)
+        kwargs.setdefault('decimal_places', 2)
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return super().to_representation(to_decimal(value))
+
+    def to_internal_value(self, data):
+        return to_cents(super().to_internal_value(data))
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key relation that, inside a bulk request, resolves objects from the
+    lookup table BulkListSerializer fills with one query per relation.
+    """
+
+    def to_internal_value(self, data):
+        related = self.context.get('bulk_related', {}).get(self.field_name)
+        if related is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        obj = related.get(str(data))
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    List serializer used by the bulk endpoints. Items are validated one by one so
+    that errors are reported per item instead of failing the whole payload.
+    """
+
+    def validate_items(self):
+        """
+        Returns:
+            tuple: ([(index, validated_data)], [{'index': ..., 'errors': ...}])
+        """
+        items = self.initial_data
+        self._prefetch_related(items)
+
+        # Uniqueness is checked by the bulk view with a single lookup query
+        for field in self.child.fields.values():
+            field.validators = [v for v in field.validators if not isinstance(v, UniqueValidator)]
+
+        valid, errors = [], []
+        for index, item in enumerate(items):
+            try:
+                valid.append((index, self.child.run_validation(item)))
+            except serializers.ValidationError as exc:
+                errors.append({'index': index, 'errors': exc.detail})
+        return valid, errors
+
+    def _prefetch_related(self, items):
+        related = self._context.setdefault('bulk_related', {})
+        for name, field in self.child.fields.items():
+            if not isinstance(field, BulkPrimaryKeyRelatedField) or field.read_only:
+                continue
+            values = {
+                item[name] for item in items
+                if isinstance(item, dict) and isinstance(item.get(name), (int, str)) and not isinstance(item.get(name), bool)
+            }
+            objects = field.get_queryset().in_bulk(_coerce_pks(values))
+            related[name] = {str(pk): obj for pk, obj in objects.items()}
+
+
+def _coerce_pks(values):
+    pks = set()
+    for value in values:
+        try:
+            pks.add(int(value))
+        except (TypeError, ValueError):
+            continue
+    return pks
 
 
 class OrderSerializer(serializers.ModelSerializer):
+    serializer_related_field = BulkPrimaryKeyRelatedField
+    total_sale_value = MoneyField(source='total_sale_value_cents', max_digits=12)
+
     class Meta:
         model = Order
-        fields = '__all__'
+        fields = ('id', 'order_id', 'customer', 'product', 'quantity_sold', 'total_sale_value', 'date_of_sale', 'row_hash')
+        read_only_fields = ('row_hash',)
+        list_serializer_class = BulkListSerializer
+
+    def validate_date_of_sale(self, value):
+        # Orders of archived months live in the archive files and cannot be written again
+        if value.strftime('%Y-%m') in archived_months():
+            raise serializers.ValidationError(f"Sale month {value:%Y-%m} is archived.")
+        return value
 
 class CustomerSerializer(serializers.ModelSerializer):
     class Meta:
         model = Customer
         fields = '__all__'
+        list_serializer_class = BulkListSerializer
 
 class DeliverySerializer(serializers.ModelSerializer):
+    serializer_related_field = BulkPrimaryKeyRelatedField
+
     class Meta:
         model = Delivery
         fields = '__all__'
+        read_only_fields = ('state_code',)
+        list_serializer_class = BulkListSerializer
+
+    def validate(self, attrs):
+        # The state code follows `state` when given, else the delivery address, like CSV imports
+        if attrs.get('state'):
+            match = re.fullmatch(r'\s*(\d+)\s*', attrs['state']) or STATE_PATTERN.search(attrs['state'])
+        elif 'delivery_address' in attrs:
+            match = STATE_PATTERN.search(attrs['delivery_address'])
+        elif 'state' in attrs:
+            match = None
+        else:
+            return attrs
+
+        if match:
+            code = int(match.group(1))
+            attrs['state'] = str(code)
+            attrs['state_code'] = self._state(code)
+        else:
+            attrs['state_code'] = None
+        return attrs
+
+    def _state(self, code):
+        # Created on first use; the items of a bulk request share the lookup through the root context
+        states = self.context.setdefault('delivery_states', {})
+        if code not in states:
+            states[code], _ = State.objects.get_or_create(code=code, defaults={'name': f"State-{code}"})
+        return states[code]
 
 class PlatformSerializer(serializers.ModelSerializer):
+    serializer_related_field = BulkPrimaryKeyRelatedField
+
     class Meta:
         model = Platform
         fields = '__all__'
+        list_serializer_class = BulkListSerializer
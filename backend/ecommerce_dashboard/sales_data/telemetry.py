@@ -0,0 +1,158 @@
+import atexit
+import csv
+import logging
+import queue
+import time
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Listener draining the sales_data log queue, started once per process
+_queue_listener = None
+
+
+def configure_queue_logging(logger_name='sales_data'):
+    """
+    Moves the handlers of `logger_name` behind a QueueHandler so that callers only
+    enqueue records; a background QueueListener does the formatting and I/O.
+    Safe to call more than once.
+    """
+    global _queue_listener
+    if _queue_listener is not None:
+        return _queue_listener
+
+    target = logging.getLogger(logger_name)
+    handlers = [h for h in target.handlers if not isinstance(h, QueueHandler)]
+    if not handlers:
+        return None
+
+    log_queue = queue.SimpleQueue()
+    for handler in handlers:
+        target.removeHandler(handler)
+    target.addHandler(QueueHandler(log_queue))
+
+    _queue_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _queue_listener.start()
+    atexit.register(_queue_listener.stop)
+    return _queue_listener
+
+
+class IngestionTelemetry:
+    """
+    Counters and throttled progress reporting for a CSV import.
+
+    Progress is logged at most once every `report_every_rows` rows or
+    `report_every_seconds` seconds. Rejected rows go to a side-car CSV file
+    (`reject_path`) instead of the log; the file is only created on the first reject.
+    """
+
+    def __init__(self, total_rows=None, reject_path=None, report_every_rows=1000, report_every_seconds=5.0):
+        self.total_rows = total_rows
+        self.reject_path = reject_path
+        self.report_every_rows = report_every_rows
+        self.report_every_seconds = report_every_seconds
+
+        self.rows_processed = 0
+        self.rows_ok = 0
+        self.rows_rejected = 0
+        self.errors = Counter()
+        self.outcomes = Counter()
+        self.batches = 0
+        self.batch_seconds_total = 0.0
+        self.batch_seconds_max = 0.0
+
+        self._started = time.monotonic()
+        self._last_report_time = self._started
+        self._last_report_rows = 0
+        self._reject_file = None
+        self._reject_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def record_batch(self, rows_ok, seconds, **outcomes):
+        """
+        Record a committed batch of `rows_ok` rows that took `seconds` to write.
+        Keyword arguments are added to the outcome counters (e.g. created=10, unchanged=990).
+        """
+        self.outcomes.update(outcomes)
+        self.batches += 1
+        self.batch_seconds_total += seconds
+        self.batch_seconds_max = max(self.batch_seconds_max, seconds)
+        self.rows_ok += rows_ok
+        self.rows_processed += rows_ok
+        self._maybe_report()
+
+    def reject(self, row_number, row, error):
+        """Count a failed row and append it to the reject file."""
+        self.rows_rejected += 1
+        self.rows_processed += 1
+        self.errors[type(error).__name__] += 1
+        self._write_reject(row_number, row, error)
+        self._maybe_report()
+
+    def _write_reject(self, row_number, row, error):
+        if not self.reject_path:
+            return
+        if self._reject_writer is None:
+            self._reject_file = open(self.reject_path, 'w', newline='', encoding='utf-8')
+            self._reject_writer = csv.writer(self._reject_file)
+            self._reject_writer.writerow(['row_number', 'error', *row.keys()])
+        self._reject_writer.writerow([row_number, str(error), *row.values()])
+
+    def _maybe_report(self, force=False):
+        now = time.monotonic()
+        rows_since = self.rows_processed - self._last_report_rows
+        if not force and rows_since < self.report_every_rows and now - self._last_report_time < self.report_every_seconds:
+            return
+
+        interval = now - self._last_report_time
+        logger.info(
+            "Processed %s/%s rows (%.0f rows/s, %s rejected, avg batch %.1f ms)",
+            self.rows_processed,
+            self.total_rows if self.total_rows is not None else '?',
+            rows_since / interval if interval > 0 else 0,
+            self.rows_rejected,
+            self.avg_batch_ms,
+        )
+        self._last_report_time = now
+        self._last_report_rows = self.rows_processed
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self._started
+
+    @property
+    def avg_batch_ms(self):
+        return (self.batch_seconds_total / self.batches) * 1000 if self.batches else 0.0
+
+    def summary(self):
+        """End-of-run summary returned to the management command and the upload API."""
+        elapsed = self.elapsed
+        return {
+            'total_rows': self.total_rows,
+            'rows_processed': self.rows_processed,
+            'rows_ok': self.rows_ok,
+            'rows_rejected': self.rows_rejected,
+            'errors': dict(self.errors),
+            **{name: self.outcomes[name] for name in ('created', 'updated', 'unchanged')},
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(self.rows_processed / elapsed, 1) if elapsed > 0 else 0,
+            'batches': self.batches,
+            'avg_batch_ms': round(self.avg_batch_ms, 2),
+            'max_batch_ms': round(self.batch_seconds_max * 1000, 2),
+            'reject_file': str(self.reject_path) if self._reject_writer is not None else None,
+        }
+
+    def close(self):
+        if self.rows_processed != self._last_report_rows:
+            self._maybe_report(force=True)
+        if self._reject_file is not None:
+            self._reject_file.close()
+            self._reject_file = None
@@ -1,3 +1,970 @@
-from django.test import TestCase
+import csv
+import io
+import logging
+import os
+import random
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import date, timedelta
+from unittest import mock, skipUnless
+from django.contrib.admin import site
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from . import cohorts, latency
+from .admin import EstimatedCountPaginator
+from .archive import archive_orders, archived_monthly_totals, group_totals, merge_totals, read_manifest
+from .budgets import BudgetExceeded, remember, stale, within_budget
+from .caching import bump_data_version, data_version_token
+from .cohorts import activity_bitmap, bitmap_months, refresh_customer_activity, retention_matrix
+from .comparison import comparison_range
+from .facets import facet_counts
+from .latency import LATENCY_BUCKETS, latency_bucket, latency_report, percentile
+from .middleware import PRIMARY_COOKIE, PrimaryPinningMiddleware
+from .models import (
+    Customer, CustomerActivity, DailyPlatformSales, DailyStateSales, Delivery, ImportedFile, Order, Platform, Product,
+    State,
+)
+from .money import to_cents
+from .rollups import refresh_rollups
+from .routers import PrimaryReplicaRouter, use_primary
+from .search import decode_cursor, encode_cursor, similarity, trigrams
+from .telemetry import IngestionTelemetry, configure_queue_logging
+from .utils import parse_row, process_csv_file
+from .validation import validate_batch
+from .warmup import popular_requests, table_views, warm_dashboard_cache
 
-# Create your tests here.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def make_order(order_id, customer, product, day, quantity=1, price_cents=1000, platform='Amazon',
+               status='Delivered', delivered_after=3, state=None):
+    """An order with one delivery and one platform row."""
+    order = Order.objects.create(
+        order_id=order_id, customer=customer, product=product, quantity_sold=quantity,
+        total_sale_value_cents=price_cents * quantity, date_of_sale=day,
+    )
+    if state is not None:
+        State.objects.get_or_create(code=state, defaults={'name': f"State-{state}"})
+    Delivery.objects.create(
+        order=order, delivery_address=f"1 Street, City-1, State-{state}", delivery_status=status,
+        delivery_date=day + timedelta(days=delivered_after), state=state and str(state), state_code_id=state,
+    )
+    Platform.objects.create(order=order, platform_name=platform)
+    return order
+
+
+def make_customer_and_product():
+    customer = Customer.objects.create(customer_id='C0', customer_name='A', contact_email='a@x.com', phone_number='1')
+    product = Product.objects.create(product_id='P1', product_name='P', category='Books', price_cents=1000)
+    return customer, product
+
+
+def csv_row(**overrides):
+    row = {
+        'OrderID': 'ORD1', 'CustomerID': 'C1', 'CustomerName': 'Customer 1', 'ContactEmail': 'c1@example.com',
+        'PhoneNumber': '999', 'ProductID': 'P1', 'ProductName': 'Product 1', 'Category': 'Books',
+        'SellingPrice': '12.50', 'QuantitySold': '2', 'DateOfSale': '2024-01-05',
+        'DeliveryAddress': '1 Street, City-1, State-24', 'DeliveryDate': '2024-01-09',
+        'DeliveryStatus': 'Delivered', 'Platform': 'Amazon',
+    }
+    row.update(overrides)
+    return row
+
+
+def csv_file(rows, name='orders.csv'):
+    """An uploaded-file-like CSV of `rows`."""
+    text = io.StringIO()
+    writer = csv.DictWriter(text, fieldnames=list(csv_row()))
+    writer.writeheader()
+    writer.writerows(rows)
+    upload = io.BytesIO(text.getvalue().encode())
+    upload.name = name
+    return upload
+
+
+class ComparisonRangeTests(SimpleTestCase):
+
+    def test_previous_period_of_a_month_is_the_previous_calendar_month(self):
+        self.assertEqual(
+            comparison_range(date(2023, 3, 1), date(2023, 3, 31), 'previous_period'),
+            (date(2023, 2, 1), date(2023, 2, 28)),
+        )
+
+    def test_previous_period_of_whole_months_shifts_by_their_count(self):
+        self.assertEqual(
+            comparison_range(date(2024, 4, 1), date(2024, 6, 30), 'previous_period'),
+            (date(2024, 1, 1), date(2024, 3, 31)),
+        )
+
+    def test_monthly_buckets_shift_partial_ranges_by_months(self):
+        self.assertEqual(
+            comparison_range(date(2023, 3, 10), date(2023, 5, 31), 'previous_period', by_month=True),
+            (date(2022, 12, 10), date(2023, 2, 28)),
+        )
+
+    def test_previous_period_of_other_ranges_has_the_same_length(self):
+        self.assertEqual(
+            comparison_range(date(2023, 3, 10), date(2023, 3, 19), 'previous_period'),
+            (date(2023, 2, 28), date(2023, 3, 9)),
+        )
+
+    def test_previous_year_of_a_leap_day(self):
+        self.assertEqual(
+            comparison_range(date(2024, 2, 1), date(2024, 2, 29), 'previous_year'),
+            (date(2023, 2, 1), date(2023, 2, 28)),
+        )
+
+
+class ValidationTests(TestCase):
+
+    def test_prices_round_half_up_like_to_cents(self):
+        prices = ['0.125', '1.005', '2.675', '10', '10.5', ' 7.10 ', '1e2', '-1.005', '.5']
+        batch = [(i, csv_row(OrderID=f"ORD{i}", SellingPrice=price)) for i, price in enumerate(prices)]
+        clean, rejects = validate_batch(batch)
+        self.assertEqual(rejects, [])
+        self.assertEqual([record['price_cents'] for _, _, record in clean], [to_cents(price) for price in prices])
+        self.assertEqual([record['price_cents'] for _, _, record in clean][:2], [13, 101])
+
+    def test_clean_records_match_parse_row(self):
+        batch = [
+            (1, csv_row()),
+            (2, csv_row(OrderID='ORD2', SellingPrice='0.125', QuantitySold='3', DeliveryAddress='No state')),
+            (3, csv_row(OrderID='ORD3', DateOfSale='2024-02-29', Platform='Meesho', DeliveryStatus='Cancelled')),
+        ]
+        clean, rejects = validate_batch(batch)
+        self.assertEqual(rejects, [])
+        for _, row, record in clean:
+            self.assertEqual(record, parse_row(row))
+
+    def test_invalid_rows_are_rejected_with_every_problem(self):
+        batch = [
+            (1, csv_row(SellingPrice='abc', QuantitySold='x')),
+            (2, csv_row(DateOfSale='2024-13-01')),
+            (3, csv_row(Platform='eBay')),
+            (4, csv_row(DeliveryStatus='Lost')),
+            (5, csv_row(SellingPrice='nan')),
+        ]
+        clean, rejects = validate_batch(batch)
+        self.assertEqual(clean, [])
+        self.assertEqual([row_number for row_number, _, _ in rejects], [1, 2, 3, 4, 5])
+        self.assertIn('SellingPrice', str(rejects[0][2]))
+        self.assertIn('QuantitySold', str(rejects[0][2]))
+
+    def test_out_of_range_numbers_only_reject_their_rows(self):
+        batch = [
+            (1, csv_row(QuantitySold='99999999999999999999999')),
+            (2, csv_row(QuantitySold='3000000000')),
+            (3, csv_row(SellingPrice='900000000000000', QuantitySold='2000000')),
+            (4, csv_row(OrderID='ORD4')),
+        ]
+        for numpy in (np, None):
+            with self.subTest(numpy=numpy is not None), mock.patch('sales_data.validation.np', numpy):
+                clean, rejects = validate_batch(batch)
+                self.assertEqual([row_number for row_number, _, _ in clean], [4])
+                self.assertEqual([row_number for row_number, _, _ in rejects], [1, 2, 3])
+                self.assertIn('QuantitySold', str(rejects[0][2]))
+                self.assertIn('too large', str(rejects[2][2]))
+
+    @skipUnless(np, "numpy is not installed")
+    def test_row_by_row_path_agrees(self):
+        batch = [(i, csv_row(OrderID=f"ORD{i}", SellingPrice=price)) for i, price in enumerate(['0.125', '3', 'x'])]
+        clean, rejects = validate_batch(batch)
+        with mock.patch('sales_data.validation.np', None):
+            fallback_clean, fallback_rejects = validate_batch(batch)
+        self.assertEqual(clean, fallback_clean)
+        self.assertEqual([r[0] for r in rejects], [r[0] for r in fallback_rejects])
+
+
+@override_settings(SALES_DATA_WARMUP_AFTER_IMPORT=False)
+class ImportTests(TestCase):
+
+    def rows(self, count=3, **overrides):
+        return [csv_row(OrderID=f"ORD{i}", **overrides) for i in range(count)]
+
+    def test_reimporting_a_file_is_skipped(self):
+        self.assertEqual(process_csv_file(csv_file(self.rows()))['created'], 3)
+        summary = process_csv_file(csv_file(self.rows()))
+        self.assertTrue(summary['skipped'])
+        self.assertEqual(summary['total_rows'], 0)
+
+    def test_a_row_cap_above_the_file_size_still_registers_it(self):
+        process_csv_file(csv_file(self.rows()), max_rows=500)
+        self.assertEqual(ImportedFile.objects.count(), 1)
+        self.assertTrue(process_csv_file(csv_file(self.rows()), max_rows=500)['skipped'])
+
+    def test_a_file_cut_by_the_row_cap_is_imported_again(self):
+        summary = process_csv_file(csv_file(self.rows()), max_rows=2)
+        self.assertEqual((summary['created'], ImportedFile.objects.count()), (2, 0))
+        summary = process_csv_file(csv_file(self.rows()))
+        self.assertEqual((summary['skipped'], summary['created'], summary['unchanged']), (False, 1, 2))
+
+    def test_only_changed_rows_are_written(self):
+        process_csv_file(csv_file(self.rows()))
+        rows = self.rows()
+        rows[1]['QuantitySold'] = '7'
+        summary = process_csv_file(csv_file(rows))
+        self.assertEqual((summary['created'], summary['updated'], summary['unchanged']), (0, 1, 2))
+        self.assertEqual(Order.objects.get(order_id='ORD1').total_sale_value_cents, 7 * 1250)
+
+    def test_files_with_rejects_are_not_registered(self):
+        rows = self.rows()
+        rows[2]['Platform'] = 'eBay'
+        summary = process_csv_file(csv_file(rows))
+        self.assertEqual((summary['rows_rejected'], ImportedFile.objects.count()), (1, 0))
+
+
+class LatencyTests(TestCase):
+
+    def test_percentile_is_nearest_rank(self):
+        counts = [0, 2, 1, 1] + [0] * (LATENCY_BUCKETS - 4)
+        self.assertEqual(percentile(counts, 50), 1)
+        self.assertEqual(percentile(counts, 75), 2)
+        self.assertEqual(percentile(counts, 90), 3)
+        self.assertEqual(percentile(counts, 99), 3)
+
+    def test_percentile_of_an_empty_histogram(self):
+        self.assertIsNone(percentile([0] * LATENCY_BUCKETS, 50))
+
+    def test_latency_bucket_is_clamped(self):
+        self.assertEqual(latency_bucket(-2), 0)
+        self.assertEqual(latency_bucket(5), 5)
+        self.assertEqual(latency_bucket(400), LATENCY_BUCKETS - 1)
+
+    def test_report_matches_the_deliveries(self):
+        customer, product = make_customer_and_product()
+        latencies = [(1, 'Amazon'), (2, 'Amazon'), (9, 'Amazon'), (4, 'Meesho'), (120, 'Meesho')]
+        for i, (days, platform) in enumerate(latencies):
+            make_order(
+                f"ORD{i}", customer, product, date(2024, 1, 10), platform=platform, delivered_after=days, state=24
+            )
+        make_order('ORD9', customer, product, date(2024, 1, 10), status='Cancelled', delivered_after=1, state=24)
+        refresh_rollups()
+
+        report = latency_report(date(2024, 1, 1), date(2024, 1, 31), group_by=('platform',))
+        self.assertEqual(report, [
+            {'platform': 'Amazon', 'deliveries': 3, 'p50_days': 2, 'p90_days': 9, 'p99_days': 9},
+            {'platform': 'Meesho', 'deliveries': 2, 'p50_days': 4, 'p90_days': 90, 'p99_days': 90},
+        ])
+        with mock.patch.object(latency, 'np', None):
+            self.assertEqual(latency_report(date(2024, 1, 1), date(2024, 1, 31), group_by=('platform',)), report)
+
+
+class CohortTests(TestCase):
+
+    def test_bitmap_round_trip(self):
+        months = [date(2023, 1, 1), date(2023, 2, 1), date(2024, 3, 1)]
+        self.assertEqual(bitmap_months(date(2023, 1, 1), activity_bitmap(date(2023, 1, 1), months)), months)
+        self.assertEqual(activity_bitmap(date(2023, 1, 1), [date(2023, 1, 1), date(2023, 9, 1)]), b'\x01\x01')
+
+    @skipUnless(np, "numpy is not installed")
+    def test_numpy_and_python_counts_agree(self):
+        rng = random.Random(7)
+        span = 14
+        cohorts_ = sorted(rng.randrange(span) for _ in range(200))
+        # Bitmaps both shorter and longer than the span
+        bitmaps = [(rng.getrandbits(rng.randrange(1, 24)) | 1).to_bytes(3, 'little').rstrip(b'\0') for _ in cohorts_]
+        sizes, active = cohorts._count_active(np.array(cohorts_, dtype=np.int64), bitmaps, span)
+        python_sizes, python_active = cohorts._count_active_python(cohorts_, bitmaps, span)
+        self.assertEqual(sizes.tolist(), python_sizes)
+        self.assertEqual(active.tolist(), python_active)
+
+    def test_retention_matrix(self):
+        _, product = make_customer_and_product()
+        purchases = {
+            'C1': [(date(2023, 1, 5), 'Amazon'), (date(2023, 2, 7), 'Amazon'), (date(2023, 3, 1), 'Meesho')],
+            'C2': [(date(2023, 1, 20), 'Meesho'), (date(2023, 3, 9), 'Meesho')],
+            'C3': [(date(2023, 2, 2), 'Amazon')],
+        }
+        for customer_id, orders in purchases.items():
+            customer = Customer.objects.create(
+                customer_id=customer_id, customer_name=customer_id, contact_email='c@x.com', phone_number='1'
+            )
+            for i, (day, platform) in enumerate(orders):
+                make_order(f"{customer_id}-{i}", customer, product, day, platform=platform)
+        refresh_customer_activity()
+
+        matrix = retention_matrix(date(2023, 1, 1), date(2023, 3, 1))
+        self.assertEqual(
+            [(row['cohort'], row['customers'], [m['customers'] for m in row['retention']]) for row in matrix],
+            [('2023-01', 2, [2, 1, 2]), ('2023-02', 1, [1, 0])],
+        )
+        amazon = retention_matrix(date(2023, 1, 1), date(2023, 3, 1), platform='Amazon')
+        self.assertEqual([(row['cohort'], row['customers']) for row in amazon], [('2023-01', 1), ('2023-02', 1)])
+        with mock.patch.object(cohorts, 'np', None):
+            self.assertEqual(retention_matrix(date(2023, 1, 1), date(2023, 3, 1)), matrix)
+
+
+@skipUnless(np, "numpy is not installed")
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(SALES_DATA_ARCHIVE_DIR=directory, SALES_DATA_ARCHIVE_BATCH_SIZE=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.customer, self.product = make_customer_and_product()
+        for i, (day, quantity, platform) in enumerate([
+            (date(2023, 1, 3), 1, 'Amazon'), (date(2023, 1, 3), 2, 'Meesho'), (date(2023, 1, 28), 3, 'Amazon'),
+            (date(2023, 2, 14), 4, 'Amazon'),
+        ]):
+            make_order(f"ORD{i}", self.customer, self.product, day, quantity=quantity, platform=platform, state=24)
+        refresh_rollups()
+        refresh_customer_activity()
+
+    def rollups(self):
+        return sorted(DailyPlatformSales.objects.values_list(
+            'date', 'platform_name', 'order_count', 'quantity_sold', 'total_sales_cents'
+        ))
+
+    def activity(self):
+        return sorted(
+            (customer_id, platform_name, first_month, bytes(months))
+            for customer_id, platform_name, first_month, months in CustomerActivity.objects.values_list(
+                'customer_id', 'platform_name', 'first_month', 'months'
+            )
+        )
+
+    def test_group_totals(self):
+        keys = [np.array([1, 1, 2, 1]), np.array(['a', 'b', 'a', 'a'])]
+        totals = group_totals(keys, [np.array([10, 20, 30, 40])])
+        self.assertEqual(totals, {(1, 'a'): (2, 50), (1, 'b'): (1, 20), (2, 'a'): (1, 30)})
+        self.assertEqual(group_totals([np.array([], dtype=np.int64)]), {})
+
+        days = np.array(['2023-01-03', '2023-01-03'], dtype='datetime64[D]')
+        self.assertEqual(group_totals([days]), {(date(2023, 1, 3),): (2,)})
+        self.assertEqual(merge_totals({'a': 1}, {'a': 2, 'b': 3}), {'a': 3, 'b': 3})
+
+    def test_archiving_keeps_totals(self):
+        rollups, activity = self.rollups(), self.activity()
+        summary = archive_orders(date(2023, 2, 1))
+
+        self.assertEqual(summary, {'months': 1, 'orders': 3})
+        self.assertEqual(list(Order.objects.values_list('order_id', flat=True)), ['ORD3'])
+        self.assertEqual(
+            archived_monthly_totals(date(2023, 1, 1), date(2023, 12, 31), 'quantity_sold'), {date(2023, 1, 1): 6}
+        )
+        self.assertEqual(self.rollups(), rollups)
+
+        refresh_rollups()
+        refresh_customer_activity()
+        self.assertEqual(self.rollups(), rollups)
+        self.assertEqual(self.activity(), activity)
+
+    def test_archiving_a_month_again_merges_its_file(self):
+        archive_orders(date(2023, 2, 1))
+        first_file = read_manifest()['months']['2023-01']['file']
+        make_order('ORD9', self.customer, self.product, date(2023, 1, 9), quantity=5)
+        refresh_rollups([date(2023, 1, 9)])
+        rollups = self.rollups()
+
+        self.assertEqual(archive_orders(date(2023, 2, 1)), {'months': 1, 'orders': 1})
+        entry = read_manifest()['months']['2023-01']
+        self.assertEqual(entry['rows'], 4)
+        self.assertNotEqual(entry['file'], first_file)
+        self.assertEqual(
+            archived_monthly_totals(date(2023, 1, 1), date(2023, 1, 31), 'quantity_sold'), {date(2023, 1, 1): 11}
+        )
+        self.assertEqual(self.rollups(), rollups)
+
+
+@contextmanager
+def over_budget(name):
+    raise BudgetExceeded(f"{name} is over budget")
+    yield
+
+
+class BudgetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_within_budget(self):
+        self.assertEqual(within_budget('test', lambda: 1, lambda: 2), 1)
+        with mock.patch('sales_data.budgets.query_budget', over_budget):
+            self.assertEqual(within_budget('test', lambda: 1, lambda: None, lambda: 2), 2)
+            with self.assertRaises(BudgetExceeded):
+                within_budget('test', lambda: 1, lambda: None)
+
+    def test_stale_copy(self):
+        self.assertIsNone(stale('key'))
+        remember('key', {'data': [1]})
+        self.assertEqual(stale('key'), {'data': [1], 'stale': True})
+
+    def test_table_serves_last_good_page_after_data_changed(self):
+        customer, product = make_customer_and_product()
+        make_order('ORD1', customer, product, date(2024, 1, 5))
+        url = '/api/table/?start_date=2024-01-01&end_date=2024-01-31'
+        fresh = self.client.get(url).json()
+        self.assertEqual([row['order_id'] for row in fresh['data']], ['ORD1'])
+
+        bump_data_version([date(2024, 1, 5)])
+        with mock.patch('sales_data.budgets.query_budget', over_budget):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {**fresh, 'stale': True})
+
+    def test_table_without_a_last_good_page_is_busy(self):
+        with mock.patch('sales_data.budgets.query_budget', over_budget):
+            response = self.client.get('/api/table/?start_date=2024-01-01&end_date=2024-01-31')
+        self.assertEqual(response.status_code, 503)
+
+
+class DataVersionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.customer, self.product = make_customer_and_product()
+        self.order = make_order('ORD1', self.customer, self.product, date(2024, 1, 5))
+        refresh_rollups()
+
+    def tokens(self):
+        return (
+            data_version_token(), data_version_token('2024-01-01', '2024-01-31'),
+            data_version_token('2024-02-01', '2024-02-29'),
+        )
+
+    def test_rebuild_rollups_bumps_rebuilt_months(self):
+        before = self.tokens()
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        after = self.tokens()
+        self.assertNotEqual(after[0], before[0])
+        self.assertNotEqual(after[1], before[1])
+        self.assertEqual(after[2], before[2])
+
+    def test_admin_writes_refresh_rollups_and_bump_versions(self):
+        request = RequestFactory().post('/admin/')
+        order_admin = site._registry[Order]
+
+        before = self.tokens()
+        self.order.quantity_sold = 5
+        order_admin.save_model(request, self.order, None, True)
+        after = self.tokens()
+        self.assertEqual(DailyPlatformSales.objects.get().quantity_sold, 5)
+        self.assertNotEqual(after[1], before[1])
+        self.assertEqual(after[2], before[2])
+
+        order_admin.delete_model(request, self.order)
+        self.assertFalse(DailyPlatformSales.objects.exists())
+        self.assertNotEqual(self.tokens()[1], after[1])
+
+    def test_admin_dimension_edit_bumps_every_month(self):
+        before = self.tokens()
+        self.product.product_name = 'Renamed'
+        site._registry[Product].save_model(RequestFactory().post('/admin/'), self.product, None, True)
+        after = self.tokens()
+        self.assertNotEqual(after[1], before[1])
+        self.assertNotEqual(after[2], before[2])
+
+
+class WarmupTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_table_views_match_the_ui_default(self):
+        # FilterableTable opens on 2023-06-01 to the end of the current month, in local dates
+        self.assertEqual(
+            table_views(date(2024, 2, 10)),
+            [{'start_date': '2023-06-01', 'end_date': '2024-02-29', 'page': 1, 'limit': 10}],
+        )
+
+    def test_popular_requests_cover_each_platform(self):
+        table_urls = [url for url in popular_requests(date(2024, 2, 10)) if url.startswith('/api/table/')]
+        self.assertEqual(table_urls, [
+            '/api/table/?start_date=2023-06-01&end_date=2024-02-29&page=1&limit=10',
+            *(
+                f"/api/table/?start_date=2023-06-01&end_date=2024-02-29&page=1&limit=10&platform={platform}"
+                for platform in ('Flipkart', 'Amazon', 'Meesho')
+            ),
+        ])
+
+    def test_warmed_table_is_served_from_cache(self):
+        url = '/api/table/?start_date=2023-06-01&end_date=2024-02-29&page=1&limit=10'
+        self.assertEqual(warm_dashboard_cache([url], workers=1)['warmed'], 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+
+class FacetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        customer, product = make_customer_and_product()
+        for i, (day, platform, status, state) in enumerate([
+            (date(2024, 1, 5), 'Amazon', 'Delivered', 24), (date(2024, 1, 6), 'Amazon', 'Cancelled', 24),
+            (date(2024, 1, 7), 'Meesho', 'Delivered', 7), (date(2024, 3, 1), 'Flipkart', 'Delivered', 7),
+        ]):
+            make_order(f"ORD{i}", customer, product, day, platform=platform, status=status, state=state)
+
+    def counts(self, **params):
+        params = {'start_date': '2024-01-01', 'end_date': '2024-01-31', **params}
+        response = self.client.get('/api/table/facets/', params)
+        return {
+            facet: {entry['value']: entry['count'] for entry in entries}
+            for facet, entries in response.json()['data'].items()
+        }
+
+    def test_counts_under_the_date_range(self):
+        self.assertEqual(self.counts(), {
+            'category': {'Books': 3},
+            'delivery_status': {'Delivered': 2, 'Cancelled': 1},
+            'platform': {'Amazon': 2, 'Meesho': 1},
+            'state': {'24': 2, '7': 1},
+        })
+
+    def test_each_facet_ignores_its_own_filter(self):
+        counts = self.counts(platform='Amazon', delivery_status='Delivered')
+        self.assertEqual(counts['platform'], {'Amazon': 1, 'Meesho': 1})
+        self.assertEqual(counts['delivery_status'], {'Delivered': 1, 'Cancelled': 1})
+        self.assertEqual(counts['state'], {'24': 1})
+        self.assertEqual(counts['category'], {'Books': 1})
+
+    def test_filters_outside_the_facets_apply_to_all(self):
+        self.assertEqual(
+            facet_counts({'date_of_sale__gte': '2024-03-01'})['platform'], [{'value': 'Flipkart', 'count': 1}]
+        )
+
+
+class ConditionalRequestTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        customer, product = make_customer_and_product()
+        self.order = make_order('ORD1', customer, product, date(2024, 1, 5))
+
+    def test_unchanged_data_is_not_modified(self):
+        url = '/api/table/?start_date=2024-01-01&end_date=2024-01-31'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+        # Other months keep their ETag, the changed month gets a new one
+        bump_data_version([date(2024, 2, 1)])
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+        bump_data_version([date(2024, 1, 9)])
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_viewset_reads_are_conditional(self):
+        url = f"/api/orders/{self.order.pk}/"
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+    def test_writes_ignore_preconditions(self):
+        response = self.client.patch(
+            f"/api/orders/{self.order.pk}/", {'quantity_sold': 4}, content_type='application/json',
+            headers={'If-Match': '"stale"'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.quantity_sold, 4)
+
+
+class BulkWriteTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.customer, self.product = make_customer_and_product()
+
+    def bulk(self, method, resource, items):
+        return getattr(self.client, method)(f"/api/{resource}/bulk/", items, content_type='application/json')
+
+    def customer_item(self, customer_id, **fields):
+        return {
+            'customer_id': customer_id, 'customer_name': 'B', 'contact_email': 'b@x.com', 'phone_number': '2',
+            **fields,
+        }
+
+    def test_create_upsert_and_partial_update(self):
+        items = [self.customer_item('C1'), self.customer_item('C2', contact_email='bad')]
+        response = self.bulk('post', 'customers', items)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [1])
+
+        items = [self.customer_item('C1', customer_name='Renamed'), self.customer_item('C3')]
+        response = self.bulk('put', 'customers', items)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['created'], response.json()['updated']), (1, 1))
+        self.assertEqual(Customer.objects.get(customer_id='C1').customer_name, 'Renamed')
+
+        response = self.bulk('patch', 'customers', [{'customer_id': 'C3', 'phone_number': '3'}, {'customer_id': 'C9'}])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()['errors'], [{'index': 1, 'errors': {'customer_id': ['Not found.']}}])
+        self.assertEqual(Customer.objects.get(customer_id='C3').phone_number, '3')
+
+    def test_partial_update_refreshes_rollups(self):
+        order = make_order('ORD1', self.customer, self.product, date(2024, 1, 5))
+        refresh_rollups()
+        response = self.bulk('patch', 'orders', [{'order_id': 'ORD1', 'quantity_sold': 4}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(DailyPlatformSales.objects.get(date=order.date_of_sale).quantity_sold, 4)
+
+    def test_status_only_update(self):
+        orders = [make_order(f"ORD{i}", self.customer, self.product, date(2024, 1, 5), state=24) for i in range(2)]
+        refresh_rollups()
+        response = self.bulk('patch', 'deliveries', [
+            {'order': orders[0].pk, 'delivery_status': 'Cancelled'},
+            {'order': 999999, 'delivery_status': 'Cancelled'},
+            {'order': orders[1].pk, 'delivery_status': 'Lost'},
+            {'order': 'x', 'delivery_status': 'Cancelled'},
+        ])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()['updated'], 1)
+        self.assertEqual(response.json()['errors'], [
+            {'index': 1, 'errors': {'order': ['Not found.']}},
+            {'index': 2, 'errors': {'delivery_status': ['"Lost" is not a valid choice.']}},
+            {'index': 3, 'errors': {'order': ['A valid value is required.']}},
+        ])
+        self.assertEqual(
+            list(Delivery.objects.order_by('order_id').values_list('delivery_status', flat=True)),
+            ['Cancelled', 'Delivered'],
+        )
+        self.assertEqual(DailyStateSales.objects.get().cancelled_count, 1)
+
+    def test_status_only_update_runs_a_fixed_number_of_queries(self):
+        # Throughput check: nothing in the write path runs per item, so larger payloads
+        # only grow the parameters of the same statements
+        orders = [make_order(f"ORD{i}", self.customer, self.product, date(2024, 1, 5)) for i in range(40)]
+
+        def queries(count):
+            items = [{'order': order.pk, 'delivery_status': 'In Transit'} for order in orders[:count]]
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.bulk('patch', 'deliveries', items).status_code, 200)
+            return len(context.captured_queries)
+
+        # The first write also creates the data version rows
+        queries(4)
+        self.assertEqual(queries(40), queries(4))
+
+
+class PlatformTrendTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        customer, product = make_customer_and_product()
+        for i, (day, quantity, platform) in enumerate([
+            (date(2024, 1, 5), 3, 'Amazon'), (date(2024, 1, 20), 1, 'Meesho'), (date(2024, 2, 2), 2, 'Amazon'),
+        ]):
+            make_order(f"ORD{i}", customer, product, day, quantity=quantity, platform=platform)
+        refresh_rollups()
+
+    def test_monthly_shares(self):
+        response = self.client.get('/api/orderbyplatform', {'start_date': '2024-01-01', 'end_date': '2024-02-29'})
+        self.assertEqual(
+            [(row['period'], row['platform'], row['order_count'], row['normalized_sales_percentage'])
+             for row in response.json()['data']],
+            [('2024-01', 'Amazon', 1, 75.0), ('2024-01', 'Meesho', 1, 25.0), ('2024-02', 'Amazon', 1, 100.0)],
+        )
+
+    def test_platform_filter_keeps_shares_of_all_platforms(self):
+        response = self.client.get('/api/orderbyplatform', {'platform': 'meesho', 'granularity': 'day'})
+        self.assertEqual(
+            [(row['period'], row['normalized_sales_percentage']) for row in response.json()['data']],
+            [('2024-01-20', 100.0)],
+        )
+        response = self.client.get('/api/orderbyplatform', {'platform': 'amazon', 'end_date': '2024-01-31'})
+        self.assertEqual([row['normalized_sales_percentage'] for row in response.json()['data']], [75.0])
+
+    def test_invalid_granularity(self):
+        self.assertEqual(self.client.get('/api/orderbyplatform', {'granularity': 'year'}).status_code, 400)
+
+    def test_rebuild_matches_incremental_refresh(self):
+        rollups = sorted(DailyPlatformSales.objects.values_list(
+            'date', 'platform_name', 'order_count', 'quantity_sold', 'total_sales_cents'
+        ))
+        DailyPlatformSales.objects.all().delete()
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual(sorted(DailyPlatformSales.objects.values_list(
+            'date', 'platform_name', 'order_count', 'quantity_sold', 'total_sales_cents'
+        )), rollups)
+
+
+class TelemetryTests(SimpleTestCase):
+
+    def test_summary_counts_batches_and_rejects(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        reject_path = f"{directory}/orders.rejects.csv"
+
+        with IngestionTelemetry(total_rows=5, reject_path=reject_path) as telemetry:
+            telemetry.record_batch(3, 0.002, created=2, unchanged=1)
+            telemetry.reject(4, {'OrderID': 'ORD4'}, ValueError('invalid QuantitySold'))
+            telemetry.record_batch(1, 0.004, updated=1)
+        summary = telemetry.summary()
+
+        self.assertEqual(
+            {key: summary[key] for key in ('rows_processed', 'rows_ok', 'rows_rejected', 'errors', 'batches')},
+            {'rows_processed': 5, 'rows_ok': 4, 'rows_rejected': 1, 'errors': {'ValueError': 1}, 'batches': 2},
+        )
+        self.assertEqual((summary['created'], summary['updated'], summary['unchanged']), (2, 1, 1))
+        self.assertEqual((summary['avg_batch_ms'], summary['max_batch_ms']), (3.0, 4.0))
+        self.assertEqual(summary['reject_file'], reject_path)
+        with open(reject_path, newline='') as f:
+            self.assertEqual(
+                list(csv.reader(f)), [['row_number', 'error', 'OrderID'], ['4', 'invalid QuantitySold', 'ORD4']]
+            )
+
+    def test_reject_file_is_only_created_on_the_first_reject(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with IngestionTelemetry(reject_path=f"{directory}/orders.rejects.csv") as telemetry:
+            telemetry.record_batch(2, 0.001)
+        self.assertIsNone(telemetry.summary()['reject_file'])
+        self.assertFalse(os.listdir(directory))
+
+    def test_progress_is_throttled(self):
+        with self.assertLogs('sales_data.telemetry', level='INFO') as logs:
+            with IngestionTelemetry(total_rows=2500, report_every_rows=1000, report_every_seconds=3600) as telemetry:
+                for _ in range(25):
+                    telemetry.record_batch(100, 0.001)
+        # Every 1000 rows, plus the final count on close
+        self.assertEqual([message.split(' (')[0] for message in logs.output], [
+            'INFO:sales_data.telemetry:Processed 1000/2500 rows',
+            'INFO:sales_data.telemetry:Processed 2000/2500 rows',
+            'INFO:sales_data.telemetry:Processed 2500/2500 rows',
+        ])
+
+    def test_queue_logging_hands_records_to_the_original_handlers(self):
+        target = logging.getLogger('sales_data_queue_test')
+        stream = io.StringIO()
+        target.addHandler(logging.StreamHandler(stream))
+        target.setLevel(logging.INFO)
+        self.addCleanup(lambda: [target.removeHandler(handler) for handler in list(target.handlers)])
+
+        # The listener is stopped here rather than at exit
+        with mock.patch('sales_data.telemetry._queue_listener', None), mock.patch('sales_data.telemetry.atexit'):
+            listener = configure_queue_logging('sales_data_queue_test')
+            target.info('queued')
+            listener.stop()
+        self.assertEqual([type(handler).__name__ for handler in target.handlers], ['QueueHandler'])
+        self.assertEqual(stream.getvalue(), 'queued\n')
+
+
+@mock.patch('sales_data.routers.read_database', return_value='replica')
+class ReplicaRouterTests(SimpleTestCase):
+
+    router = PrimaryReplicaRouter()
+
+    def test_reads_go_to_the_replica(self, read_database):
+        self.assertEqual(self.router.db_for_read(Order), 'replica')
+        self.assertEqual(self.router.db_for_write(Order), 'default')
+        # Other apps are left to the default routing
+        self.assertIsNone(self.router.db_for_read(Session))
+
+    def test_reads_stay_on_the_primary_when_pinned(self, read_database):
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Order), 'default')
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(Order), 'default')
+        read_database.return_value = None
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+
+    def test_writes_pin_the_client_to_the_primary(self, read_database):
+        databases = []
+
+        def get_response(request):
+            databases.append(self.router.db_for_read(Order))
+            return HttpResponse()
+
+        middleware = PrimaryPinningMiddleware(get_response)
+        factory = RequestFactory()
+        response = middleware(factory.post('/api/orders/'))
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+
+        middleware(factory.get('/api/table/'))
+        pinned = factory.get('/api/table/')
+        pinned.COOKIES[PRIMARY_COOKIE] = '1'
+        middleware(pinned)
+        self.assertEqual(databases, ['default', 'replica', 'default'])
+
+
+class AdminTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        customer, product = make_customer_and_product()
+        for i in range(3):
+            make_order(f"ORD{i}", customer, product, date(2024, 1, 5), state=24 if i else 7)
+
+    def postgresql(self, table_estimate):
+        """Pretend the orders live on PostgreSQL whose statistics hold `table_estimate` rows."""
+        database = mock.MagicMock(vendor='postgresql')
+        database.cursor.return_value.__enter__.return_value.fetchone.return_value = (table_estimate,)
+        return mock.patch('sales_data.admin.connections', {'default': database})
+
+    def test_small_tables_are_counted_exactly(self):
+        self.assertEqual(EstimatedCountPaginator(Order.objects.order_by('pk'), 10).count, 3)
+        with self.postgresql(2):
+            self.assertEqual(EstimatedCountPaginator(Order.objects.order_by('pk'), 10).count, 3)
+
+    @override_settings(SALES_DATA_ADMIN_EXACT_COUNT_BELOW=100)
+    def test_large_tables_are_estimated(self):
+        with self.postgresql(50000):
+            self.assertEqual(EstimatedCountPaginator(Order.objects.order_by('pk'), 10).count, 50000)
+        with self.postgresql(50000), mock.patch('sales_data.admin.estimated_count', return_value=2000) as estimate:
+            paginator = EstimatedCountPaginator(Order.objects.filter(quantity_sold__gt=0).order_by('pk'), 10)
+            self.assertEqual(paginator.count, 2000)
+            estimate.assert_called_once()
+        # Never-analyzed tables report -1
+        with self.postgresql(-1):
+            self.assertEqual(EstimatedCountPaginator(Order.objects.order_by('pk'), 10).count, 3)
+
+    def test_changelists(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@x.com', 'password'))
+        self.assertEqual(self.client.get('/admin/sales_data/order/', {'q': 'ORD1'}).status_code, 200)
+        response = self.client.get('/admin/sales_data/delivery/', {'state': '24'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 2)
+        self.assertEqual(
+            [choice['display'] for choice in response.context['cl'].filter_specs[-1].choices(response.context['cl'])],
+            ['All', '7', '24'],
+        )
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # The fallback index is keyed on the data version, which restarts with every test
+        index_patch = mock.patch('sales_data.search._ngram_index', None)
+        index_patch.start()
+        self.addCleanup(index_patch.stop)
+
+        product = Product.objects.create(product_id='P1', product_name='Desk Lamp', category='Home', price_cents=1000)
+        for i, name in enumerate(['Alice', 'Alicia Keys', 'Malice', 'Bob']):
+            customer = Customer.objects.create(
+                customer_id=f"C{i}", customer_name=name, contact_email=f"c{i}@x.com", phone_number='1',
+            )
+            make_order(f"ORD{i}", customer, product, date(2024, 1, 5))
+
+    def search(self, **params):
+        return self.client.get('/api/orders/search/', params)
+
+    def test_trigrams_match_pg_trgm(self):
+        self.assertEqual(trigrams('Ab'), {'  a', ' ab', 'ab '})
+        self.assertEqual(similarity('word', 'WORD'), 1.0)
+        self.assertEqual(similarity('word', 'two words'), 4 / 11)
+        self.assertEqual(similarity('', 'word'), 0.0)
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor(0.5, 12)), (0.5, 12))
+        with self.assertRaises(ValueError):
+            decode_cursor('not-a-cursor')
+
+    def test_matches_are_ranked_by_similarity(self):
+        results = self.search(q='alic').json()['results']
+        self.assertEqual(
+            [(row['customer_name'], row['score']) for row in results],
+            [('Alice', round(4 / 7, 4)), ('Alicia Keys', round(4 / 13, 4)), ('Malice', 0.2)],
+        )
+        self.assertEqual([row['order_id'] for row in self.search(q='desk').json()['results']], [
+            'ORD0', 'ORD1', 'ORD2', 'ORD3',
+        ])
+
+    def test_cursor_pages_through_every_match_once(self):
+        seen, cursor = [], None
+        while True:
+            params = {'q': 'lamp', 'limit': 3, **({'cursor': cursor} if cursor else {})}
+            page = self.search(**params).json()
+            seen.extend(row['order_id'] for row in page['results'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, ['ORD0', 'ORD1', 'ORD2', 'ORD3'])
+
+    def test_new_orders_are_found_after_the_data_changes(self):
+        self.assertEqual(self.search(q='ORD9').json()['results'], [])
+        make_order('ORD9', Customer.objects.get(customer_id='C3'), Product.objects.get(), date(2024, 1, 6))
+        bump_data_version([date(2024, 1, 6)])
+        self.assertEqual([row['order_id'] for row in self.search(q='ord9').json()['results']], ['ORD9'])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.search(q='a').status_code, 400)
+        self.assertEqual(self.search(q='alice', cursor='x').status_code, 400)
+
+
+class StateSalesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.customer, self.product = make_customer_and_product()
+
+    def test_sales_by_state(self):
+        for i, (day, quantity, status, state) in enumerate([
+            (date(2024, 1, 5), 1, 'Delivered', 24), (date(2024, 1, 6), 2, 'Cancelled', 24),
+            (date(2024, 1, 7), 5, 'Delivered', 7), (date(2024, 3, 1), 9, 'Delivered', 24),
+        ]):
+            make_order(f"ORD{i}", self.customer, self.product, day, quantity=quantity, status=status, state=state)
+        refresh_rollups()
+
+        response = self.client.get('/api/sales/by-state/', {'start_date': '2024-01-01', 'end_date': '2024-01-31'})
+        self.assertEqual(response.json()['data'], [
+            {
+                'state_code': 7, 'state': 'State-7', 'total_revenue': 50.0, 'total_orders': 1,
+                'delivery_success_rate': 100.0, 'cancellations': 0, 'canceled_order_percentage': 0.0,
+            },
+            {
+                'state_code': 24, 'state': 'State-24', 'total_revenue': 30.0, 'total_orders': 2,
+                'delivery_success_rate': 50.0, 'cancellations': 1, 'canceled_order_percentage': 50.0,
+            },
+        ])
+        self.assertEqual(self.client.get('/api/sales/by-state/', {'start_date': 'x'}).status_code, 400)
+
+    def test_api_writes_fill_state_codes(self):
+        orders = [
+            Order.objects.create(
+                order_id=f"ORD{i}", customer=self.customer, product=self.product, quantity_sold=1,
+                total_sale_value_cents=1000, date_of_sale=date(2024, 1, 5),
+            )
+            for i in range(2)
+        ]
+        delivery = {'delivery_status': 'Delivered', 'delivery_date': '2024-01-09'}
+        response = self.client.post('/api/deliveries/', {
+            **delivery, 'order': orders[0].pk, 'delivery_address': '1 Street, City-1, State-24',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/deliveries/bulk/', [{
+            **delivery, 'order': orders[1].pk, 'delivery_address': 'Nowhere', 'state': 'State-07',
+        }], content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            sorted(Delivery.objects.values_list('state', 'state_code_id')), [('24', 24), ('7', 7)]
+        )
+        self.assertEqual(sorted(DailyStateSales.objects.values_list('state_id', 'order_count')), [(7, 1), (24, 1)])
+
+        # A new address moves the delivery to its state
+        self.client.patch(
+            f"/api/deliveries/{Delivery.objects.get(order=orders[0]).pk}/",
+            {'delivery_address': '2 Street, City-2, State-3'}, content_type='application/json',
+        )
+        self.assertEqual(Delivery.objects.get(order=orders[0]).state_code_id, 3)
+
+    def test_update_state_backfills_old_deliveries(self):
+        make_order('ORD1', self.customer, self.product, date(2024, 1, 5))
+        Delivery.objects.update(delivery_address='1 Street, City-1, State-24')
+        call_command('update_state', stdout=io.StringIO())
+        self.assertEqual(list(Delivery.objects.values_list('state', 'state_code_id')), [('24', 24)])
+        self.assertEqual(list(DailyStateSales.objects.values_list('state_id', 'order_count')), [(24, 1)])
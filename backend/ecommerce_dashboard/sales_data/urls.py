@@ -1,5 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .conditional import conditional_on_data_version
 from .views import OrderViewSet, CustomerViewSet, DeliveryViewSet, PlatformViewSet, UploadCSVView,Dashboard,OrdersAndSalesByPlatformAPIView,TopSellingProductsAPIView
 
 router = DefaultRouter()
@@ -21,13 +22,21 @@ class DashboardView:
     def filterable_data_table(self, request):
         return Dashboard().filterable_data_table(request)
 
+    def table_facets(self, request):
+        return Dashboard().table_facets(request)
+
+    def sales_by_state(self, request):
+        return Dashboard().sales_by_state(request)
+
 urlpatterns = [
     path('api/', include(router.urls)),
     path('api/upload-csv/', UploadCSVView.as_view(), name='upload_csv'),
-    path('api/sales/monthly/', DashboardView().monthly_sales_volume, name='monthly_sales_volume'),
-    path('api/revenue/monthly/', DashboardView().monthly_revenue, name='monthly_revenue'),
-    path('api/summary/', DashboardView().summary_metrics, name='summary_metrics'),
-    path('api/table/', DashboardView().filterable_data_table, name='filterable_data_table'),
+    path('api/sales/monthly/', conditional_on_data_version(DashboardView().monthly_sales_volume), name='monthly_sales_volume'),
+    path('api/revenue/monthly/', conditional_on_data_version(DashboardView().monthly_revenue), name='monthly_revenue'),
+    path('api/summary/', conditional_on_data_version(DashboardView().summary_metrics), name='summary_metrics'),
+    path('api/table/', conditional_on_data_version(DashboardView().filterable_data_table), name='filterable_data_table'),
+    path('api/table/facets/', conditional_on_data_version(DashboardView().table_facets), name='table_facets'),
+    path('api/sales/by-state/', conditional_on_data_version(DashboardView().sales_by_state), name='sales_by_state'),
     path('api/orderbyplatform',OrdersAndSalesByPlatformAPIView.as_view(),name="orders_sales_by_platform"),
     path('api/topsp',TopSellingProductsAPIView.as_view(),name="topsp")
 ]
@@ -1,98 +1,125 @@
 import csv
+import hashlib
+import os
 import re
 import logging
+import time
 from datetime import datetime
+from itertools import islice
+from django.conf import settings
 from django.db import transaction, IntegrityError
-from .models import Customer, Product, Order, Delivery, Platform
+from .models import Customer, Product, Order, Delivery, Platform, ImportedFile, State
+from .money import to_cents
+from .archive import archived_months
+from .caching import bump_data_version
+from .cohorts import refresh_customer_activity
+from .rollups import refresh_rollups
+from .routers import use_primary
+from .telemetry import IngestionTelemetry
+from .validation import STATE_PATTERN, validate_batch
+from .warmup import warm_dashboard_cache
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-def process_csv_file(csv_file):
+# Number of CSV rows written per transaction
+BATCH_SIZE = 1000
+
+# Columns whose content defines a row's hash; a re-sent row with the same hash is skipped
+ROW_HASH_COLUMNS = (
+    'OrderID', 'CustomerID', 'ProductID', 'SellingPrice', 'QuantitySold', 'DateOfSale',
+    'DeliveryAddress', 'DeliveryDate', 'DeliveryStatus', 'Platform',
+)
+
+
+def process_csv_file(csv_file, reject_path=None, max_rows=None):
     """
-    Processes a CSV file, performs database operations, and logs the process.
-    
+    Incrementally imports a CSV file in batches and reports progress through
+    IngestionTelemetry. Files already imported (by checksum) are skipped, and rows
+    whose content hash is unchanged are not written again.
+
     Args:
         csv_file: The CSV file to be processed.
+        reject_path: Optional path of a side-car CSV file receiving rows that failed.
+        max_rows: Optional cap on the number of rows processed.
+
+    Returns:
+        dict: The end-of-run telemetry summary.
     """
 
     # Log the start time
     logger.info("Started processing CSV file at %s", datetime.now())
 
+    # Ingestion reads its own writes, so it never reads from the replica
+    with use_primary():
+        return _process_csv_file(csv_file, reject_path, max_rows)
+
+
+def _process_csv_file(csv_file, reject_path, max_rows):
     try:
+        content = csv_file.read()
+        checksum = hashlib.sha256(content).hexdigest()
+        file_name = os.path.basename(getattr(csv_file, 'name', '') or '')
+
+        # Identical files are skipped outright
+        if ImportedFile.objects.filter(checksum=checksum).exists():
+            logger.info("Skipping %s: a file with checksum %s was already imported", file_name, checksum)
+            return {**IngestionTelemetry(total_rows=0).summary(), 'skipped': True}
+
         # Decode the file and parse it
-        decoded_file = csv_file.read().decode('utf-8').splitlines()
+        decoded_file = content.decode('utf-8').splitlines()
         csv_reader = csv.DictReader(decoded_file)
         total_rows = sum(1 for row in decoded_file) - 1  # Subtract 1 for header row
+        if max_rows:
+            total_rows = min(total_rows, max_rows)
+        touched_dates = set()
+        touched_customers = set()
+
+        with IngestionTelemetry(total_rows=total_rows, reject_path=reject_path) as telemetry:
+            rows = islice(enumerate(csv_reader, start=1), max_rows or None)
+            for batch in _batches(rows, BATCH_SIZE):
+                started = time.monotonic()
+                try:
+                    with transaction.atomic():
+                        result = import_batch(batch)
+                except Exception:
+                    # Retry row by row so one bad row does not reject the whole batch
+                    result = _import_rows_individually(batch)
+
+                for row_number, row, error in result['rejects']:
+                    telemetry.reject(row_number, row, error)
+                telemetry.record_batch(
+                    len(batch) - len(result['rejects']),
+                    time.monotonic() - started,
+                    created=result['created'],
+                    updated=result['updated'],
+                    unchanged=result['unchanged'],
+                )
+                touched_dates |= result['dates']
+                touched_customers |= result['customers']
+
+            # Refresh pre-aggregates and cache stamps only for the sale dates and customers that changed
+            refresh_rollups(touched_dates)
+            refresh_customer_activity(touched_customers)
+            bump_data_version(touched_dates)
+
+        summary = {**telemetry.summary(), 'skipped': False}
 
-        for current_row, row in enumerate(csv_reader, start=1):
-            # Log the progress
-            logger.info(f"Processing row {current_row}/{total_rows}: {row}")
-
-            try:
-                # Start a transaction for this individual row to handle errors separately
-                with transaction.atomic():
-                    # Create or get Customer
-                    customer, _ = Customer.objects.get_or_create(
-                        customer_id=row['CustomerID'],
-                        defaults={
-                            'customer_name': row['CustomerName'],
-                            'contact_email': row['ContactEmail'],
-                            'phone_number': row['PhoneNumber'],
-                        }
-                    )
-
-                    # Create or get Product
-                    product, _ = Product.objects.get_or_create(
-                        product_id=row['ProductID'],
-                        defaults={
-                            'product_name': row['ProductName'],
-                            'category': row['Category'],
-                            'price': float(row['SellingPrice']),
-                        }
-                    )
-
-                    # Create Order
-                    order = Order.objects.create(
-                        order_id=row['OrderID'],
-                        product=product,
-                        customer=customer,
-                        quantity_sold=int(row['QuantitySold']),
-                        total_sale_value=float(row['SellingPrice']) * int(row['QuantitySold']),
-                        date_of_sale=datetime.strptime(row['DateOfSale'], '%Y-%m-%d').date(),
-                    )
-                    
-                    # Extract state number using regex
-                    state_match = re.search(r'State-(\d+)', row['DeliveryAddress'])
-                    state_number = int(state_match.group(1)) if state_match else None
-
-                    # Create Delivery
-                    Delivery.objects.create(
-                        order=order,
-                        delivery_address=row['DeliveryAddress'],
-                        delivery_date=datetime.strptime(row['DeliveryDate'], '%Y-%m-%d').date(),
-                        delivery_status=row['DeliveryStatus'],
-                        state=state_number
-                    )
-
-                    # Create Platform
-                    Platform.objects.create(
-                        order=order,
-                        platform_name=row['Platform'],
-                    )
-
-            except Exception as e:
-                # Log any error that occurs and continue with the next row
-                logger.error(f"Error processing row {current_row}: {str(e)}. Skipping this row.")
-                continue  # Skip this row and continue with the next row
-
-            # Stop execution after processing 2000 rows
-            if current_row >= 500:
-                logger.info("Processed 500 rows, stopping further execution.")
-                break  # Exit the loop after processing 2000 rows
+        # Register the file only once every row made it in, so a re-run retries the rejects;
+        # a row cap only prevents it when the file had rows past the cap
+        fully_read = next(csv_reader, None) is None
+        if not summary['rows_rejected'] and fully_read:
+            ImportedFile.objects.get_or_create(
+                checksum=checksum, defaults={'file_name': file_name, 'row_count': total_rows}
+            )
+
+        # Recompute the popular dashboard requests before users ask for them
+        if touched_dates and getattr(settings, 'SALES_DATA_WARMUP_AFTER_IMPORT', False):
+            summary['cache_warmup'] = warm_dashboard_cache()
 
         # Log the successful completion
-        logger.info("Finished processing CSV file at %s", datetime.now())
+        logger.info("Finished processing CSV file at %s: %s", datetime.now(), summary)
+        return summary
 
     except Exception as e:
         # Log any errors that occur during the overall process
@@ -100,29 +127,243 @@ def process_csv_file(csv_file):
         raise e  # Re-raise the error if needed for further handling
 
 
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _import_rows_individually(batch):
+    result = {'created': 0, 'updated': 0, 'unchanged': 0, 'dates': set(), 'customers': set(), 'rejects': []}
+    for item in batch:
+        try:
+            with transaction.atomic():
+                row_result = import_batch([item])
+        except Exception as e:
+            result['rejects'].append((item[0], item[1], e))
+            continue
+        for key in ('created', 'updated', 'unchanged'):
+            result[key] += row_result[key]
+        result['dates'] |= row_result['dates']
+        result['customers'] |= row_result['customers']
+        result['rejects'] += row_result['rejects']
+    return result
+
+
+def row_hash(row):
+    """Content hash of the columns of a CSV row that end up in the database."""
+    return hashlib.sha256('\x1f'.join(row.get(col) or '' for col in ROW_HASH_COLUMNS).encode()).hexdigest()
+
+
+def parse_row(row):
+    """Converts one CSV row into typed values, raising ValueError/KeyError on bad input."""
+    # Extract state number using regex
+    state_match = re.search(r'State-(\d+)', row['DeliveryAddress'])
+    price_cents = to_cents(row['SellingPrice'])
+    quantity_sold = int(row['QuantitySold'])
+
+    return {
+        'order_id': row['OrderID'],
+        'customer_id': row['CustomerID'],
+        'product_id': row['ProductID'],
+        'price_cents': price_cents,
+        'quantity_sold': quantity_sold,
+        'total_sale_value_cents': price_cents * quantity_sold,
+        'date_of_sale': datetime.strptime(row['DateOfSale'], '%Y-%m-%d').date(),
+        'delivery_address': row['DeliveryAddress'],
+        'delivery_date': datetime.strptime(row['DeliveryDate'], '%Y-%m-%d').date(),
+        'delivery_status': row['DeliveryStatus'],
+        'state': int(state_match.group(1)) if state_match else None,
+        'platform_name': row['Platform'],
+        'row_hash': row_hash(row),
+    }
+
+
+def import_batch(batch):
+    """
+    Upserts a batch of CSV rows with a constant number of queries.
+
+    Args:
+        batch: List of (row_number, row) tuples.
+
+    Returns:
+        dict: created/updated/unchanged counts, the affected sale dates and customer
+        pks, and the rejected (row_number, row, error) tuples.
+    """
+    result = {'created': 0, 'updated': 0, 'unchanged': 0, 'dates': set(), 'customers': set(), 'rejects': []}
+
+    # Validate and coerce the batch column by column; later rows win when an export repeats an order
+    clean, result['rejects'] = validate_batch(batch)
+
+    # Orders of archived months live in the archive files; inserting them again would count them twice
+    archived = archived_months()
+    if archived:
+        in_archive = [item for item in clean if item[2]['date_of_sale'].strftime('%Y-%m') in archived]
+        result['rejects'] += [
+            (row_number, row, ValueError(f"sale month {record['date_of_sale']:%Y-%m} is archived"))
+            for row_number, row, record in in_archive
+        ]
+        clean = [item for item in clean if item[2]['date_of_sale'].strftime('%Y-%m') not in archived]
+    records = {record['order_id']: (row, record) for _, row, record in clean}
+
+    # One lookup for the orders we already have
+    existing = {
+        order.order_id: order
+        for order in Order.objects.filter(order_id__in=records.keys()).only('id', 'order_id', 'row_hash', 'date_of_sale', 'customer_id')
+    }
+    changed = {}
+    for order_id, (row, record) in records.items():
+        order = existing.get(order_id)
+        if order is not None and order.row_hash == record['row_hash']:
+            result['unchanged'] += 1
+        else:
+            changed[order_id] = (row, record)
+    if not changed:
+        return result
+
+    customers = _get_or_create_customers(row for row, _ in changed.values())
+    products = _get_or_create_products(changed.values())
+    _get_or_create_states(record['state'] for _, record in changed.values())
+
+    # Upsert orders on their natural key
+    order_fields = ['customer', 'product', 'quantity_sold', 'total_sale_value_cents', 'date_of_sale', 'row_hash']
+    orders = [
+        Order(
+            order_id=order_id,
+            customer=customers[record['customer_id']],
+            product=products[record['product_id']],
+            quantity_sold=record['quantity_sold'],
+            total_sale_value_cents=record['total_sale_value_cents'],
+            date_of_sale=record['date_of_sale'],
+            row_hash=record['row_hash'],
+        )
+        for order_id, (_, record) in changed.items()
+    ]
+    Order.objects.bulk_create(orders, update_conflicts=True, unique_fields=['order_id'], update_fields=order_fields)
+    if any(order.pk is None for order in orders):
+        # Backends that cannot return ids from an upsert
+        ids = dict(Order.objects.filter(order_id__in=changed.keys()).values_list('order_id', 'id'))
+        for order in orders:
+            order.pk = ids[order.order_id]
+    orders = {order.order_id: order for order in orders}
+
+    # Deliveries and platforms have no natural key; update the ones that exist, create the rest
+    updated_ids = [orders[order_id].pk for order_id in changed if order_id in existing]
+    deliveries = {d.order_id: d for d in Delivery.objects.filter(order_id__in=updated_ids)}
+    platforms = {p.order_id: p for p in Platform.objects.filter(order_id__in=updated_ids)}
+
+    new_deliveries, new_platforms = [], []
+    for order_id, (_, record) in changed.items():
+        order = orders[order_id]
+
+        delivery = deliveries.get(order.pk) or Delivery(order=order)
+        delivery.delivery_address = record['delivery_address']
+        delivery.delivery_date = record['delivery_date']
+        delivery.delivery_status = record['delivery_status']
+        delivery.state = record['state']
+        delivery.state_code_id = record['state']
+        if delivery.pk is None:
+            new_deliveries.append(delivery)
+
+        platform = platforms.get(order.pk) or Platform(order=order)
+        platform.platform_name = record['platform_name']
+        if platform.pk is None:
+            new_platforms.append(platform)
+
+        result['dates'].add(record['date_of_sale'])
+        result['customers'].add(order.customer_id)
+        if order_id in existing:
+            result['dates'].add(existing[order_id].date_of_sale)
+            result['customers'].add(existing[order_id].customer_id)
+            result['updated'] += 1
+        else:
+            result['created'] += 1
 
-#  Function to extract city and state from the delivery address
-def extract_city_state(address):
-    # Assuming the format '262 Street, City-62, State-24'
-    match = re.match(r".*,\s*(?P<city>[\w\s]+)-\d{1,3},\s*(?P<state>[\w\s]+)-\d{1,3}$", address.strip())
-    if match:
-        return match.group('city'), match.group('state')
-    return None, None  # Return None if no match found
+    Delivery.objects.bulk_create(new_deliveries)
+    Delivery.objects.bulk_update(
+        deliveries.values(), ['delivery_address', 'delivery_date', 'delivery_status', 'state', 'state_code']
+    )
+    Platform.objects.bulk_create(new_platforms)
+    Platform.objects.bulk_update(platforms.values(), ['platform_name'])
 
-# Function to update city and state for all deliveries
-def update_city_state():
-    deliveries = Delivery.objects.all()
+    return result
+
+
+def _get_or_create_customers(rows):
+    """Return {customer_id: Customer}, creating the missing ones in bulk."""
+    rows = {row['CustomerID']: row for row in rows}
+    customers = Customer.objects.in_bulk(rows.keys(), field_name='customer_id')
+    missing = [
+        Customer(
+            customer_id=customer_id,
+            customer_name=row['CustomerName'],
+            contact_email=row['ContactEmail'],
+            phone_number=row['PhoneNumber'],
+        )
+        for customer_id, row in rows.items() if customer_id not in customers
+    ]
+    if missing:
+        Customer.objects.bulk_create(missing, ignore_conflicts=True)
+        customers = Customer.objects.in_bulk(rows.keys(), field_name='customer_id')
+    return customers
+
+
+def _get_or_create_products(items):
+    """Return {product_id: Product}, creating the missing ones in bulk from (row, record) pairs."""
+    rows = {row['ProductID']: (row, record) for row, record in items}
+    products = Product.objects.in_bulk(rows.keys(), field_name='product_id')
+    missing = [
+        Product(
+            product_id=product_id,
+            product_name=row['ProductName'],
+            category=row['Category'],
+            price_cents=record['price_cents'],
+        )
+        for product_id, (row, record) in rows.items() if product_id not in products
+    ]
+    if missing:
+        Product.objects.bulk_create(missing, ignore_conflicts=True)
+        products = Product.objects.in_bulk(rows.keys(), field_name='product_id')
+    return products
+
+
+def _get_or_create_states(codes):
+    """Make sure a State row exists for every state code in `codes`."""
+    codes = {code for code in codes if code is not None}
+    missing = codes - set(State.objects.filter(code__in=codes).values_list('code', flat=True))
+    if missing:
+        State.objects.bulk_create([State(code=code, name=f"State-{code}") for code in missing], ignore_conflicts=True)
+
+
+def update_states(batch_size=BATCH_SIZE):
+    """
+    Fills `state` and `state_code` of deliveries imported before state codes existed,
+    parsing them from the delivery address, and refreshes the rollups of their sale dates.
+
+    Returns:
+        int: Number of deliveries updated.
+    """
     updated_count = 0
-    
-    # Using a transaction to ensure atomicity
-    with transaction.atomic():
-        for delivery in deliveries:
-            if not delivery.city or not delivery.state:  # Only update if empty
-                city, state = extract_city_state(delivery.delivery_address)
-                if city and state:
-                    delivery.city = city
-                    delivery.state = state
-                    delivery.save()
-                    updated_count += 1
-    
-    return updated_count  # Return number of records updated
+    touched_dates = set()
+    with use_primary():
+        pending = Delivery.objects.filter(state_code__isnull=True).select_related('order').only(
+            'id', 'delivery_address', 'state', 'order', 'order__date_of_sale'
+        )
+        last_id = 0
+        while batch := list(pending.filter(id__gt=last_id).order_by('id')[:batch_size]):
+            last_id = batch[-1].id
+            changed = []
+            for delivery in batch:
+                match = STATE_PATTERN.search(delivery.delivery_address)
+                if match:
+                    delivery.state = delivery.state_code_id = int(match.group(1))
+                    changed.append(delivery)
+                    touched_dates.add(delivery.order.date_of_sale)
+            with transaction.atomic():
+                _get_or_create_states(delivery.state_code_id for delivery in changed)
+                Delivery.objects.bulk_update(changed, ['state', 'state_code'])
+            updated_count += len(changed)
+
+        refresh_rollups(touched_dates)
+        bump_data_version(touched_dates)
+    return updated_count
@@ -0,0 +1,193 @@
+import re
+from .models import Delivery, Platform
+from .money import to_cents
+
+try:
+    import numpy as np
+except ImportError:  # validate row by row without numpy
+    np = None
+
+# Precompiled once; extracts the state number from addresses like '262 Street, City-62, State-24'
+STATE_PATTERN = re.compile(r'State-(\d+)')
+
+PLATFORMS = tuple(value for value, _ in Platform._meta.get_field('platform_name').choices)
+DELIVERY_STATUSES = tuple(value for value, _ in Delivery._meta.get_field('delivery_status').choices)
+
+# Largest values the Order columns hold: quantity_sold is an IntegerField, the total a BigIntegerField
+MAX_QUANTITY = 2**31 - 1
+MAX_TOTAL_CENTS = 2**63 - 1
+TOTAL_OVERFLOW = "SellingPrice times QuantitySold is too large"
+
+# Columns every row needs, besides the customer/product details read when creating them
+REQUIRED_COLUMNS = (
+    'OrderID', 'CustomerID', 'ProductID', 'SellingPrice', 'QuantitySold', 'DateOfSale',
+    'DeliveryAddress', 'DeliveryDate', 'DeliveryStatus', 'Platform',
+)
+
+
+def validate_batch(batch):
+    """
+    Coerces a batch of CSV rows column by column: prices through exact digit parsing into
+    cents, quantities through numeric conversion with error masks, ISO dates through datetime64 parsing, and platforms and
+    delivery statuses against the model choices. Every problem of a row is reported at once.
+
+    Args:
+        batch: List of (row_number, row) tuples.
+
+    Returns:
+        tuple: The clean (row_number, row, record) tuples, with records shaped like
+        utils.parse_row(), and the rejected (row_number, row, error) tuples.
+    """
+    if np is None:
+        return _validate_rows(batch)
+    if not batch:
+        return [], []
+
+    rows = [row for _, row in batch]
+    problems = [[] for _ in rows]
+
+    columns = {}
+    for name in REQUIRED_COLUMNS:
+        values = [row.get(name) for row in rows]
+        for i in (i for i, value in enumerate(values) if value is None):
+            problems[i].append(f"missing {name}")
+        columns[name] = np.array([value or '' for value in values], dtype=str)
+
+    price_cents, bad_prices = _to_cents(columns['SellingPrice'])
+    quantities, bad_quantities = _to_numeric(columns['QuantitySold'], np.int64)
+    bad_quantities |= np.abs(quantities) > MAX_QUANTITY
+    sale_dates, bad_sale_dates = _to_dates(columns['DateOfSale'])
+    delivery_dates, bad_delivery_dates = _to_dates(columns['DeliveryDate'])
+    bad_platforms = ~np.isin(columns['Platform'], PLATFORMS)
+    bad_statuses = ~np.isin(columns['DeliveryStatus'], DELIVERY_STATUSES)
+
+    for name, invalid in (
+        ('SellingPrice', bad_prices),
+        ('QuantitySold', bad_quantities),
+        ('DateOfSale', bad_sale_dates),
+        ('DeliveryDate', bad_delivery_dates),
+        ('Platform', bad_platforms),
+        ('DeliveryStatus', bad_statuses),
+    ):
+        for i in np.flatnonzero(invalid).tolist():
+            value = str(columns[name][i])
+            if value or f"missing {name}" not in problems[i]:
+                problems[i].append(f"invalid {name} {value!r}")
+
+    # The int64 product wraps around silently, so totals past the column's range are caught before it
+    overflows = ~(bad_prices | bad_quantities) & (
+        np.abs(price_cents) > MAX_TOTAL_CENTS // np.maximum(np.abs(quantities), 1)
+    )
+    for i in np.flatnonzero(overflows).tolist():
+        problems[i].append(TOTAL_OVERFLOW)
+
+    # Imported lazily: utils imports this module
+    from .utils import row_hash
+
+    totals = (price_cents * quantities).tolist()
+    price_cents, quantities = price_cents.tolist(), quantities.tolist()
+    sale_dates, delivery_dates = sale_dates.tolist(), delivery_dates.tolist()
+
+    clean, rejects = [], []
+    for i, (row_number, row) in enumerate(batch):
+        if problems[i]:
+            rejects.append((row_number, row, ValueError('; '.join(problems[i]))))
+            continue
+        state_match = STATE_PATTERN.search(row['DeliveryAddress'])
+        clean.append((row_number, row, {
+            'order_id': row['OrderID'],
+            'customer_id': row['CustomerID'],
+            'product_id': row['ProductID'],
+            'price_cents': price_cents[i],
+            'quantity_sold': quantities[i],
+            'total_sale_value_cents': totals[i],
+            'date_of_sale': sale_dates[i],
+            'delivery_address': row['DeliveryAddress'],
+            'delivery_date': delivery_dates[i],
+            'delivery_status': row['DeliveryStatus'],
+            'state': int(state_match.group(1)) if state_match else None,
+            'platform_name': row['Platform'],
+            'row_hash': row_hash(row),
+        }))
+    return clean, rejects
+
+
+def _to_numeric(values, dtype):
+    """(converted array, invalid mask) of a string column; the whole column converts at once when clean."""
+    try:
+        return values.astype(dtype), np.zeros(len(values), dtype=bool)
+    except (ValueError, OverflowError):
+        pass
+
+    converted = np.zeros(len(values), dtype=dtype)
+    invalid = np.zeros(len(values), dtype=bool)
+    parse = float if dtype is np.float64 else int
+    for i, value in enumerate(values.tolist()):
+        try:
+            converted[i] = parse(value)
+        except (ValueError, OverflowError):
+            invalid[i] = True
+    return converted, invalid
+
+
+def _to_cents(values):
+    """(integer cents array, invalid mask) of a price column, rounded like money.to_cents()."""
+    values = np.char.strip(values)
+    parts = np.char.partition(values, '.')
+    whole, fraction = parts[:, 0], parts[:, 2]
+    # Plain prices with at most two decimals are read digit by digit, without going through floats
+    plain = (
+        np.char.isdecimal(whole) & (np.char.str_len(whole) <= 15)
+        & (np.char.isdecimal(fraction) | (fraction == '')) & (np.char.str_len(fraction) <= 2)
+    )
+    cents = np.zeros(len(values), dtype=np.int64)
+    if plain.any():
+        cents[plain] = whole[plain].astype(np.int64) * 100 + np.char.ljust(fraction[plain], 2, '0').astype(np.int64)
+
+    # Anything else (more decimals, signs, exponents, garbage) goes through the Decimal rounding
+    invalid = np.zeros(len(values), dtype=bool)
+    for i in np.flatnonzero(~plain).tolist():
+        try:
+            cents[i] = to_cents(values[i])
+        except (ValueError, OverflowError):
+            invalid[i] = True
+    return cents, invalid
+
+
+def _to_dates(values):
+    """(datetime64[D] array, invalid mask) of a column of YYYY-MM-DD strings."""
+    # datetime64 also accepts shorter forms such as '2024-01'; only full dates are valid
+    candidates = np.where(np.char.str_len(values) == 10, values, 'NaT')
+    try:
+        dates = candidates.astype('datetime64[D]')
+    except ValueError:
+        dates = np.empty(len(values), dtype='datetime64[D]')
+        for i, value in enumerate(candidates.tolist()):
+            try:
+                dates[i] = np.datetime64(value, 'D')
+            except ValueError:
+                dates[i] = np.datetime64('NaT')
+    return dates, np.isnat(dates)
+
+
+def _validate_rows(batch):
+    from .utils import parse_row
+
+    clean, rejects = [], []
+    for row_number, row in batch:
+        try:
+            record = parse_row(row)
+        except (KeyError, TypeError, ValueError) as e:
+            rejects.append((row_number, row, e))
+            continue
+        if abs(record['quantity_sold']) > MAX_QUANTITY:
+            rejects.append((row_number, row, ValueError(f"invalid QuantitySold {row['QuantitySold']!r}")))
+        elif abs(record['total_sale_value_cents']) > MAX_TOTAL_CENTS:
+            rejects.append((row_number, row, ValueError(TOTAL_OVERFLOW)))
+        elif record['platform_name'] not in PLATFORMS:
+            rejects.append((row_number, row, ValueError(f"invalid Platform {record['platform_name']!r}")))
+        elif record['delivery_status'] not in DELIVERY_STATUSES:
+            rejects.append((row_number, row, ValueError(f"invalid DeliveryStatus {record['delivery_status']!r}")))
+        else:
+            clean.append((row_number, row, record))
+    return clean, rejects
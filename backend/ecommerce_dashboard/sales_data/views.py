@@ -1,13 +1,30 @@
-import csv
 import logging
+import operator
 from datetime import datetime
-from django.db import transaction
-from django.http import JsonResponse
-from django.db.models import Sum, F, Func ,Q,Count
+from functools import reduce
+from pathlib import Path
+from django.conf import settings
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.db.models import Sum, F, Func ,Q,Count, Window, FloatField, ExpressionWrapper
 from rest_framework.views import APIView
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import Customer, Product, Order, Delivery, Platform
+from .models import Customer, Product, Order, Delivery, Platform, DailyPlatformSales, DailyStateSales
+from .bulk import BulkWriteMixin
+from .budgets import BudgetExceeded, estimated_count, remember, stale, within_budget
+from .archive import archived_facts, archived_monthly_totals, group_totals, merge_totals
+from .caching import data_version_token, versioned_cache_timeout
+from .cohorts import retention_matrix
+from .comparison import as_month, compare_values, comparison_range, growth_percentage, month_index, shift_month
+from .conditional import conditional_on_data_version
+from .facets import facet_counts
+from .latency import GROUP_BY, latency_report
+from .money import to_amount
+from .renderers import fast_json_response
+from .search import decode_cursor, search_orders
+from .utils import process_csv_file
 from .serializers import (
     OrderSerializer,
     CustomerSerializer,
@@ -15,8 +32,7 @@ from .serializers import (
     PlatformSerializer,
 )
 from django.core.cache import cache
-from django.db.models.functions import TruncMonth
-from decimal import Decimal
+from django.db.models.functions import TruncMonth, TruncWeek, TruncDay, NullIf
 from math import ceil
 
 # Set up logging
@@ -38,24 +54,135 @@ def parse_date(date_str, date_format='%Y-%m-%d'):
 
 
 # ViewSets
-class OrderViewSet(viewsets.ModelViewSet):
+@method_decorator(conditional_on_data_version, name='dispatch')
+class OrderViewSet(BulkWriteMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    bulk_lookup_field = 'order_id'
+    bulk_order_attname = 'pk'
+    bulk_activity_fields = ('customer', 'date_of_sale')
 
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        Typeahead search over order ID, customer name, customer email and product name.
+        Params: `q` (at least 2 characters), `limit` (default 20, at most 100) and
+        `cursor` (the `next_cursor` of the previous page).
+        """
+        q = request.GET.get('q', '').strip()
+        if len(q) < 2:
+            return Response({"error": "q must be at least 2 characters."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+            cursor = decode_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class CustomerViewSet(viewsets.ModelViewSet):
+        hits, next_cursor = search_orders(q, limit, cursor)
+        results = [
+            {
+                'order_id': order.order_id,
+                'customer_name': order.customer.customer_name,
+                'contact_email': order.customer.contact_email,
+                'product_name': order.product.product_name,
+                'date_of_sale': order.date_of_sale,
+                'total_sale_value': to_amount(order.total_sale_value_cents),
+                'score': round(score, 4),
+            }
+            for score, order in hits
+        ]
+        return Response({'results': results, 'next_cursor': next_cursor})
+
+
+@method_decorator(conditional_on_data_version, name='dispatch')
+class CustomerViewSet(BulkWriteMixin, viewsets.ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
+    bulk_lookup_field = 'customer_id'
 
+    # Cohort months reported when no start_date is given
+    COHORT_MONTHS = 24
 
-class DeliveryViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'], url_path='cohorts')
+    def cohorts(self, request):
+        """
+        Monthly acquisition cohorts and their retention, read from the per-customer
+        activity bitmaps. Optional `start_date`/`end_date` pick the cohort months
+        (default: the last 24 months) and `platform` restricts it to one platform.
+        """
+        try:
+            end_date = parse_date(request.GET['end_date']) if request.GET.get('end_date') else timezone.localdate()
+            if request.GET.get('start_date'):
+                start_date = parse_date(request.GET['start_date'])
+            else:
+                start_date = shift_month(end_date, 1 - self.COHORT_MONTHS)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        start_month, end_month = shift_month(start_date, 0), shift_month(end_date, 0)
+        if start_month > end_month:
+            return Response({"error": "start_date must not be after end_date."}, status=status.HTTP_400_BAD_REQUEST)
+
+        platform = request.GET.get('platform') or None
+        if platform and platform not in dict(Platform._meta.get_field('platform_name').choices):
+            return Response({"error": f"Unknown platform: {platform}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        cache_key = f"customer_cohorts_{start_month}_{end_month}_{platform}_{data_version_token(None, None)}"
+        data = cache.get(cache_key)
+        if data is None:
+            data = retention_matrix(start_month, end_month, platform)
+            cache.set(cache_key, data, timeout=versioned_cache_timeout())
+        return Response({'data': data})
+
+
+@method_decorator(conditional_on_data_version, name='dispatch')
+class DeliveryViewSet(BulkWriteMixin, viewsets.ModelViewSet):
     queryset = Delivery.objects.all()
     serializer_class = DeliverySerializer
+    bulk_lookup_field = 'order'
+    bulk_order_attname = 'order_id'
+    bulk_status_field = 'delivery_status'
+
+    @action(detail=False, methods=['get'], url_path='latency')
+    def latency(self, request):
+        """
+        p50/p90/p99 days from sale to delivery of delivered orders, merged from the daily
+        latency histograms. Optional `start_date`/`end_date` (sale dates), `platform`, `state`
+        (state code) and `group_by` (comma-separated platform, state, month; default all three).
+        """
+        try:
+            start_date = parse_date(request.GET['start_date']) if request.GET.get('start_date') else None
+            end_date = parse_date(request.GET['end_date']) if request.GET.get('end_date') else None
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        state = request.GET.get('state') or None
+        if state and not state.isdigit():
+            return Response({"error": "state must be a numeric state code."}, status=status.HTTP_400_BAD_REQUEST)
+        group_by = tuple(part for part in request.GET.get('group_by', ','.join(GROUP_BY)).split(',') if part)
+        if set(group_by) - set(GROUP_BY):
+            return Response(
+                {"error": f"group_by must be a comma-separated list of: {', '.join(GROUP_BY)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        platform = request.GET.get('platform') or None
 
+        cache_key = (
+            f"delivery_latency_{start_date}_{end_date}_{platform}_{state}_{'-'.join(sorted(group_by))}_"
+            f"{data_version_token(start_date, end_date)}"
+        )
+        data = cache.get(cache_key)
+        if data is None:
+            data = latency_report(start_date, end_date, group_by, platform, state)
+            cache.set(cache_key, data, timeout=versioned_cache_timeout())
+        return Response({'data': data})
 
-class PlatformViewSet(viewsets.ModelViewSet):
+
+@method_decorator(conditional_on_data_version, name='dispatch')
+class PlatformViewSet(BulkWriteMixin, viewsets.ModelViewSet):
     queryset = Platform.objects.all()
     serializer_class = PlatformSerializer
+    bulk_lookup_field = 'order'
+    bulk_order_attname = 'order_id'
+    bulk_activity_fields = ('order', 'platform_name')
 
 
 # API for CSV Upload
@@ -72,74 +199,25 @@ class UploadCSVView(APIView):
                 {"error": "CSV file is required."}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            # Decode and parse the CSV file
-            decoded_file = csv_file.read().decode('utf-8').splitlines()
-            csv_reader = csv.DictReader(decoded_file)
-            logger.info(f"CSV Headers: {', '.join(csv_reader.fieldnames)}")
-
-            with transaction.atomic():
-                for row in csv_reader:
-                    self.process_row(row)
+        # Rows that fail go to a side-car reject file instead of the log
+        rejects_dir = Path(settings.SALES_DATA_REJECTS_DIR)
+        rejects_dir.mkdir(parents=True, exist_ok=True)
+        reject_path = rejects_dir / f"{datetime.now():%Y%m%d%H%M%S}_{Path(csv_file.name).name}.rejects.csv"
 
+        try:
+            summary = process_csv_file(csv_file, reject_path=reject_path)
             return Response(
-                {"message": "Data successfully imported!"}, status=status.HTTP_201_CREATED
+                {"message": "Data successfully imported!", "summary": summary},
+                status=status.HTTP_201_CREATED,
             )
 
         except Exception as e:
             logger.error(f"Error processing CSV file: {e}")
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def process_row(self, row):
-        """Process a single row from the CSV file."""
-        logger.info(f"Processing row: {row}")
-
-        # Create or get Customer
-        customer, _ = Customer.objects.get_or_create(
-            customer_id=row['CustomerID'],
-            defaults={
-                'customer_name': row['CustomerName'],
-                'contact_email': row['ContactEmail'],
-                'phone_number': row['PhoneNumber'],
-            },
-        )
-
-        # Create or get Product
-        product, _ = Product.objects.get_or_create(
-            product_id=row['ProductID'],
-            defaults={
-                'product_name': row['ProductName'],
-                'category': row['Category'],
-                'price': float(row['SellingPrice']),
-            },
-        )
-
-        # Create Order
-        order = Order.objects.create(
-            order_id=row['OrderID'],
-            product=product,
-            customer=customer,
-            quantity_sold=int(row['QuantitySold']),
-            total_sale_value=float(row['SellingPrice']) * int(row['QuantitySold']),
-            date_of_sale=parse_date(row['DateOfSale']),
-        )
-
-        # Create Delivery
-        Delivery.objects.create(
-            order=order,
-            delivery_address=row['DeliveryAddress'],
-            delivery_date=parse_date(row['DeliveryDate']),
-            delivery_status=row['DeliveryStatus'],
-        )
-
-        # Create Platform
-        Platform.objects.create(
-            order=order,
-            platform_name=row['Platform'],
-        )
-
 
 # API for Delivery Filters
+@method_decorator(conditional_on_data_version, name='dispatch')
 class DeliveryListAPIView(APIView):
     """
     API to list deliveries with optional filtering.
@@ -173,91 +251,183 @@ class Dashboard:
     def monthly_sales_volume(self, request):
         """
         API to calculate monthly sales volume within a date range.
+        Optional `compare` (previous_period|previous_year) adds the value of the month the
+        range's length (in calendar months) or a year earlier, the delta and the growth percentage
+        to every month.
         """
         start_date = request.GET.get('start_date')
         end_date = request.GET.get('end_date')
+        compare = request.GET.get('compare')
 
         if not start_date or not end_date:
-            return JsonResponse({'error': 'start_date and end_date are required parameters.'}, status=400)
+            return fast_json_response({'error': 'start_date and end_date are required parameters.'}, status=400)
 
         try:
             start_date = parse_date(start_date)
             end_date = parse_date(end_date)
+            comparison = comparison_range(start_date, end_date, compare, by_month=True) if compare else None
         except ValueError as e:
-            return JsonResponse({'error': str(e)}, status=400)
+            return fast_json_response({'error': str(e)}, status=400)
 
-        # Generate cache key using start_date and end_date
-        cache_key = f"monthly_sales_volume_{start_date}_{end_date}"
+        # Generate cache key using the date range, comparison and the data version of both ranges
+        cache_key = (
+            f"monthly_sales_volume_{start_date}_{end_date}_{compare}_"
+            f"{data_version_token(comparison[0] if comparison else start_date, end_date)}"
+        )
         cached_data = cache.get(cache_key)
 
         if cached_data:
             # Return cached response if available
-            return JsonResponse({'data': cached_data}, status=200)
+            return fast_json_response(cached_data, status=200, request=request)
 
         # Query database and aggregate sales by month
-        sales_data = (
-            Order.objects.filter(date_of_sale__range=[start_date, end_date])
-            .annotate(month_year=MonthYear(F('date_of_sale')))
-            .values('month_year')
-            .annotate(total_quantity=Sum('quantity_sold'))
-            .order_by('month_year')
-        )
-
-        # Format response data
-        response_data = [
-            {'month': entry['month_year'].strftime('%Y-%m'), 'quantity_sold': entry['total_quantity']}
-            for entry in sales_data
-        ]
+        stale_key = f"monthly_sales_volume_{start_date}_{end_date}_{compare}"
+        try:
+            response_data = within_budget(
+                'monthly_sales_volume',
+                lambda: self._monthly_totals(
+                    start_date, end_date, 'quantity_sold', MonthYear(F('date_of_sale')), 'quantity_sold', comparison
+                ),
+                lambda: stale(stale_key),
+            )
+        except BudgetExceeded:
+            return fast_json_response({'error': 'The server is busy, please retry shortly.'}, status=503)
+        if response_data.get('stale'):
+            return fast_json_response(response_data, status=200, request=request)
+        remember(stale_key, response_data)
 
         # Cache the response data
-        cache.set(cache_key, response_data, timeout=60 * 60)  # Cache for 1 hour
+        cache.set(cache_key, response_data, timeout=versioned_cache_timeout())
 
-        return JsonResponse({'data': response_data}, status=200)
+        return fast_json_response(response_data, status=200, request=request)
 
     def monthly_revenue(self, request):
         """
         API to calculate monthly revenue (total sale value) within a date range.
+        Optional `compare` (previous_period|previous_year) adds the value of the month the
+        range's length (in calendar months) or a year earlier, the delta and the growth percentage
+        to every month.
         """
         start_date = request.GET.get('start_date')
         end_date = request.GET.get('end_date')
+        compare = request.GET.get('compare')
 
         if not start_date or not end_date:
-            return JsonResponse({'error': 'start_date and end_date are required parameters.'}, status=400)
+            return fast_json_response({'error': 'start_date and end_date are required parameters.'}, status=400)
 
         try:
             # Parse dates
             start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
             end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
         except ValueError:
-            return JsonResponse({'error': 'Invalid date format. Use YYYY-MM-DD.'}, status=400)
+            return fast_json_response({'error': 'Invalid date format. Use YYYY-MM-DD.'}, status=400)
+
+        try:
+            comparison = comparison_range(start_date, end_date, compare, by_month=True) if compare else None
+        except ValueError as e:
+            return fast_json_response({'error': str(e)}, status=400)
 
         # Generate cache key
-        cache_key = f"monthly_revenue_{start_date}_{end_date}"
+        cache_key = (
+            f"monthly_revenue_{start_date}_{end_date}_{compare}_"
+            f"{data_version_token(comparison[0] if comparison else start_date, end_date)}"
+        )
         cached_data = cache.get(cache_key)
 
         if cached_data:
             # Return cached response if available
-            return JsonResponse({'data': cached_data}, status=200)
+            return fast_json_response(cached_data, status=200, request=request)
 
         # Query database to calculate total sale value grouped by month
-        revenue_data = (
-            Order.objects.filter(date_of_sale__range=[start_date, end_date])
-            .annotate(month=TruncMonth('date_of_sale'))
+        stale_key = f"monthly_revenue_{start_date}_{end_date}_{compare}"
+        try:
+            response_data = within_budget(
+                'monthly_revenue',
+                lambda: self._monthly_totals(
+                    start_date, end_date, 'total_sale_value_cents', TruncMonth('date_of_sale'), 'total_revenue',
+                    comparison, to_value=to_amount,
+                ),
+                lambda: stale(stale_key),
+            )
+        except BudgetExceeded:
+            return fast_json_response({'error': 'The server is busy, please retry shortly.'}, status=503)
+        if response_data.get('stale'):
+            return fast_json_response(response_data, status=200, request=request)
+        remember(stale_key, response_data)
+
+        # Cache the response data
+        cache.set(cache_key, response_data, timeout=versioned_cache_timeout())
+
+        return fast_json_response(response_data, status=200, request=request)
+
+    @staticmethod
+    def _monthly_totals(start_date, end_date, field, month_expression, value_key, comparison=None, to_value=None):
+        """
+        Sum `field` per month of the range. With a comparison range, both ranges are
+        aggregated in the same scan with conditional aggregation and paired month by month.
+        Archived months in either range are added from the archive files.
+        Sums (and deltas) are computed on the raw values and converted with `to_value`
+        only when formatting, so integer cents stay exact.
+        """
+        to_value = to_value or (lambda total: total)
+        current = Q(date_of_sale__range=[start_date, end_date])
+        if comparison is None:
+            rows = (
+                Order.objects.filter(current)
+                .annotate(month=month_expression)
+                .values('month')
+                .annotate(total=Sum(field))
+                .order_by('month')
+            )
+            totals = merge_totals({as_month(row['month']): row['total'] for row in rows},
+                                  archived_monthly_totals(start_date, end_date, field))
+            return {
+                'data': [
+                    {'month': month.strftime('%Y-%m'), value_key: to_value(total)}
+                    for month, total in sorted(totals.items())
+                ]
+            }
+
+        previous = Q(date_of_sale__range=list(comparison))
+        rows = (
+            Order.objects.filter(current | previous)
+            .annotate(month=month_expression)
             .values('month')
-            .annotate(total_revenue=Sum('total_sale_value'))
+            .annotate(total=Sum(field, filter=current), previous_total=Sum(field, filter=previous))
             .order_by('month')
         )
+        rows = list(rows)
+        totals = merge_totals(
+            {as_month(row['month']): row['total'] for row in rows if row['total'] is not None},
+            archived_monthly_totals(start_date, end_date, field),
+        )
+        previous_totals = merge_totals(
+            {as_month(row['month']): row['previous_total'] for row in rows if row['previous_total'] is not None},
+            archived_monthly_totals(comparison[0], comparison[1], field),
+        )
 
-        # Format the response
-        response_data = [
-            {'month': entry['month'].strftime('%Y-%m'), 'total_revenue': entry['total_revenue']}
-            for entry in revenue_data
-        ]
-
-        # Cache the response data
-        cache.set(cache_key, response_data, timeout=60 * 60)  # Cache for 1 hour
+        # Months of the comparison range are `offset` months before the matching current month
+        offset = month_index(start_date) - month_index(comparison[0])
+        data = []
+        for month, total in sorted(totals.items()):
+            previous_month = shift_month(month, -offset)
+            previous_value = previous_totals.get(previous_month) or 0
+            data.append({
+                'month': month.strftime('%Y-%m'),
+                value_key: to_value(total),
+                'previous_month': previous_month.strftime('%Y-%m'),
+                f'previous_{value_key}': to_value(previous_value),
+                'delta': to_value(total - previous_value),
+                'growth_percentage': growth_percentage(total, previous_value),
+            })
 
-        return JsonResponse({'data': response_data}, status=200)
+        return {
+            'data': data,
+            'comparison': {
+                'start_date': comparison[0].isoformat(),
+                'end_date': comparison[1].isoformat(),
+            },
+        }
 
     def summary_metrics(self, request):
         """
@@ -270,61 +440,256 @@ class Dashboard:
         - Top Selling Product
         - Delivery Success Rate
         - Total Unique Customers
+
+        Optional `compare` (previous_period|previous_year, needs both dates) returns the
+        comparison range's metrics with deltas and growth percentages.
         """
         # Filter parameters (optional)
         start_date = request.GET.get('start_date')
         end_date = request.GET.get('end_date')
+        compare = request.GET.get('compare')
 
-        filters = {}
+        try:
+            start_date = parse_date(start_date) if start_date else None
+            end_date = parse_date(end_date) if end_date else None
+            if compare and not (start_date and end_date):
+                raise ValueError('compare requires start_date and end_date.')
+            comparison = comparison_range(start_date, end_date, compare) if compare else None
+        except ValueError as e:
+            return fast_json_response({'error': str(e)}, status=400)
+
+        periods = {'current': (start_date, end_date)}
+        if comparison:
+            periods['previous'] = comparison
+        cache_key = f"summary_metrics_{start_date}_{end_date}_{compare}"
+        versioned_key = (
+            f"{cache_key}_{data_version_token(comparison[0] if comparison else start_date, end_date)}"
+        )
+        cached_data = cache.get(versioned_key)
+        if cached_data:
+            return fast_json_response(cached_data, status=200, request=request)
+
+        def compute():
+            metrics = self._summary_aggregates(periods)
+            top_selling_product, top_selling_quantity = self._top_selling_product(start_date, end_date)
+
+            metrics['current'].update({
+                'top_selling_product': top_selling_product,
+                'top_selling_quantity': top_selling_quantity,
+            })
+            response = self._summary_response(metrics, comparison)
+            remember(cache_key, response)
+            return response
+
+        # Over budget: rollup-based approximation, then the last good answer
+        try:
+            response = within_budget(
+                'summary_metrics',
+                compute,
+                lambda: self._summary_response(self._summary_from_rollups(periods), comparison, approximate=True),
+                lambda: stale(cache_key),
+            )
+        except BudgetExceeded:
+            return fast_json_response({'error': 'The server is busy, please retry shortly.'}, status=503)
+
+        # Only exact answers are cached
+        if not response.get('approximate') and not response.get('stale'):
+            cache.set(versioned_key, response, timeout=versioned_cache_timeout())
+
+        return fast_json_response(response, status=200, request=request)
+
+    @staticmethod
+    def _summary_response(metrics, comparison, approximate=False):
+        # Format response data
+        response = {'data': metrics['current']}
+        if comparison:
+            response['comparison'] = {
+                'start_date': comparison[0].isoformat(),
+                'end_date': comparison[1].isoformat(),
+                'data': metrics['previous'],
+                **compare_values(
+                    {k: v for k, v in metrics['current'].items() if isinstance(v, (int, float))},
+                    {k: v for k, v in metrics['previous'].items() if isinstance(v, (int, float))},
+                ),
+            }
+        if approximate:
+            response['approximate'] = True
+        return response
+
+    @classmethod
+    def _summary_from_rollups(cls, periods):
+        """
+        Cheap approximation of the summary metrics from the daily platform rollup.
+        Metrics the rollup cannot answer are None.
+        """
+        aggregates = {}
+        for name, (start_date, end_date) in periods.items():
+            in_period = cls._date_q('date', start_date, end_date)
+            aggregates.update({
+                f'{name}_revenue': Sum('total_sales_cents', filter=in_period),
+                f'{name}_orders': Sum('order_count', filter=in_period),
+                f'{name}_products': Sum('quantity_sold', filter=in_period),
+            })
+        totals = DailyPlatformSales.objects.aggregate(**aggregates)
+
+        metrics = {}
+        for name in periods:
+            total_revenue = totals[f'{name}_revenue'] or 0
+            total_orders = totals[f'{name}_orders'] or 0
+            metrics[name] = {
+                'total_revenue': to_amount(total_revenue),
+                'total_orders': total_orders,
+                'total_products_sold': totals[f'{name}_products'] or 0,
+                'canceled_order_percentage': None,
+                'average_order_value': to_amount(round(total_revenue / total_orders)) if total_orders > 0 else 0,
+                'delivery_success_rate': None,
+                'total_unique_customers': None,
+            }
+        metrics['current'].update({'top_selling_product': None, 'top_selling_quantity': None})
+        return metrics
+
+    @staticmethod
+    def _date_q(field, start_date, end_date):
+        q = Q()
         if start_date:
-            filters['date_of_sale__gte'] = start_date
+            q &= Q(**{f'{field}__gte': start_date})
         if end_date:
-            filters['date_of_sale__lte'] = end_date
-
-        # Query the database
-        orders = Order.objects.filter(**filters)
-
-        # Metrics calculations
-        total_revenue = orders.aggregate(total=Sum('total_sale_value'))['total'] or Decimal(0)
-        total_orders = orders.count()
-        total_products_sold = orders.aggregate(total=Sum('quantity_sold'))['total'] or 0
-        average_order_value = (total_revenue / total_orders) if total_orders > 0 else 0
-
-        canceled_orders = Delivery.objects.filter(
-            Q(order__in=orders) & (Q(delivery_status='Cancelled') | Q(delivery_status__isnull=True))
-        ).count()
-        total_deliveries = Delivery.objects.filter(order__in=orders).count()
-        canceled_order_percentage = (
-            (canceled_orders / total_deliveries) * 100 if total_deliveries > 0 else 0
-        )
+            q &= Q(**{f'{field}__lte': end_date})
+        return q
 
-        top_selling_product = orders.values('product__product_name').annotate(
-            total_quantity=Sum('quantity_sold')
-        ).order_by('-total_quantity').first()
+    @classmethod
+    def _summary_aggregates(cls, periods):
+        """
+        Summary metrics for every {name: (start_date, end_date)} period, using one
+        conditional-aggregation query over orders and one over deliveries.
+        """
+        order_aggregates, delivery_aggregates = {}, {}
+        for name, (start_date, end_date) in periods.items():
+            in_period = cls._date_q('date_of_sale', start_date, end_date)
+            order_aggregates.update({
+                f'{name}_revenue': Sum('total_sale_value_cents', filter=in_period),
+                f'{name}_orders': Count('id', filter=in_period),
+                f'{name}_products': Sum('quantity_sold', filter=in_period),
+                f'{name}_customers': Count('customer', distinct=True, filter=in_period),
+            })
+            in_period = cls._date_q('order__date_of_sale', start_date, end_date)
+            delivery_aggregates.update({
+                f'{name}_deliveries': Count('id', filter=in_period),
+                f'{name}_canceled': Count(
+                    'id', filter=in_period & (Q(delivery_status='Cancelled') | Q(delivery_status__isnull=True))
+                ),
+                f'{name}_delivered': Count('id', filter=in_period & Q(delivery_status='Delivered')),
+            })
 
-        successful_deliveries = Delivery.objects.filter(
-            order__in=orders, delivery_status='Delivered'
-        ).count()
-        delivery_success_rate = (
-            (successful_deliveries / total_deliveries) * 100 if total_deliveries > 0 else 0
+        any_period = reduce(operator.or_, (cls._date_q('date_of_sale', *dates) for dates in periods.values()))
+        order_totals = Order.objects.filter(any_period).aggregate(**order_aggregates)
+        any_period = reduce(operator.or_, (cls._date_q('order__date_of_sale', *dates) for dates in periods.values()))
+        delivery_totals = Delivery.objects.filter(any_period).aggregate(**delivery_aggregates)
+
+        metrics = {}
+        for name, (start_date, end_date) in periods.items():
+            totals = {
+                'revenue': order_totals[f'{name}_revenue'] or 0,
+                'orders': order_totals[f'{name}_orders'],
+                'products': order_totals[f'{name}_products'] or 0,
+                'customers': order_totals[f'{name}_customers'],
+                'deliveries': delivery_totals[f'{name}_deliveries'],
+                'canceled': delivery_totals[f'{name}_canceled'],
+                'delivered': delivery_totals[f'{name}_delivered'],
+            }
+            cls._add_archived_totals(totals, start_date, end_date)
+
+            total_revenue, total_orders, total_deliveries = totals['revenue'], totals['orders'], totals['deliveries']
+            metrics[name] = {
+                'total_revenue': to_amount(total_revenue),
+                'total_orders': total_orders,
+                'total_products_sold': totals['products'],
+                'canceled_order_percentage': round(
+                    (totals['canceled'] / total_deliveries) * 100 if total_deliveries > 0 else 0, 2
+                ),
+                'average_order_value': to_amount(round(total_revenue / total_orders)) if total_orders > 0 else 0,
+                'delivery_success_rate': round(
+                    (totals['delivered'] / total_deliveries) * 100 if total_deliveries > 0 else 0, 2
+                ),
+                'total_unique_customers': totals['customers'],
+            }
+        return metrics
+
+    @classmethod
+    def _add_archived_totals(cls, totals, start_date, end_date):
+        """Adds the archived orders of the period to its summary totals."""
+        facts = archived_facts(start_date, end_date, columns=(
+            'customer_id', 'quantity_sold', 'total_sale_value_cents',
+            'delivery_count', 'delivered_count', 'cancelled_count',
+        ))
+        if facts is None:
+            return
+        totals['revenue'] += int(facts['total_sale_value_cents'].sum())
+        totals['orders'] += len(facts['customer_id'])
+        totals['products'] += int(facts['quantity_sold'].sum())
+        totals['deliveries'] += int(facts['delivery_count'].sum())
+        totals['canceled'] += int(facts['cancelled_count'].sum())
+        totals['delivered'] += int(facts['delivered_count'].sum())
+
+        # Customers with both hot and archived orders are counted once
+        hot_customers = (
+            Order.objects.filter(cls._date_q('date_of_sale', start_date, end_date))
+            .values_list('customer_id', flat=True)
+            .distinct()
         )
+        totals['customers'] = len(set(hot_customers) | set(facts['customer_id'].tolist()))
+
+    @classmethod
+    def _top_selling_product(cls, start_date, end_date):
+        """(product name, quantity) sold most in the period, archived orders included."""
+        hot = Order.objects.filter(cls._date_q('date_of_sale', start_date, end_date)).values(
+            'product__product_name'
+        ).annotate(
+            total_quantity=Sum('quantity_sold')
+        ).order_by('-total_quantity')
 
-        total_unique_customers = orders.values('customer_id').distinct().count()
+        facts = archived_facts(start_date, end_date, columns=('product_id', 'quantity_sold'))
+        if facts is None:
+            top = hot.first()
+            return (top['product__product_name'], top['total_quantity']) if top else (None, 0)
 
-        # Format response data
-        response_data = {
-            'total_revenue': float(total_revenue),
-            'total_orders': total_orders,
-            'total_products_sold': total_products_sold,
-            'canceled_order_percentage': round(canceled_order_percentage, 2),
-            'average_order_value': round(float(average_order_value), 2),
-            'top_selling_product': top_selling_product['product__product_name'] if top_selling_product else None,
-            'top_selling_quantity': top_selling_product['total_quantity'] if top_selling_product else 0,
-            'delivery_success_rate': round(delivery_success_rate, 2),
-            'total_unique_customers': total_unique_customers,
-        }
+        quantities = {row['product__product_name']: row['total_quantity'] for row in hot}
+        archived = group_totals([facts['product_id']], [facts['quantity_sold']])
+        names = dict(Product.objects.filter(pk__in=[pk for pk, in archived]).values_list('pk', 'product_name'))
+        merge_totals(quantities, {names[pk]: total for (pk,), (_, total) in archived.items() if pk in names})
+        if not quantities:
+            return None, 0
+        return max(quantities.items(), key=lambda item: item[1])
+
+    @staticmethod
+    def table_filters(params):
+        """Build the Order filters shared by the data table and its facet counts."""
+        filters = {}
+        if params.get('start_date'):
+            filters['date_of_sale__gte'] = params['start_date']
+        if params.get('end_date'):
+            filters['date_of_sale__lte'] = params['end_date']
+        if params.get('category'):
+            filters['product__category__iexact'] = params['category']
+        if params.get('delivery_status'):
+            filters['deliveries__delivery_status'] = params['delivery_status']
+        if params.get('platform'):
+            filters['platforms__platform_name__iexact'] = params['platform']
+        if params.get('state'):
+            filters['deliveries__state__iexact'] = params['state']
+        return filters
 
-        return JsonResponse({'data': response_data}, status=200)
+    @staticmethod
+    def table_cache_key(prefix, filters, params, *extra_parts, versioned=True):
+        """
+        Cache key for a table-filter combination, versioned by the data in its date range.
+        Unversioned keys name the last good copy, which has to outlive data changes.
+        """
+        cache_key_parts = [f"{k}_{v}" for k, v in filters.items()]
+        cache_key_parts.extend(extra_parts)
+        if versioned:
+            cache_key_parts.append(f"v_{data_version_token(params.get('start_date'), params.get('end_date'))}")
+        return f"{prefix}_{'_'.join(cache_key_parts)}"
 
     def filterable_data_table(self, request):
         """
@@ -338,147 +703,256 @@ class Dashboard:
         """
 
         # Extract query parameters
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
-        category = request.GET.get('category')
-        delivery_status = request.GET.get('delivery_status')
-        platform = request.GET.get('platform')
-        state = request.GET.get('state')
         page = int(request.GET.get('page', 1))
         limit = int(request.GET.get('limit', 10))
 
         logger.info(f"Request received with limit: {limit}, page: {page}")
 
-        # Initialize filters
-        filters = {}
-        if start_date:
-            filters['date_of_sale__gte'] = start_date
-        if end_date:
-            filters['date_of_sale__lte'] = end_date
-        if category:
-            filters['product__category__iexact'] = category
-        if delivery_status:
-            filters['deliveries__delivery_status'] = delivery_status
-        if platform:
-            filters['platforms__platform_name__iexact'] = platform
-        if state:
-            filters['deliveries__state__iexact'] = state
-
-        # Generate cache key
-        cache_key_parts = [f"{k}_{v}" for k, v in filters.items()]
-        cache_key_parts.append(f"page_{page}")
-        cache_key_parts.append(f"limit_{limit}")
-        cache_key = f"tabular_data_{'_'.join(cache_key_parts)}" if cache_key_parts else "tabular_data_no_filters"
+        filters = self.table_filters(request.GET)
+        cache_key = self.table_cache_key('tabular_data', filters, request.GET, f"page_{page}", f"limit_{limit}")
+        stale_key = self.table_cache_key(
+            'tabular_data', filters, request.GET, f"page_{page}", f"limit_{limit}", versioned=False
+        )
 
         # Attempt to retrieve cached data
         cached_data = cache.get(cache_key)
         if cached_data:
             logger.info("Returning cached data.")
-            return JsonResponse(cached_data, status=200)
+            return fast_json_response(cached_data, status=200, request=request)
 
         # Query optimization: Use only relevant fields and prefetch related objects
         queryset = (
             Order.objects.filter(**filters)
             .select_related('customer', 'product')
             .prefetch_related('deliveries', 'platforms')
-            .only('order_id', 'customer__customer_name', 'product__category', 'quantity_sold', 
-                'total_sale_value', 'date_of_sale')
+            .only('order_id', 'customer__customer_name', 'product__product_name', 'product__category',
+                'quantity_sold', 'total_sale_value_cents', 'date_of_sale')
         )
-
-        # Total count for pagination
-        total_count = queryset.count()
         start_index = (page - 1) * limit
         end_index = start_index + limit
 
-        # Paginate the queryset
-        paginated_orders = queryset[start_index:end_index]
-        
-        logger.info(paginated_orders)
-
-        # Prepare response data
-        data = []
-        for order in paginated_orders:
-            delivery_status = (
-                order.deliveries.first().delivery_status if order.deliveries.exists() else 'N/A'
+        # Paginate the queryset; over budget, serve the last good copy of this page
+        try:
+            data = within_budget(
+                'filterable_data_table',
+                lambda: [self._table_row(order) for order in queryset[start_index:end_index]],
+                lambda: stale(stale_key),
             )
-            platform_name = (
-                order.platforms.first().platform_name if order.platforms.exists() else 'N/A'
+        except BudgetExceeded:
+            return fast_json_response({'error': 'The server is busy, please retry shortly.'}, status=503)
+        if isinstance(data, dict):
+            return fast_json_response(data, status=200, request=request)
+
+        # Total count for pagination; over budget, fall back to the planner's estimate
+        try:
+            total_count, approximate = within_budget(
+                'table_count',
+                lambda: (queryset.count(), False),
+                lambda: self._estimated_table_count(queryset),
             )
-            row = {
-                'order_id': order.order_id,
-                'customer': order.customer.customer_name,
-                'product': order.product.product_name,
-                'category': order.product.category,
-                'quantity_sold': order.quantity_sold,
-                'total_sale_value': float(order.total_sale_value),
-                'date_of_sale': order.date_of_sale.strftime('%Y-%m-%d'),
-                'delivery_status': delivery_status,
-                'platform': platform_name,
-                'state': order.deliveries.first().state if order.deliveries.exists() else 'N/A',
-            }
-            logger.info(row)
-            data.append(row)
+        except BudgetExceeded:
+            total_count, approximate = None, True
 
         # Pagination info
         pagination_info = {
             'current_page': page,
-            'total_pages': ceil(total_count / limit),
+            'total_pages': ceil(total_count / limit) if total_count is not None else None,
             'total_items': total_count,
         }
+        response_data = {'data': data, 'pagination': pagination_info}
+        if approximate:
+            pagination_info['approximate'] = True
+            response_data['approximate'] = True
+        else:
+            cache.set(cache_key, response_data, timeout=versioned_cache_timeout())
+            remember(stale_key, response_data)
+
+        # Return the response
+        return fast_json_response(response_data, status=200, request=request)
+
+    @staticmethod
+    def _table_row(order):
+        deliveries = list(order.deliveries.all())
+        platforms = list(order.platforms.all())
+        return {
+            'order_id': order.order_id,
+            'customer': order.customer.customer_name,
+            'product': order.product.product_name,
+            'category': order.product.category,
+            'quantity_sold': order.quantity_sold,
+            'total_sale_value': to_amount(order.total_sale_value_cents),
+            'date_of_sale': order.date_of_sale.strftime('%Y-%m-%d'),
+            'delivery_status': deliveries[0].delivery_status if deliveries else 'N/A',
+            'platform': platforms[0].platform_name if platforms else 'N/A',
+            'state': deliveries[0].state if deliveries else 'N/A',
+        }
+
+    @staticmethod
+    def _estimated_table_count(queryset):
+        estimate = estimated_count(queryset)
+        return (estimate, True) if estimate is not None else None
 
-        # Cache the data for 5 minutes
-        cache.set(
-            cache_key, 
-            {'data': data, 'pagination': pagination_info}, 
-            timeout=300
+    def table_facets(self, request):
+        """
+        API to count orders per option of every table filter (category, delivery
+        status, platform, state) under the other current filters, in a single query.
+        """
+        filters = self.table_filters(request.GET)
+        cache_key = self.table_cache_key('table_facets', filters, request.GET)
+
+        cached_data = cache.get(cache_key)
+        if cached_data is not None:
+            return fast_json_response({'data': cached_data}, status=200, request=request)
+
+        response_data = facet_counts(filters)
+
+        cache.set(cache_key, response_data, timeout=versioned_cache_timeout())
+
+        return fast_json_response({'data': response_data}, status=200, request=request)
+
+    def sales_by_state(self, request):
+        """
+        API for the regional breakdown: revenue, orders, delivery success rate and
+        cancellations per delivery state, served from the daily state rollup.
+        Optional `start_date`/`end_date` restrict the sale dates.
+        """
+        try:
+            start_date = parse_date(request.GET['start_date']) if request.GET.get('start_date') else None
+            end_date = parse_date(request.GET['end_date']) if request.GET.get('end_date') else None
+        except ValueError as e:
+            return fast_json_response({'error': str(e)}, status=400)
+
+        cache_key = f"sales_by_state_{start_date}_{end_date}_{data_version_token(start_date, end_date)}"
+        cached_data = cache.get(cache_key)
+        if cached_data is not None:
+            return fast_json_response({'data': cached_data}, status=200, request=request)
+
+        rows = (
+            DailyStateSales.objects.filter(self._date_q('date', start_date, end_date))
+            .values('state_id', 'state__name')
+            .annotate(
+                total_sales_cents=Sum('total_sales_cents'),
+                order_count=Sum('order_count'),
+                delivery_count=Sum('delivery_count'),
+                delivered_count=Sum('delivered_count'),
+                cancelled_count=Sum('cancelled_count'),
+            )
+            .order_by('-total_sales_cents', 'state_id')
         )
+        response_data = [
+            {
+                'state_code': row['state_id'],
+                'state': row['state__name'],
+                'total_revenue': to_amount(row['total_sales_cents']),
+                'total_orders': row['order_count'],
+                'delivery_success_rate': round(row['delivered_count'] / row['delivery_count'] * 100, 2)
+                if row['delivery_count'] else 0,
+                'cancellations': row['cancelled_count'],
+                'canceled_order_percentage': round(row['cancelled_count'] / row['delivery_count'] * 100, 2)
+                if row['delivery_count'] else 0,
+            }
+            for row in rows
+        ]
 
-        # Return the response
-        return JsonResponse({'data': data, 'pagination': pagination_info}, status=200)
+        cache.set(cache_key, response_data, timeout=versioned_cache_timeout())
+
+        return fast_json_response({'data': response_data}, status=200, request=request)
 
 
+@method_decorator(conditional_on_data_version, name='dispatch')
 class OrdersAndSalesByPlatformAPIView(APIView):
+    """
+    API to calculate each platform's share of sales per period.
+    Reads the daily platform rollup and normalises shares in the database
+    with window functions, so cost does not grow with order history.
+
+    Optional query params: start_date, end_date, platform, granularity (month|week|day).
+    """
+
+    GRANULARITIES = {
+        'month': TruncMonth,
+        'week': TruncWeek,
+        'day': TruncDay,
+    }
+
     def get(self, request):
-        # Annotate orders delivered and total sales grouped by platform and delivery date
+        granularity = request.GET.get('granularity', 'month')
+        if granularity not in self.GRANULARITIES:
+            return Response(
+                {"error": f"granularity must be one of: {', '.join(self.GRANULARITIES)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            start_date = parse_date(request.GET['start_date']) if request.GET.get('start_date') else None
+            end_date = parse_date(request.GET['end_date']) if request.GET.get('end_date') else None
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        platform = request.GET.get('platform')
+
+        # Generate cache key
+        cache_key = (
+            f"orders_sales_by_platform_{granularity}_{start_date}_{end_date}_{platform}_"
+            f"{data_version_token(start_date, end_date)}"
+        )
+        cached_data = cache.get(cache_key)
+        if cached_data is not None:
+            return Response({"data": cached_data})
+
+        rollup = DailyPlatformSales.objects.all()
+        if start_date:
+            rollup = rollup.filter(date__gte=start_date)
+        if end_date:
+            rollup = rollup.filter(date__lte=end_date)
+
+        # Platform and period totals via SUM(...) OVER (PARTITION BY ...); the platform
+        # filter is applied afterwards so shares stay relative to all platforms
+        platform_partition = [F('period'), F('platform_name')]
         data = (
-            Platform.objects
-            .filter(order__deliveries__delivery_date__isnull=False)  # Filter orders only with valid deliveries
-            .values('platform_name', 'order__deliveries__delivery_date__month')
+            rollup
+            .annotate(period=self.GRANULARITIES[granularity]('date'))
             .annotate(
-                order_count=Count('order'),
-                total_sales=Sum('order__total_sale_value')
+                order_count_total=Window(Sum('order_count'), partition_by=platform_partition),
+                platform_sales=Window(Sum('total_sales_cents'), partition_by=platform_partition),
+                period_sales=Window(Sum('total_sales_cents'), partition_by=[F('period')]),
+            )
+            .annotate(
+                normalized_sales_percentage=ExpressionWrapper(
+                    F('platform_sales') * 100.0 / NullIf(F('period_sales'), 0),
+                    output_field=FloatField(),
+                )
+            )
+            .values(
+                'period', 'platform_name', 'order_count_total',
+                'platform_sales', 'normalized_sales_percentage',
             )
-            .order_by('order__deliveries__delivery_date__month')
+            .distinct()
+            .order_by('period', 'platform_name')
         )
-        
-        # Aggregate total sales per month across all platforms
-        monthly_totals = {}
-        for entry in data:
-            month = entry['order__deliveries__delivery_date__month']
-            if month not in monthly_totals:
-                monthly_totals[month] = 0
-            monthly_totals[month] += float(entry['total_sales'])
-        
-        # Calculate percentage for normalization
+
+        period_format = '%Y-%m' if granularity == 'month' else '%Y-%m-%d'
         formatted_data = []
         for entry in data:
-            normalized_sales = (
-                (float(entry['total_sales']) / monthly_totals[entry['order__deliveries__delivery_date__month']]) * 100
-                if monthly_totals[entry['order__deliveries__delivery_date__month']] else 0
-            )
+            if platform and entry['platform_name'].lower() != platform.lower():
+                continue
+            period = entry['period'].strftime(period_format)
             formatted_data.append({
                 "platform": entry['platform_name'],
-                "month": entry['order__deliveries__delivery_date__month'],
-                "order_count": entry['order_count'],
-                "total_sales": float(entry['total_sales']),
-                "normalized_sales_percentage": normalized_sales
+                "period": period,
+                "month": period,
+                "order_count": entry['order_count_total'],
+                "total_sales": to_amount(entry['platform_sales']),
+                "normalized_sales_percentage": entry['normalized_sales_percentage'] or 0,
             })
 
-        return Response({"data": formatted_data})
+        # Cache the response data
+        cache.set(cache_key, formatted_data, timeout=versioned_cache_timeout())
 
+        return Response({"data": formatted_data})
 
 
     
+@method_decorator(conditional_on_data_version, name='dispatch')
 class TopSellingProductsAPIView(APIView):
     def get(self, request):
         data = (
@@ -0,0 +1,119 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from urllib.parse import urlencode, urlsplit
+from django.conf import settings
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+from django.utils import timezone
+from .comparison import shift_month
+from .models import Platform
+from .routers import use_primary
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Date-range endpoints warmed for every popular range
+RANGE_ENDPOINTS = ('monthly_sales_volume', 'monthly_revenue', 'summary_metrics', 'sales_by_state')
+
+# Data table view the UI opens with (FilterableTable: 2023-06-01 to the end of the current month, 10 rows)
+DEFAULT_TABLE_VIEWS = ({'start_date': '2023-06-01', 'end_date': 'month_end', 'limit': 10},)
+
+
+def popular_ranges(today=None):
+    """
+    (start, end) ranges from SALES_DATA_WARMUP_RANGES: a number of days ending today,
+    or 'ytd' for the current year.
+    """
+    today = today or timezone.localdate()
+    ranges = []
+    for spec in getattr(settings, 'SALES_DATA_WARMUP_RANGES', (7, 30, 90, 365, 'ytd')):
+        if spec == 'ytd':
+            ranges.append((date(today.year, 1, 1), today))
+        else:
+            ranges.append((today - timedelta(days=int(spec) - 1), today))
+    return ranges
+
+
+def _resolve_date(spec, today):
+    if spec == 'today':
+        return today
+    if spec == 'month_start':
+        return today.replace(day=1)
+    if spec == 'month_end':
+        return shift_month(today, 1) - timedelta(days=1)
+    return date.fromisoformat(spec)
+
+
+def table_views(today=None):
+    """
+    Query params of the data table views from SALES_DATA_WARMUP_TABLE_VIEWS. Dates are
+    'YYYY-MM-DD', 'today', 'month_start' or 'month_end' (of the current month); a view
+    without dates is the unfiltered table.
+    """
+    today = today or timezone.localdate()
+    views = []
+    for view in getattr(settings, 'SALES_DATA_WARMUP_TABLE_VIEWS', DEFAULT_TABLE_VIEWS):
+        params = {key: _resolve_date(view[key], today).isoformat() for key in ('start_date', 'end_date') if view.get(key)}
+        params.update({'page': 1, 'limit': view.get('limit', 10)})
+        views.append(params)
+    return views
+
+
+def popular_requests(today=None):
+    """URLs of the dashboard requests most users start with."""
+    urls = []
+    for start, end in popular_ranges(today):
+        query = urlencode({'start_date': start.isoformat(), 'end_date': end.isoformat()})
+        urls.extend(f"{reverse(name)}?{query}" for name in RANGE_ENDPOINTS)
+
+    # First page of each configured data table view, for all platforms and for each platform
+    table = reverse('filterable_data_table')
+    platforms = [None] + [platform for platform, _ in Platform._meta.get_field('platform_name').choices]
+    for params in table_views(today):
+        for platform in platforms:
+            query = {**params, 'platform': platform} if platform else params
+            urls.append(f"{table}?{urlencode(query)}")
+    return urls
+
+
+def _warm(url):
+    path = urlsplit(url).path
+    try:
+        # Right after an import the replica may lag; warm from the primary
+        with use_primary():
+            response = resolve(path).func(RequestFactory().get(url))
+        return response.status_code
+    except Exception:
+        logger.exception("Warming %s failed", url)
+        return None
+    finally:
+        # Worker threads open their own connections; do not leave them behind
+        connections.close_all()
+
+
+def warm_dashboard_cache(urls=None, workers=None):
+    """
+    Runs each popular dashboard request once so its cache entry is stored before
+    users ask for it. At most SALES_DATA_WARMUP_WORKERS requests run at a time.
+
+    Returns:
+        dict: Number of requests warmed and failed, and the elapsed time.
+    """
+    urls = popular_requests() if urls is None else list(urls)
+    workers = workers or getattr(settings, 'SALES_DATA_WARMUP_WORKERS', 2)
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cache-warmup') as pool:
+        statuses = list(pool.map(_warm, urls))
+
+    summary = {
+        'requests': len(urls),
+        'warmed': sum(1 for status in statuses if status == 200),
+        'failed': sum(1 for status in statuses if status != 200),
+        'elapsed_seconds': round(time.monotonic() - started, 3),
+    }
+    logger.info("Warmed dashboard cache: %s", summary)
+    return summary
@@ -6,14 +6,22 @@ import { useSearchParams } from "react-router";
 import { getTabularData } from "../api/dashboard";
 import Papa from "papaparse";
 
+// Format a date as YYYY-MM-DD in local time; toISOString() would shift it to UTC
+const formatLocalDate = (date: Date) =>
+  [
+    date.getFullYear(),
+    String(date.getMonth() + 1).padStart(2, "0"),
+    String(date.getDate()).padStart(2, "0"),
+  ].join("-");
+
 // Helper function to get the start and end dates of the current month
 const getCurrentMonthDates = () => {
   const now = new Date();
   const start = new Date(2023, 5, 1);
   const end = new Date(now.getFullYear(), now.getMonth() + 1, 0);
   return {
-    start: start.toISOString().split("T")[0],
-    end: end.toISOString().split("T")[0],
+    start: formatLocalDate(start),
+    end: formatLocalDate(end),
   };
 };
 